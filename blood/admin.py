@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Donor, DonationUnit
+from .models import Donor, DonationUnit, Site, TransferRoute
 
 admin.site.register(Donor)
 admin.site.register(DonationUnit)
+admin.site.register(Site)
+admin.site.register(TransferRoute)
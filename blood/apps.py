@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class BloodConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'blood'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from .db import apply_sqlite_pragmas
+        from .metrics import install_query_timer
+
+        connection_created.connect(apply_sqlite_pragmas, dispatch_uid="blood.apply_sqlite_pragmas")
+        connection_created.connect(install_query_timer, dispatch_uid="blood.install_query_timer")
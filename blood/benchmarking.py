@@ -0,0 +1,114 @@
+# blood/benchmarking.py
+"""
+Shared helpers for the benchmark / load-test management commands:
+latency summaries, JSON result files and the fixed benchmark accounts.
+"""
+import json
+import math
+import platform
+from datetime import date
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .compat import DONORS_BY_RECIPIENT
+from .models import Donor, Profile
+
+BENCH_PASSWORD = "bench-pass-123"
+BENCH_DONOR = "bench_donor"
+BENCH_REQUESTER = "bench_requester"
+BENCH_DONOR_NID = "000000002"
+
+INVENTORY_SHAPES = ("empty", "sparse", "mixed", "saturated")
+
+
+def random_inventory(rng, shape):
+    """
+    Inventory counts {type: n} of a given shape, for planner benchmarks/tests.
+    sparse: most types at 0; mixed: anything 0..50; saturated: every type well stocked.
+    """
+    types = list(DONORS_BY_RECIPIENT)
+    if shape == "empty":
+        return {}
+    if shape == "sparse":
+        return {bt: rng.randint(1, 5) for bt in rng.sample(types, rng.randint(1, 3))}
+    if shape == "mixed":
+        return {bt: rng.randint(0, 50) for bt in types}
+    if shape == "saturated":
+        return {bt: rng.randint(1000, 5000) for bt in types}
+    raise ValueError(f"unknown inventory shape {shape!r}")
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list (p in 0..100)."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies_ms, queries=None, errors=0):
+    """
+    :param latencies_ms: list of request latencies in milliseconds
+    :param queries: optional list of SQL query counts (one per request)
+    :return: dict with count, errors, mean/p50/p95/p99/max latency and query stats
+    """
+    lat = sorted(latencies_ms)
+    out = {
+        "count": len(lat),
+        "errors": errors,
+        "mean_ms": round(sum(lat) / len(lat), 3) if lat else None,
+        "p50_ms": percentile(lat, 50),
+        "p95_ms": percentile(lat, 95),
+        "p99_ms": percentile(lat, 99),
+        "max_ms": lat[-1] if lat else None,
+    }
+    if queries:
+        out["queries_mean"] = round(sum(queries) / len(queries), 2)
+        out["queries_max"] = max(queries)
+    return out
+
+
+def write_results(path, results: dict):
+    """Save a benchmark run as JSON, with enough metadata to compare runs later."""
+    payload = {
+        "created_at": timezone.now().isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        **results,
+    }
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(payload, indent=2, default=str), encoding="utf-8")
+    return path
+
+
+def ensure_bench_users():
+    """
+    Create (or reuse) one donor and one requester account for benchmarks.
+    :return: (donor_user, requester_user)
+    """
+    donor_user, created = User.objects.get_or_create(username=BENCH_DONOR)
+    if created:
+        donor_user.set_password(BENCH_PASSWORD)
+        donor_user.save()
+        Profile.objects.create(
+            user=donor_user, role=Profile.Role.DONOR, full_name="Bench Donor",
+            national_id=BENCH_DONOR_NID, default_blood_type="O+", date_of_birth=date(1990, 1, 1),
+        )
+        Donor.objects.get_or_create(national_id=BENCH_DONOR_NID, defaults={"full_name": "Bench Donor"})
+
+    requester_user, created = User.objects.get_or_create(username=BENCH_REQUESTER)
+    if created:
+        requester_user.set_password(BENCH_PASSWORD)
+        requester_user.save()
+        Profile.objects.create(user=requester_user, role=Profile.Role.REQUESTER)
+    return donor_user, requester_user
+
+
+def grant_portal(client):
+    """Give a django.test.Client the one-page portal pass (same flag portal_login sets)."""
+    session = client.session
+    session["portal_once_ok"] = True
+    session.save()
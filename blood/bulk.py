@@ -0,0 +1,113 @@
+# blood/bulk.py
+from django.db.models import Count
+from django.utils import timezone
+
+from . import din, eligibility
+from .models import DispenseLine, Donor, DonationUnit
+
+DEFAULT_BATCH_SIZE = 2000
+
+
+def resolve_donors(national_ids) -> dict[str, int]:
+    """
+    Map national IDs to Donor pks with a single IN query.
+    :param national_ids: iterable of national IDs (duplicates allowed)
+    :return: {national_id: pk} for donors that exist
+    """
+    ids = {nid for nid in national_ids if nid}
+    if not ids:
+        return {}
+    return dict(Donor.objects.filter(national_id__in=ids).values_list("national_id", "pk"))
+
+
+def upsert_donors(records, update_fields=("full_name",), batch_size=DEFAULT_BATCH_SIZE) -> dict[str, int]:
+    """
+    Insert-or-update donors in bulk (one INSERT ... ON CONFLICT per batch),
+    then resolve their pks with a single IN query.
+
+    :param records: iterable of dicts with "national_id", "full_name" and
+                    optionally "date_of_birth". Later rows win on duplicate IDs.
+    :param update_fields: columns overwritten when the national_id already exists.
+    :return: {national_id: pk} for every donor in records
+    """
+    by_nid = {}
+    for rec in records:
+        by_nid[rec["national_id"]] = Donor(
+            national_id=rec["national_id"],
+            full_name=rec["full_name"],
+            date_of_birth=rec.get("date_of_birth"),
+        )
+    if not by_nid:
+        return {}
+
+    Donor.objects.bulk_create(
+        by_nid.values(),
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=["national_id"],
+        update_fields=list(update_fields),
+    )
+    return resolve_donors(by_nid.keys())
+
+
+def create_donations(records, batch_size=DEFAULT_BATCH_SIZE) -> list[DonationUnit]:
+    """
+    Bulk version of DonationForm.save: upsert the donors (syncing full_name),
+    insert all units with one bulk INSERT, then move the donors' eligibility
+    columns with one bulk UPDATE. Check eligibility before calling it.
+
+    :param records: list of cleaned dicts with "national_id", "full_name", "blood_type"
+    :return: the created DonationUnit objects, in input order
+    """
+    donor_map = upsert_donors(records, update_fields=("full_name",), batch_size=batch_size)
+    units = [
+        DonationUnit(donor_id=donor_map[rec["national_id"]], blood_type=rec["blood_type"])
+        for rec in records
+    ]
+    din.assign(units)  # one sequence UPDATE for the whole batch
+    units = DonationUnit.objects.bulk_create(units, batch_size=batch_size)
+    eligibility.record_donations(units)
+    return units
+
+
+def dispense_lines(log, hospital_name="", hospital_city="", urgency="") -> list[DispenseLine]:
+    """
+    Unsaved line items of a saved DispenseLog: one per supplied type of its
+    dispensed_map. Write them with DispenseLine.objects.bulk_create().
+    """
+    return [
+        DispenseLine(
+            log=log, requested_type=log.requested_type, supplied_type=supplied_type, quantity=qty,
+            hospital_name=hospital_name, hospital_city=hospital_city, urgency=urgency,
+            created_at=log.created_at,
+        )
+        for supplied_type, qty in log.dispensed_map.items() if qty
+    ]
+
+
+def quarantine_units(donor_id=None, since=None, until=None, unit_ids=None) -> dict[str, int]:
+    """
+    Recall: move AVAILABLE units of a donor and/or donated in [since, until)
+    (or the given unit ids, e.g. scanned) to QUARANTINED with one bulk UPDATE
+    (index unit_donor_status / unit_status_donated).
+    Run it inside the caller's transaction, together with the audit event.
+
+    :return: {blood type: units quarantined}
+    """
+    qs = DonationUnit.objects.all()
+    if unit_ids is not None:
+        qs = qs.filter(id__in=unit_ids)
+    if donor_id is not None:
+        qs = qs.filter(donor_id=donor_id)
+    if since is not None:
+        qs = qs.filter(donation_date__gte=since)
+    if until is not None:
+        qs = qs.filter(donation_date__lt=until)
+    now = timezone.now()
+    if not qs.filter(status=DonationUnit.Status.AVAILABLE).update(
+        status=DonationUnit.Status.QUARANTINED, quarantined_at=now
+    ):
+        return {}
+    # summarize what this UPDATE took (not a count before it, which a concurrent dispense could change)
+    taken = qs.filter(status=DonationUnit.Status.QUARANTINED, quarantined_at=now)
+    return dict(taken.values_list("blood_type").annotate(n=Count("id")).order_by())
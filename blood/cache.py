@@ -0,0 +1,68 @@
+# blood/cache.py
+"""
+Versioned keys for the dashboard caches.
+
+Each block of the inventory dashboard (inventory / pending requests / audit log /
+rollup trend chart / demand forecast) has a version number in the cache; it
+goes into the {% cache %} fragment key, so a write only has to bump the
+version and the old fragments simply expire.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+FRAGMENTS = ("inventory", "requests", "audit", "rollups", "forecast")
+
+
+def _version_key(name):
+    return f"bloodbank:version:{name}"
+
+
+def _fresh_version():
+    # מבוסס זמן ולא 1 — אם מפתח הגרסה נמחק (eviction) לא נחזור לגרסה ישנה שעדיין בקאש
+    return int(time.time() * 1000)
+
+
+def cache_seconds():
+    return getattr(settings, "DASHBOARD_CACHE_SECONDS", 300)
+
+
+def versions():
+    """:return: {fragment name: current version}, creating missing versions on the way"""
+    keys = {name: _version_key(name) for name in FRAGMENTS}
+    found = cache.get_many(keys.values())
+    out, missing = {}, {}
+    for name, key in keys.items():
+        if key in found:
+            out[name] = found[key]
+        else:
+            out[name] = missing[key] = _fresh_version()
+    if missing:
+        cache.set_many(missing, timeout=None)
+    return out
+
+
+def bump(*names):
+    """Invalidate the given blocks (all of them when called without names)."""
+    for name in names or FRAGMENTS:
+        try:
+            cache.incr(_version_key(name))
+        except ValueError:  # key missing (or DummyCache)
+            cache.set(_version_key(name), _fresh_version(), timeout=None)
+
+
+def bump_on_commit(*names):
+    """bump() once the current transaction commits (immediately outside a transaction)."""
+    transaction.on_commit(lambda: bump(*names))
+
+
+def get_or_compute(name, version, suffix, compute):
+    """Low-level versioned cache for data that cannot live in a template fragment."""
+    key = f"bloodbank:{name}:{version}:{suffix}"
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, cache_seconds())
+    return value
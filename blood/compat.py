@@ -36,3 +36,43 @@ def plan_dispense(requested_type: str, qty: int, inventory_counts: dict[str, int
             if remaining == 0:
                 break
     return plan, remaining  # remaining הוא החוסר
+
+
+def plan_dispense_sites(requested_type: str, qty: int, counts_by_site: dict, site_order: list) -> tuple[dict, int]:
+    """
+    תכנית ניפוק מכמה אתרים: קודם אתר הבית, אחר כך שאר האתרים לפי עלות ההעברה.
+    :param counts_by_site: {site_id: {סוג: כמות זמינה}}
+    :param site_order: סדר האתרים לשאיבה (אתר הבית ראשון, ואחריו לפי עלות)
+    :return: (plan_by_site, shortfall) — plan_by_site: {site_id: {"A+": 2, ...}}
+    """
+    plan = {}
+    remaining = qty
+    for site in site_order:
+        if remaining == 0:
+            break
+        site_plan, remaining = plan_dispense(requested_type, remaining, counts_by_site.get(site, {}))
+        if site_plan:
+            plan[site] = site_plan
+    return plan, remaining
+
+
+def merge_site_plan(plan_by_site: dict) -> dict:
+    """{site: {type: n}} -> {type: n} (the dispensed_map of DispenseLog)"""
+    merged = {}
+    for site_plan in plan_by_site.values():
+        for blood_type, n in site_plan.items():
+            merged[blood_type] = merged.get(blood_type, 0) + n
+    return merged
+
+
+def _single_site(requested_type, qty, inventory_counts):
+    # המתכנן הרב-אתרי עם אתר אחד חייב להתנהג בדיוק כמו plan_dispense
+    plan, shortfall = plan_dispense_sites(requested_type, qty, {None: inventory_counts}, [None])
+    return merge_site_plan(plan), shortfall
+
+
+# רישום מתכננים: גרסאות מואצות נרשמות כאן ונבדקות מול plan_dispense (המימוש המקורי)
+PLANNERS = {
+    "reference": plan_dispense,
+    "multi_site": _single_site,
+}
@@ -0,0 +1,66 @@
+# blood/datagen.py
+"""
+Pure-python generators for synthetic load-test data.
+
+Kept free of Django imports so multiprocessing workers can import it
+with any start method (fork or spawn).
+"""
+import random
+from datetime import datetime, timedelta, timezone
+
+# התפלגות סוגי דם באוכלוסייה (קירוב, ישראל)
+BLOOD_TYPE_WEIGHTS = {
+    "O+": 32, "A+": 34, "B+": 17, "AB+": 7,
+    "O-": 3, "A-": 4, "B-": 2, "AB-": 1,
+}
+DONATIONS_PER_DONOR_WEIGHTS = {1: 45, 2: 25, 3: 15, 4: 10, 5: 5}
+
+FIRST_NAMES = [
+    "Noa", "Tamar", "Maya", "Yael", "Shira", "Avigail", "Dana", "Michal", "Rivka", "Lea",
+    "David", "Yosef", "Moshe", "Daniel", "Itai", "Omer", "Ariel", "Eitan", "Amir", "Yonatan",
+    "Sara", "Rachel", "Hila", "Noam", "Lior", "Rami", "Samir", "Nadia", "Karim", "Layla",
+]
+LAST_NAMES = [
+    "Cohen", "Levi", "Mizrahi", "Peretz", "Biton", "Dahan", "Avraham", "Friedman", "Azulay", "Katz",
+    "Malka", "Amar", "Ohana", "Shapiro", "Golan", "Haddad", "Khoury", "Nasser", "Saleh", "Ben-David",
+]
+NATIONAL_ID_BASE = 200_000_000
+DAY = 86400.0
+
+
+def weighted_choice(rng, weights):
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def generate_chunk(job):
+    """
+    Worker: build one chunk of donors + donations + audit rows as plain tuples.
+    Seeded per chunk, so output does not depend on the number of workers.
+    """
+    seed, index, start, count, anchor_ts, days, expiry_days = job
+    rng = random.Random(f"{seed}:{index}")
+    window = days * DAY
+
+    donors, units, events = [], [], []
+    for i in range(start, start + count):
+        nid = f"{NATIONAL_ID_BASE + i:09d}"
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        age_days = rng.randint(18 * 365, 65 * 365)
+        dob = (datetime.fromtimestamp(anchor_ts, tz=timezone.utc) - timedelta(days=age_days)).date().isoformat()
+        bt = weighted_choice(rng, BLOOD_TYPE_WEIGHTS)
+        donors.append((nid, name, dob))
+
+        for _ in range(weighted_choice(rng, DONATIONS_PER_DONOR_WEIGHTS)):
+            donated = anchor_ts - rng.random() * window
+            expiry = donated + expiry_days * DAY
+            dispensed = None
+            if expiry <= anchor_ts:
+                # expired by now: most were used before expiry, the rest expired on the shelf
+                if rng.random() < 0.85:
+                    dispensed = donated + rng.random() * (expiry - donated)
+            elif rng.random() < 0.3:
+                dispensed = donated + rng.random() * (anchor_ts - donated)
+            units.append((nid, bt, donated, expiry, dispensed))
+            events.append(("donation_create", donated, {"blood_type": bt, "donor": name}))
+
+    return donors, units, events
@@ -0,0 +1,14 @@
+# blood/db.py
+from django.conf import settings
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """
+    connection_created handler: tune every new SQLite connection when the
+    SQLite production profile is on (settings.SQLITE_PRODUCTION).
+    Runs on the raw sqlite3 connection so the pragmas never show up in query logs.
+    """
+    if connection.vendor != "sqlite" or not getattr(settings, "SQLITE_PRODUCTION", False):
+        return
+    for name, value in getattr(settings, "SQLITE_PRAGMAS", {}).items():
+        connection.connection.execute(f"PRAGMA {name} = {value}")
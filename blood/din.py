@@ -0,0 +1,116 @@
+# blood/din.py
+"""
+ISBT 128-style donation identification numbers (DIN) for units:
+
+    facility code (5) + collection year (2) + sequence (6) = 13 characters,
+    e.g. "Z9999 26 000123", printed with an ISO 7064 Mod 37-2 check character.
+
+Sequences come from DinSequence (one row per year): a range of n numbers is
+reserved with one UPDATE ... SET last = last + n RETURNING last, so bulk
+intake takes one round trip for the whole batch. Scanners may send the DIN with the "="
+data identifier, the two flag characters and/or the check character.
+"""
+import re
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .models import DinSequence
+
+CHECK_CHARS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ*"
+DIN_LENGTH = 13
+MAX_SEQUENCE = 999_999
+_DIN_RE = re.compile(r"^[A-Z]\d{4}\d{2}\d{6}$")
+
+
+def facility_code():
+    return getattr(settings, "DIN_FACILITY_CODE", "Z9999")
+
+
+def check_char(din):
+    """ISO 7064 Mod 37-2 check character of a DIN (as printed next to it in a box)."""
+    p = 0
+    for ch in din:
+        p = ((p + CHECK_CHARS.index(ch)) * 2) % 37
+    return CHECK_CHARS[(38 - p) % 37]
+
+
+def format_din(din):
+    """Eye-readable form: "Z9999 26 000123" (the check character is printed apart)."""
+    return f"{din[:5]} {din[5:7]} {din[7:]}" if din else ""
+
+
+def make_din(year, sequence):
+    return f"{facility_code()}{year % 100:02d}{sequence:06d}"
+
+
+def parse(code):
+    """
+    Normalize a scanned or typed code to its 13-character DIN.
+    Accepts spaces, a leading "=", trailing flag characters and a trailing
+    check character (verified when present).
+    :raise ValueError: malformed code or wrong check character
+    """
+    raw = re.sub(r"\s+", "", str(code or "")).upper().lstrip("=")
+    din, rest = raw[:DIN_LENGTH], raw[DIN_LENGTH:]
+    if not _DIN_RE.match(din) or len(rest) > 3:
+        raise ValueError("malformed donation number")
+    if len(rest) in (1, 3) and rest[-1] != check_char(din):
+        raise ValueError("wrong check character")
+    return din
+
+
+def _bump(year, n):
+    """
+    last += n in one statement, returning the new value (UPDATE ... RETURNING:
+    PostgreSQL, SQLite >= 3.35), so no transaction is needed around it.
+    :return: the new last sequence, or None when the year has no row yet
+    """
+    table = connection.ops.quote_name(DinSequence._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f'UPDATE {table} SET "last" = "last" + %s WHERE "year" = %s RETURNING "last"', [n, year])
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def allocate(n, year=None):
+    """Reserve n consecutive DINs of `year` (default: this year). :return: [din, ...]"""
+    if n <= 0:
+        return []
+    year = (year or timezone.localdate().year) % 100
+    last = _bump(year, n)
+    if last is None:
+        DinSequence.objects.get_or_create(year=year)  # first unit of the year
+        last = _bump(year, n)
+    if last > MAX_SEQUENCE:
+        raise ValueError(f"DIN sequence of year {year:02d} exhausted")
+    return [make_din(year, seq) for seq in range(last - n + 1, last + 1)]
+
+
+def reserve_imported(dins):
+    """
+    Move the sequences past imported DINs of this facility (one UPDATE per year),
+    so allocate() never hands out a number that already exists.
+    """
+    top, code = {}, facility_code()
+    for number in dins:
+        if number and number.startswith(code):
+            year, seq = int(number[5:7]), int(number[7:])
+            top[year] = max(top.get(year, 0), seq)
+    for year, seq in top.items():
+        DinSequence.objects.get_or_create(year=year)
+        DinSequence.objects.filter(year=year, last__lt=seq).update(last=seq)
+
+
+def assign(units):
+    """Give every unsaved unit without a DIN one, by the year of its donation_date."""
+    by_year = defaultdict(list)
+    for unit in units:
+        if not unit.din:
+            by_year[timezone.localtime(unit.donation_date).year].append(unit)
+    for year, group in by_year.items():
+        for unit, din in zip(group, allocate(len(group), year)):
+            unit.din = din
+    return units
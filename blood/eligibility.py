@@ -0,0 +1,138 @@
+# blood/eligibility.py
+"""
+Donor eligibility from denormalized columns on Donor:
+
+- last_donation_at / next_eligible_at (+ blood_type) are written at intake
+  (record_donation / record_donations), so checking a donor never reads their
+  donation history
+- age limits come from date_of_birth (unknown birth date: not checked)
+- eligible_counts() / eligible_donors() drive recall campaigns when stock is
+  low; both are answered from the donor_eligible index
+
+Settings: DONATION_INTERVAL_DAYS (whole blood: 56), DONOR_MIN_AGE, DONOR_MAX_AGE.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from .models import DonationUnit, Donor
+
+
+def interval():
+    return timedelta(days=getattr(settings, "DONATION_INTERVAL_DAYS", 56))
+
+
+def age_limits():
+    return getattr(settings, "DONOR_MIN_AGE", 17), getattr(settings, "DONOR_MAX_AGE", 65)
+
+
+def _years_before(day, years):
+    try:
+        return day.replace(year=day.year - years)
+    except ValueError:  # 29 February
+        return day.replace(year=day.year - years, day=28)
+
+
+def age_on(date_of_birth, day):
+    return day.year - date_of_birth.year - ((day.month, day.day) < (date_of_birth.month, date_of_birth.day))
+
+
+def check(donor, when=None):
+    """:return: why `donor` may not donate at `when` (default: now), or None when eligible"""
+    if donor is None:
+        return None  # first donation of a new donor
+    when = when or timezone.now()
+    if donor.next_eligible_at and when < donor.next_eligible_at:
+        return f"Next donation allowed from {timezone.localtime(donor.next_eligible_at):%Y-%m-%d}."
+    if donor.date_of_birth:
+        age = age_on(donor.date_of_birth, timezone.localdate(when))
+        min_age, max_age = age_limits()
+        if age < min_age:
+            return f"Donors must be at least {min_age} years old."
+        if age > max_age:
+            return f"Donors must be at most {max_age} years old."
+    return None
+
+
+def ineligible(national_ids, when=None):
+    """Batch check() with one IN query. :return: {national_id: reason} of the donors that may not donate"""
+    donors = Donor.objects.filter(national_id__in=set(national_ids)).only(
+        "national_id", "date_of_birth", "next_eligible_at"
+    )
+    out = {}
+    for donor in donors:
+        reason = check(donor, when)
+        if reason:
+            out[donor.national_id] = reason
+    return out
+
+
+def record_donation(unit):
+    """After a unit is saved: its donor's last donation, next eligible time and blood type (one UPDATE)."""
+    Donor.objects.filter(pk=unit.donor_id).update(
+        last_donation_at=unit.donation_date,
+        next_eligible_at=unit.donation_date + interval(),
+        blood_type=unit.blood_type,
+    )
+
+
+def record_donations(units):
+    """record_donation for many units (latest unit per donor wins) with one bulk UPDATE."""
+    latest = {}
+    for unit in units:
+        if unit.donor_id not in latest or unit.donation_date > latest[unit.donor_id].donation_date:
+            latest[unit.donor_id] = unit
+    Donor.objects.bulk_update(
+        [Donor(pk=u.donor_id, last_donation_at=u.donation_date, next_eligible_at=u.donation_date + interval(),
+               blood_type=u.blood_type) for u in latest.values()],
+        ["last_donation_at", "next_eligible_at", "blood_type"],
+        batch_size=1000,
+    )
+
+
+def rebuild():
+    """Recompute the columns of every donor from their units (after bulk imports). Two UPDATEs."""
+    latest = DonationUnit.objects.filter(donor=OuterRef("pk")).order_by("-donation_date")
+    Donor.objects.filter(pk__in=DonationUnit.objects.values("donor_id")).update(
+        last_donation_at=Subquery(latest.values("donation_date")[:1]),
+        blood_type=Subquery(latest.values("blood_type")[:1]),
+    )
+    Donor.objects.filter(last_donation_at__isnull=False).update(next_eligible_at=F("last_donation_at") + interval())
+
+
+def eligible_q(when=None):
+    """Filter of the donors who may donate at `when`."""
+    when = when or timezone.now()
+    today = timezone.localdate(when)
+    # age between the limits <=> born in (today - (max + 1) years, today - min years]
+    min_age, max_age = age_limits()
+    youngest = _years_before(today, min_age)
+    oldest = _years_before(today, max_age + 1)
+    return (
+        (Q(next_eligible_at__isnull=True) | Q(next_eligible_at__lte=when))
+        & (Q(date_of_birth__isnull=True) | Q(date_of_birth__lte=youngest, date_of_birth__gt=oldest))
+    )
+
+
+def eligible_counts(when=None):
+    """:return: {blood type: donors who may donate now}, every type (one GROUP BY on the index)"""
+    rows = (
+        Donor.objects.exclude(blood_type="").filter(eligible_q(when))
+        # COUNT(*), not COUNT(id): id is not in donor_eligible, so the count stays index-only
+        .values_list("blood_type").annotate(n=Count("*")).order_by()
+    )
+    counts = dict.fromkeys(bt for bt, _ in Donor._meta.get_field("blood_type").choices)
+    counts.update((bt, 0) for bt in counts)
+    counts.update(rows)
+    return counts
+
+
+def eligible_donors(blood_type, when=None):
+    """Donors of `blood_type` who may donate now, longest since their last donation first."""
+    return (
+        Donor.objects.filter(blood_type=blood_type).filter(eligible_q(when))
+        .order_by(F("next_eligible_at").asc(nulls_first=True), "national_id")
+        .values_list("national_id", "full_name", "next_eligible_at")
+    )
@@ -0,0 +1,145 @@
+# blood/forecast.py
+"""
+Daily demand per blood type from DispenseLog.dispensed_map (units actually
+taken from each type's stock), smoothed with NumPy over all types at once:
+
+- EWMA (exponential smoothing) -> expected units per day
+- moving average of the last days -> shown next to it for comparison
+- days of supply / projected stock-out date from the current stock
+- dynamic low-stock threshold = cover days of expected demand + safety stock
+
+Run nightly by `manage.py forecast_demand`; the dashboard only reads the
+stored DemandForecast rows.
+"""
+import math
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from .models import BLOOD_TYPES, DemandForecast, DispenseLog, DonationUnit
+from .rollups import day_bounds
+
+TYPES = [bt for bt, _ in BLOOD_TYPES]
+TYPE_INDEX = {bt: i for i, bt in enumerate(TYPES)}
+
+
+def daily_demand(first_day, last_day):
+    """
+    :return: array (types x days) of units dispensed per type and local day,
+             for first_day..last_day inclusive
+    """
+    n_days = (last_day - first_day).days + 1
+    demand = np.zeros((len(TYPES), max(n_days, 0)))
+    if n_days <= 0:
+        return demand
+    start = day_bounds(first_day)[0]
+    end = start + timedelta(days=n_days)
+    rows, cols, units = [], [], []
+    logs = DispenseLog.objects.filter(created_at__gte=start, created_at__lt=end).values_list("created_at", "dispensed_map")
+    for created_at, dispensed_map in logs.iterator(chunk_size=2000):
+        day = (timezone.localdate(created_at) - first_day).days
+        for bt, n in (dispensed_map or {}).items():
+            if bt in TYPE_INDEX:
+                rows.append(TYPE_INDEX[bt])
+                cols.append(day)
+                units.append(n)
+    np.add.at(demand, (rows, cols), units)
+    return demand
+
+
+def ewma(demand, alpha):
+    """
+    Last value of s_t = alpha * x_t + (1 - alpha) * s_(t-1), s_0 = x_0, for every row,
+    as one matrix-vector product (the weights of the closed form).
+    """
+    n = demand.shape[1]
+    if n == 0:
+        return np.zeros(demand.shape[0])
+    weights = alpha * (1 - alpha) ** np.arange(n - 1, -1, -1, dtype=float)
+    weights[0] = (1 - alpha) ** (n - 1)
+    return demand @ weights
+
+
+def moving_average(demand, window):
+    """Mean of the last `window` days of every row (fewer when the history is shorter)."""
+    if demand.shape[1] == 0:
+        return np.zeros(demand.shape[0])
+    return demand[:, -window:].mean(axis=1)
+
+
+def _available_now(now):
+    counts = np.zeros(len(TYPES))
+    rows = (
+        DonationUnit.objects.filter(status=DonationUnit.Status.AVAILABLE)
+        .filter(Q(expiry_at__isnull=True) | Q(expiry_at__gt=now))
+        .values_list("blood_type").annotate(n=Count("id"))
+    )
+    for bt, n in rows:
+        counts[TYPE_INDEX[bt]] = n
+    return counts
+
+
+def compute(today=None):
+    """
+    Forecast for every blood type from the closed days before `today`.
+    :return: {blood type: field values of DemandForecast}
+    """
+    today = today or timezone.localdate()
+    last_day = today - timedelta(days=1)
+    first_day = last_day - timedelta(days=getattr(settings, "FORECAST_HISTORY_DAYS", 90) - 1)
+    # a young database: start at the first dispense instead of padding with zero days
+    first_log = DispenseLog.objects.aggregate(m=Min("created_at"))["m"]
+    if first_log is not None:
+        first_day = max(first_day, timezone.localdate(first_log))
+
+    demand = daily_demand(first_day, last_day)
+    rate = ewma(demand, getattr(settings, "FORECAST_ALPHA", 0.3))
+    average = moving_average(demand, getattr(settings, "FORECAST_MA_DAYS", 7))
+    std = demand.std(axis=1, ddof=1) if demand.shape[1] > 1 else np.zeros(len(TYPES))
+    available = _available_now(timezone.now())
+
+    cover = getattr(settings, "FORECAST_COVER_DAYS", 3)
+    z = getattr(settings, "FORECAST_SERVICE_Z", 1.65)
+    thresholds = np.ceil(rate * cover + z * std * math.sqrt(cover))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days_of_supply = np.where(rate > 0, available / rate, np.inf)
+
+    out = {}
+    for i, bt in enumerate(TYPES):
+        dos = float(days_of_supply[i])
+        finite = math.isfinite(dos)
+        out[bt] = {
+            "history_days": demand.shape[1],
+            "demand_per_day": round(float(rate[i]), 3),
+            "moving_average": round(float(average[i]), 3),
+            "demand_std": round(float(std[i]), 3),
+            "available": int(available[i]),
+            "days_of_supply": round(dos, 1) if finite else None,
+            "stockout_on": today + timedelta(days=math.floor(dos)) if finite else None,
+            "threshold": int(thresholds[i]),
+        }
+    return out
+
+
+@transaction.atomic
+def store(today=None):
+    """Compute and (re)write today's DemandForecast rows. :return: the rows"""
+    today = today or timezone.localdate()
+    values = compute(today)
+    DemandForecast.objects.filter(computed_on=today).delete()
+    return DemandForecast.objects.bulk_create(
+        DemandForecast(computed_on=today, blood_type=bt, **fields) for bt, fields in values.items()
+    )
+
+
+def latest():
+    """:return: the most recent forecast rows in BLOOD_TYPES order ([] before the first run)"""
+    rows = list(DemandForecast.objects.filter(
+        computed_on=DemandForecast.objects.order_by("-computed_on").values("computed_on")[:1]
+    ))
+    rows.sort(key=lambda r: TYPE_INDEX[r.blood_type])
+    return rows
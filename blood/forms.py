@@ -7,6 +7,7 @@ from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.models import User
 # ⬆⬆⬆ הוספה חשובה ⬆⬆⬆
 
+from . import din, eligibility
 from .models import Donor, DonationUnit, BLOOD_TYPES, Profile
 from django.utils import timezone
 
@@ -273,20 +274,46 @@ class DonationForm(forms.ModelForm):
 
     class Meta:
         model = DonationUnit
-        fields = ["blood_type"]
-        widgets = {"blood_type": forms.Select(attrs={"class": "form-select"})}
+        fields = ["blood_type", "site"]
+        labels = {"site": "Collection site"}
+        widgets = {
+            "blood_type": forms.Select(attrs={"class": "form-select"}),
+            "site": forms.Select(attrs={"class": "form-select"}),
+        }
+
+    def clean(self):
+        data = super().clean()
+        nid = data.get("national_id")
+        # one indexed lookup; the donor's history is summarized on the row (blood/eligibility.py)
+        self.donor = Donor.objects.filter(national_id=nid).first() if nid else None
+        reason = eligibility.check(self.donor)
+        if reason:
+            raise forms.ValidationError(reason, code="ineligible")
+        return data
 
     def save(self, commit=True):
-        donor, _ = Donor.objects.get_or_create(
-            national_id=self.cleaned_data["national_id"],
-            defaults={"full_name": self.cleaned_data["full_name"]},
-        )
+        donor = getattr(self, "donor", None)
+        if donor is None:  # a concurrent intake may have created the donor since clean()
+            donor, _ = Donor.objects.get_or_create(
+                national_id=self.cleaned_data["national_id"],
+                defaults={"full_name": self.cleaned_data["full_name"]},
+            )
         if donor.full_name != self.cleaned_data["full_name"]:
             donor.full_name = self.cleaned_data["full_name"]
             donor.save(update_fields=["full_name"])
 
         donation = super().save(commit=False)
         donation.donor = donor
+        if not donation.din:
+            donation.din = din.allocate(1, timezone.localtime(donation.donation_date).year)[0]
         if commit:
             donation.save()
-        return donation
\ No newline at end of file
+            eligibility.record_donation(donation)
+        return donation
+
+
+class DonationRecordForm(forms.Form):
+    """Validates one row of a batch intake (blood drives)."""
+    national_id = forms.CharField(label="National ID", validators=[digits_9_validator])
+    full_name = forms.CharField(label="Full name", validators=[name_validator])
+    blood_type = forms.ChoiceField(label="Blood type", choices=BLOOD_TYPES)
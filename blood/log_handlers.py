@@ -0,0 +1,122 @@
+# blood/log_handlers.py
+"""
+Non-blocking logging: the request thread only formats the record (JSON) and
+puts it on a queue; a QueueListener thread does the disk I/O into rotating files.
+
+Used from settings.LOGGING — keep this module free of model imports
+(it is loaded while Django configures logging, before the apps are ready).
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import weakref
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from multiprocessing import util as mp_util
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line. Adds method/path/status for django.request records."""
+
+    def format(self, record):
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "pid": record.process,
+            "thread": record.threadName,
+        }
+        request = getattr(record, "request", None)
+        if request is not None and hasattr(request, "method"):
+            payload["method"] = request.method
+            payload["path"] = request.get_full_path()
+        if hasattr(record, "status_code"):
+            payload["status_code"] = record.status_code
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exc"] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class QueuedRotatingFileHandler(QueueHandler):
+    """
+    QueueHandler that owns its QueueListener + RotatingFileHandler.
+
+    - emit() never touches the disk; when the queue is full the record is
+      dropped and counted (self.dropped) instead of blocking the request.
+    - The listener starts with the handler (when LOGGING is configured) and is
+      stopped on close() / interpreter exit, which drains the queue first.
+    - "{pid}" in filename gives each worker process its own file (rotation
+      is not safe with several processes writing to one file).
+    """
+
+    def __init__(self, filename, max_bytes=10 * 1024 * 1024, backup_count=5,
+                 encoding="utf-8", queue_size=10000):
+        self.filename_template = str(filename)
+        self.filename = self.filename_template.format(pid=os.getpid())
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.encoding = encoding
+        self.queue_size = queue_size
+        self.dropped = 0
+        super().__init__(queue.Queue(queue_size))
+        self._start()
+        atexit.register(self.close)
+        # a forked child does not inherit the listener thread — _restart_open_handlers
+        # gives it its own. multiprocessing children leave through os._exit (no atexit)
+        # but run their finalizers; the registry is reset after fork, hence register_after_fork
+        _open_handlers.add(self)
+        mp_util.register_after_fork(self, lambda h: mp_util.Finalize(h, h.close, exitpriority=0))
+
+    def _start(self):
+        self.file_handler = RotatingFileHandler(
+            self.filename, maxBytes=self.max_bytes, backupCount=self.backup_count,
+            encoding=self.encoding, delay=True,
+        )
+        # records arrive already formatted by prepare() (self.formatter)
+        self.file_handler.setFormatter(logging.Formatter("%(message)s"))
+        self.listener = QueueListener(self.queue, self.file_handler, respect_handler_level=False)
+        self.listener.start()
+
+    def _restart_in_child(self):
+        # the child's own file: the parent's "{pid}" was expanded with the parent's pid
+        self.filename = self.filename_template.format(pid=os.getpid())
+        self.dropped = 0
+        self.queue = queue.Queue(self.queue_size)
+        self._start()
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        """Block until everything queued so far has been written."""
+        if self.listener is not None and self.listener._thread is not None:
+            self.queue.join()
+            self.file_handler.flush()
+
+    def close(self):
+        _open_handlers.discard(self)
+        listener, self.listener = self.listener, None
+        if listener is not None and listener._thread is not None:
+            listener.stop()  # processes the remaining records, then joins the thread
+            self.file_handler.close()
+        super().close()
+
+
+# handlers not closed yet; one fork hook for all of them (closed handlers stay closed in the child)
+_open_handlers = weakref.WeakSet()
+
+
+def _restart_open_handlers():
+    for handler in list(_open_handlers):
+        handler._restart_in_child()
+
+
+os.register_at_fork(after_in_child=_restart_open_handlers)
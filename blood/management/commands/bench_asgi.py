@@ -0,0 +1,122 @@
+# blood/management/commands/bench_asgi.py
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from blood.benchmarking import grant_portal, summarize, write_results
+
+# sync (WSGI) view -> async (ASGI) variant
+PAGES = {
+    "inventory": "inventory_async",
+    "records": "records_async",
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the portal pages under WSGI (sync views, thread pool) and ASGI "
+        "(async variants, one event loop) in-process: throughput and p50/p95/p99 latency. "
+        "For real servers use bench_http --base-url with the portal / portal_async personas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=8,
+                            help="Concurrent clients (threads for WSGI, tasks for ASGI; default: 8)")
+        parser.add_argument("--requests", type=int, default=50,
+                            help="Requests per client and page (default: 50)")
+        parser.add_argument("--pages", default=",".join(PAGES),
+                            help=f"Comma-separated pages (default: {','.join(PAGES)})")
+        parser.add_argument("--output", default="", help="Write results as JSON to this path")
+
+    def handle(self, *args, **opts):
+        concurrency, n = max(1, opts["concurrency"]), opts["requests"]
+        pages = [p.strip() for p in opts["pages"].split(",") if p.strip()]
+        results = {}
+        # both test clients send Host: testserver
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+            for page in pages:
+                results[page] = {
+                    "wsgi": self._run_wsgi(page, concurrency, n),
+                    "asgi": asyncio.run(self._run_asgi(PAGES[page], concurrency, n)),
+                }
+                self._print(page, results[page])
+
+        if opts["output"]:
+            path = write_results(opts["output"], {
+                "benchmark": "bench_asgi",
+                "concurrency": concurrency,
+                "requests_per_client": n,
+                "pages": results,
+            })
+            self.stdout.write(self.style.SUCCESS(f"Saved results to {path}"))
+
+    # ------------------------ runners ------------------------
+    def _run_wsgi(self, name, concurrency, n):
+        url = reverse(name)
+
+        def worker(_):
+            client = Client()
+            latencies, errors = [], 0
+            try:
+                for _ in range(n):
+                    grant_portal(client)
+                    started = time.perf_counter()
+                    resp = client.get(url)
+                    if resp.status_code == 200:
+                        latencies.append((time.perf_counter() - started) * 1000)
+                    else:
+                        errors += 1
+            finally:
+                connection.close()
+            return latencies, errors
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(worker, range(concurrency)))
+        return self._summary(outcomes, time.perf_counter() - started)
+
+    async def _run_asgi(self, name, concurrency, n):
+        url = reverse(name)
+
+        async def worker():
+            client = AsyncClient()
+            latencies, errors = [], 0
+            for _ in range(n):
+                session = await client.asession()
+                await session.aset("portal_once_ok", True)
+                await session.asave()
+                started = time.perf_counter()
+                resp = await client.get(url)
+                if resp.status_code == 200:
+                    latencies.append((time.perf_counter() - started) * 1000)
+                else:
+                    errors += 1
+            return latencies, errors
+
+        started = time.perf_counter()
+        outcomes = await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return self._summary(outcomes, time.perf_counter() - started)
+
+    @staticmethod
+    def _summary(outcomes, wall):
+        latencies = [ms for lat, _ in outcomes for ms in lat]
+        out = summarize([round(ms, 3) for ms in latencies], errors=sum(e for _, e in outcomes))
+        out["wall_seconds"] = round(wall, 3)
+        out["throughput_rps"] = round(len(latencies) / wall, 2) if wall else None
+        return out
+
+    def _print(self, page, r):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\n{page}"))
+        for mode in ("wsgi", "asgi"):
+            s = r[mode]
+            fmt = lambda v: f"{v:.1f}" if v is not None else "-"
+            self.stdout.write(
+                f"  {mode:<5}{s['throughput_rps'] or 0:>9.1f} req/s   p50/p95/p99 "
+                f"{fmt(s['p50_ms'])} / {fmt(s['p95_ms'])} / {fmt(s['p99_ms'])} ms   errors {s['errors']}"
+            )
@@ -0,0 +1,209 @@
+# blood/management/commands/bench_http.py
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from urllib import error as urlerror, parse, request as urlrequest
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from blood.benchmarking import (
+    BENCH_DONOR, BENCH_PASSWORD, BENCH_REQUESTER,
+    ensure_bench_users, grant_portal, summarize, write_results,
+)
+
+# persona -> URL names it visits (uniformly)
+PERSONA_ENDPOINTS = {
+    "anon": ["home", "login", "signup"],
+    "donor": ["home", "intake", "profile"],
+    "requester": ["home", "dispense"],
+    "portal": ["records", "inventory", "donations_export", "dispensed_export"],
+    # async variants — compare against "portal" on an ASGI server (deploy/gunicorn.conf.py)
+    "portal_async": ["records_async", "inventory_async"],
+}
+PORTAL_ENDPOINTS = set(PERSONA_ENDPOINTS["portal"]) | set(PERSONA_ENDPOINTS["portal_async"])
+DEFAULT_MIX = "anon=1,donor=3,requester=2,portal=2"
+
+
+def _parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in PERSONA_ENDPOINTS:
+            raise CommandError(f"Unknown persona {name!r} (choose from {', '.join(PERSONA_ENDPOINTS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+# ------------------------ transports ------------------------
+class InProcessSession:
+    """Drives the WSGI app through django.test.Client; counts SQL queries per request."""
+
+    def __init__(self, persona, users):
+        self.client = Client(SERVER_NAME="localhost")
+        if persona in ("donor", "requester"):
+            self.client.force_login(users[persona])
+
+    def get(self, name):
+        if name in PORTAL_ENDPOINTS:
+            grant_portal(self.client)
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            resp = self.client.get(reverse(name))
+            elapsed = (time.perf_counter() - started) * 1000
+        # a redirect here means the login/portal pass was not honoured
+        ok = resp.status_code == 200
+        return elapsed, len(ctx.captured_queries), ok
+
+
+class _NoRedirect(urlrequest.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpSession:
+    """Drives a running server over HTTP (query counts are not visible from outside)."""
+
+    def __init__(self, persona, base_url):
+        self.base = base_url.rstrip("/")
+        self.jar = CookieJar()
+        self.opener = urlrequest.build_opener(urlrequest.HTTPCookieProcessor(self.jar))
+        self.no_redirect = urlrequest.build_opener(urlrequest.HTTPCookieProcessor(self.jar), _NoRedirect)
+        if persona in ("donor", "requester"):
+            username = BENCH_DONOR if persona == "donor" else BENCH_REQUESTER
+            self._post(reverse("login"), {"username": username, "password": BENCH_PASSWORD})
+
+    def _csrf(self, path):
+        html = self.opener.open(self.base + path).read().decode("utf-8", "replace")
+        m = re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', html)
+        return m.group(1) if m else ""
+
+    def _post(self, path, data):
+        data = {**data, "csrfmiddlewaretoken": self._csrf(path)}
+        req = urlrequest.Request(self.base + path, data=parse.urlencode(data).encode(),
+                                 headers={"Referer": self.base + path})
+        try:
+            self.no_redirect.open(req).read()
+        except urlerror.HTTPError as e:  # 302 surfaces as an error with _NoRedirect
+            if e.code != 302:
+                raise
+
+    def get(self, name):
+        if name in PORTAL_ENDPOINTS:
+            self._post(reverse("portal_login"), {"password": settings.PORTAL_PASSWORD})
+        started = time.perf_counter()
+        try:
+            resp = self.no_redirect.open(self.base + reverse(name))
+            resp.read()
+            ok = resp.status == 200
+        except urlerror.HTTPError:
+            ok = False
+        return (time.perf_counter() - started) * 1000, None, ok
+
+
+# ------------------------ command ------------------------
+class Command(BaseCommand):
+    help = (
+        "HTTP load test: mixed donor/requester/portal traffic from a thread pool, "
+        "reporting throughput, p50/p95/p99 latency and SQL query counts per endpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=4,
+                            help="Worker threads (default: 4)")
+        parser.add_argument("--requests", type=int, default=200,
+                            help="Requests per worker (default: 200)")
+        parser.add_argument("--mix", default=DEFAULT_MIX,
+                            help=f"Persona weights (default: {DEFAULT_MIX})")
+        parser.add_argument("--base-url", default="",
+                            help="Hit a running server instead of the in-process WSGI app, "
+                                 "e.g. http://127.0.0.1:8000")
+        parser.add_argument("--seed", type=int, default=1,
+                            help="Random seed for the traffic mix (default: 1)")
+        parser.add_argument("--output", default="",
+                            help="Write results as JSON to this path")
+
+    def handle(self, *args, **opts):
+        mix = _parse_mix(opts["mix"])
+        concurrency = max(1, opts["concurrency"])
+        donor_user, requester_user = ensure_bench_users()
+        users = {"donor": donor_user, "requester": requester_user}
+        base_url = opts["base_url"]
+
+        lock = threading.Lock()
+        latencies = defaultdict(list)
+        queries = defaultdict(list)
+        errors = defaultdict(int)
+
+        def worker(worker_id):
+            rng = random.Random(f"{opts['seed']}:{worker_id}")
+            sessions = {}
+            try:
+                for _ in range(opts["requests"]):
+                    persona = rng.choices(list(mix), weights=list(mix.values()))[0]
+                    name = rng.choice(PERSONA_ENDPOINTS[persona])
+                    if persona not in sessions:
+                        sessions[persona] = (HttpSession(persona, base_url) if base_url
+                                             else InProcessSession(persona, users))
+                    elapsed, n_queries, ok = sessions[persona].get(name)
+                    with lock:
+                        if ok:
+                            latencies[name].append(round(elapsed, 3))
+                            if n_queries is not None:
+                                queries[name].append(n_queries)
+                        else:
+                            errors[name] += 1
+            finally:
+                connection.close()
+
+        self.stdout.write(f"Running {concurrency} worker(s) x {opts['requests']} request(s) "
+                          f"against {base_url or 'in-process WSGI app'}...")
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for f in [pool.submit(worker, i) for i in range(concurrency)]:
+                f.result()
+        wall = time.perf_counter() - started
+
+        endpoints = {
+            name: summarize(latencies[name], queries.get(name), errors.get(name, 0))
+            for name in sorted(set(latencies) | set(errors))
+        }
+        total = sum(s["count"] for s in endpoints.values())
+        results = {
+            "benchmark": "bench_http",
+            "mode": "http" if base_url else "in-process",
+            "base_url": base_url,
+            "concurrency": concurrency,
+            "requests_per_worker": opts["requests"],
+            "mix": mix,
+            "wall_seconds": round(wall, 3),
+            "throughput_rps": round(total / wall, 2) if wall else None,
+            "endpoints": endpoints,
+        }
+
+        self._print_table(results)
+        if opts["output"]:
+            path = write_results(opts["output"], results)
+            self.stdout.write(self.style.SUCCESS(f"Saved results to {path}"))
+
+    def _print_table(self, results):
+        self.stdout.write(f"\n{'endpoint':<20}{'n':>7}{'err':>5}{'p50':>9}{'p95':>9}{'p99':>9}{'queries':>9}")
+        for name, s in results["endpoints"].items():
+            q = s.get("queries_mean")
+            fmt = lambda v: f"{v:.1f}" if v is not None else "-"
+            self.stdout.write(
+                f"{name:<20}{s['count']:>7}{s['errors']:>5}{fmt(s['p50_ms']):>9}{fmt(s['p95_ms']):>9}"
+                f"{fmt(s['p99_ms']):>9}{fmt(q):>9}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"\nThroughput: {results['throughput_rps']} req/s over {results['wall_seconds']}s"
+        ))
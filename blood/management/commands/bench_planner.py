@@ -0,0 +1,75 @@
+# blood/management/commands/bench_planner.py
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blood.benchmarking import INVENTORY_SHAPES, random_inventory, write_results
+from blood.compat import DONORS_BY_RECIPIENT, PLANNERS
+
+DEFAULT_QUANTITIES = "1,5,20,100,1000"
+
+
+class Command(BaseCommand):
+    help = (
+        "Micro-benchmark the compatibility planners in blood.compat.PLANNERS over all recipient "
+        "types, several quantities and sparse..saturated inventory shapes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--planner", action="append", default=[],
+                            help="Planner name to run (repeatable; default: all registered)")
+        parser.add_argument("--quantities", default=DEFAULT_QUANTITIES,
+                            help=f"Comma-separated request sizes (default: {DEFAULT_QUANTITIES})")
+        parser.add_argument("--inventories", type=int, default=50,
+                            help="Random inventories per shape (default: 50)")
+        parser.add_argument("--repeat", type=int, default=200,
+                            help="Calls per (inventory, type, quantity) case (default: 200)")
+        parser.add_argument("--seed", type=int, default=1,
+                            help="Random seed for the inventories (default: 1)")
+        parser.add_argument("--output", default="",
+                            help="Write results as JSON to this path")
+
+    def handle(self, *args, **opts):
+        names = opts["planner"] or list(PLANNERS)
+        unknown = set(names) - PLANNERS.keys()
+        if unknown:
+            raise CommandError(f"Unknown planner(s): {', '.join(sorted(unknown))}")
+        quantities = [int(q) for q in opts["quantities"].split(",") if q.strip()]
+
+        # identical cases for every planner
+        rng = random.Random(opts["seed"])
+        cases = {
+            shape: [random_inventory(rng, shape) for _ in range(opts["inventories"])]
+            for shape in INVENTORY_SHAPES
+        }
+        repeat = max(1, opts["repeat"])
+
+        results = {}
+        for name in names:
+            planner = PLANNERS[name]
+            per_shape = {}
+            for shape, inventories in cases.items():
+                calls = 0
+                started = time.perf_counter()
+                for inv in inventories:
+                    for rtype in DONORS_BY_RECIPIENT:
+                        for qty in quantities:
+                            for _ in range(repeat):
+                                planner(rtype, qty, inv)
+                            calls += repeat
+                elapsed = time.perf_counter() - started
+                per_shape[shape] = {"calls": calls, "ns_per_call": round(elapsed / calls * 1e9, 1)}
+                self.stdout.write(f"{name:<16}{shape:<12}{per_shape[shape]['ns_per_call']:>10.1f} ns/call")
+            results[name] = per_shape
+
+        if opts["output"]:
+            path = write_results(opts["output"], {
+                "benchmark": "bench_planner",
+                "quantities": quantities,
+                "inventories_per_shape": opts["inventories"],
+                "repeat": repeat,
+                "seed": opts["seed"],
+                "planners": results,
+            })
+            self.stdout.write(self.style.SUCCESS(f"Saved results to {path}"))
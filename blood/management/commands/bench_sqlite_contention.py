@@ -0,0 +1,180 @@
+# blood/management/commands/bench_sqlite_contention.py
+import multiprocessing
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+PROFILES = ("default", "production")
+
+
+def _contention_worker(job):
+    """
+    One benchmark process: runs intake / approve (writers) or inventory (readers)
+    through the test client until the deadline. Top-level so it also works with spawn.
+    """
+    role, index, profile, deadline, seed = job
+
+    import logging
+
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+    # lock errors are counted below; keep django.request from printing each traceback
+    logging.getLogger("django.request").setLevel(logging.CRITICAL)
+
+    from django.conf import settings
+    from django.db import OperationalError, connections
+    from django.test import Client
+    from django.urls import reverse
+
+    from blood.benchmarking import BENCH_DONOR, grant_portal
+    from blood.models import DispenseRequest
+    from django.contrib.auth.models import User
+
+    settings.SQLITE_PRODUCTION = profile == "production"
+    settings.DONATION_INTERVAL_DAYS = 0  # the bench donor gives blood on every intake
+    options = connections["default"].settings_dict.setdefault("OPTIONS", {})
+    if settings.SQLITE_PRODUCTION:
+        options.update({"transaction_mode": "IMMEDIATE", "timeout": 5})
+    else:
+        options.pop("transaction_mode", None)
+        options.pop("timeout", None)
+
+    rng = random.Random(f"{seed}:{role}:{index}")
+    stats = {"ops": {}, "locked": 0, "conflicts": 0, "latencies_ms": []}
+    client = Client(SERVER_NAME="localhost", raise_request_exception=True)
+    if role == "writer":
+        client.force_login(User.objects.get(username=BENCH_DONOR))
+
+    def timed(op, fn):
+        started = time.perf_counter()
+        try:
+            fn()
+        except OperationalError:
+            stats["locked"] += 1
+            return
+        stats["latencies_ms"].append((time.perf_counter() - started) * 1000)
+        stats["ops"][op] = stats["ops"].get(op, 0) + 1
+
+    def approve():
+        req = DispenseRequest.objects.create(
+            hospital_name="Bench Hospital", requested_type=rng.choice(["O+", "A+", "AB+"]), quantity=1,
+        )
+        client.post(reverse("request_approve", args=[req.pk]),
+                    {"portal_password": settings.PORTAL_PASSWORD})
+        if DispenseRequest.objects.filter(pk=req.pk, status=DispenseRequest.Status.PENDING).exists():
+            stats["conflicts"] += 1
+            req.delete()
+
+    def read_inventory():
+        grant_portal(client)
+        client.get(reverse("inventory"))
+
+    try:
+        while time.time() < deadline:
+            if role == "reader":
+                timed("inventory", read_inventory)
+            elif rng.random() < 0.5:
+                timed("intake", lambda: client.post(reverse("intake"), {}))
+            else:
+                timed("request_approve", approve)
+    finally:
+        connections.close_all()
+    return role, stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Multi-process SQLite contention benchmark: concurrent intake + request_approve writers "
+        "and inventory readers, with the default and/or the SQLITE_PRODUCTION profile."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--writers", type=int, default=4, help="Writer processes (default: 4)")
+        parser.add_argument("--readers", type=int, default=2, help="Reader processes (default: 2)")
+        parser.add_argument("--duration", type=float, default=10.0,
+                            help="Seconds per profile (default: 10)")
+        parser.add_argument("--profile", choices=PROFILES + ("both",), default="both",
+                            help="SQLite profile to measure (default: both, before/after)")
+        parser.add_argument("--stock", type=int, default=5000,
+                            help="AVAILABLE units per blood type to seed first (default: 5000)")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--output", default="", help="Write results as JSON to this path")
+
+    def handle(self, *args, **opts):
+        from django.conf import settings
+        from django.db import connection, connections
+
+        from blood.benchmarking import ensure_bench_users, summarize, write_results
+
+        if connection.vendor != "sqlite":
+            raise CommandError("This benchmark targets the SQLite backend.")
+        if str(settings.DATABASES["default"]["NAME"]) == ":memory:":
+            raise CommandError("Use a file-backed SQLite database.")
+
+        ensure_bench_users()
+        self._seed_stock(opts["stock"])
+
+        profiles = PROFILES if opts["profile"] == "both" else (opts["profile"],)
+        results = {}
+        for profile in profiles:
+            # journal_mode persists in the file, so reset it for the "before" run
+            with connection.cursor() as cursor:
+                cursor.execute("PRAGMA journal_mode = %s" % ("WAL" if profile == "production" else "DELETE"))
+            connections.close_all()
+
+            deadline = time.time() + opts["duration"]
+            jobs = ([("writer", i, profile, deadline, opts["seed"]) for i in range(opts["writers"])]
+                    + [("reader", i, profile, deadline, opts["seed"]) for i in range(opts["readers"])])
+            with multiprocessing.Pool(processes=len(jobs)) as pool:
+                outcomes = pool.map(_contention_worker, jobs)
+
+            results[profile] = self._aggregate(outcomes, opts["duration"], summarize)
+            self._print(profile, results[profile])
+
+        if opts["output"]:
+            path = write_results(opts["output"], {
+                "benchmark": "bench_sqlite_contention",
+                "writers": opts["writers"],
+                "readers": opts["readers"],
+                "duration_s": opts["duration"],
+                "profiles": results,
+            })
+            self.stdout.write(self.style.SUCCESS(f"Saved results to {path}"))
+
+    def _seed_stock(self, per_type):
+        from django.core.management import call_command
+        call_command("seed_inventory", per_type=per_type, stdout=self.stdout)
+
+    @staticmethod
+    def _aggregate(outcomes, duration, summarize):
+        ops, latencies = {}, {"writer": [], "reader": []}
+        locked = conflicts = 0
+        for role, stats in outcomes:
+            for op, n in stats["ops"].items():
+                ops[op] = ops.get(op, 0) + n
+            latencies[role] += stats["latencies_ms"]
+            locked += stats["locked"]
+            conflicts += stats["conflicts"]
+        return {
+            "ops": ops,
+            "ops_per_second": {op: round(n / duration, 2) for op, n in ops.items()},
+            "database_locked_errors": locked,
+            "approve_conflicts": conflicts,
+            "writer_latency": summarize(latencies["writer"]),
+            "reader_latency": summarize(latencies["reader"]),
+        }
+
+    def _print(self, profile, r):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\nProfile: {profile}"))
+        for op, rate in sorted(r["ops_per_second"].items()):
+            self.stdout.write(f"  {op:<18}{rate:>10.1f} ops/s")
+        self.stdout.write(f"  database locked:  {r['database_locked_errors']}")
+        self.stdout.write(f"  approve conflicts:{r['approve_conflicts']:>4}")
+        for role in ("writer", "reader"):
+            s = r[f"{role}_latency"]
+            if s["count"]:
+                self.stdout.write(f"  {role} latency p50/p95/p99: "
+                                  f"{s['p50_ms']:.1f} / {s['p95_ms']:.1f} / {s['p99_ms']:.1f} ms")
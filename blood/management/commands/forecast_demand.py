@@ -0,0 +1,24 @@
+# blood/management/commands/forecast_demand.py
+from django.core.management.base import BaseCommand
+
+from blood import cache as dashboard_cache
+from blood.forecast import store
+
+
+class Command(BaseCommand):
+    help = (
+        "Forecast daily demand per blood type from the dispense history (EWMA + moving average) "
+        "and store days of supply, projected stock-out dates and dynamic low-stock thresholds. "
+        "Run nightly, after rollup_inventory; running it again the same day overwrites the day."
+    )
+
+    def handle(self, *args, **opts):
+        rows = store()
+        dashboard_cache.bump("forecast")
+        self.stdout.write(f"{'type':<6}{'demand/day':>12}{'avg':>8}{'available':>11}{'days':>8}  stock-out   threshold")
+        for r in rows:
+            days = f"{r.days_of_supply:.1f}" if r.days_of_supply is not None else "-"
+            self.stdout.write(f"{r.blood_type:<6}{r.demand_per_day:>12.2f}{r.moving_average:>8.2f}{r.available:>11}"
+                              f"{days:>8}  {r.stockout_on or '-':<11} {r.threshold}")
+        self.stdout.write(self.style.SUCCESS(f"Stored forecast for {rows[0].computed_on} "
+                                             f"({rows[0].history_days} day(s) of history)."))
@@ -0,0 +1,242 @@
+# blood/management/commands/generate_dataset.py
+import os
+import random
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from multiprocessing import Pool
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from blood import cache as dashboard_cache, eligibility
+from blood.bulk import DEFAULT_BATCH_SIZE, dispense_lines, upsert_donors
+from blood.din import assign as assign_dins
+from blood.datagen import BLOOD_TYPE_WEIGHTS, DAY, generate_chunk, weighted_choice
+from blood.forms import HOSPITAL_CHOICES
+from blood.models import (
+    AuditEvent, DispenseLine, DispenseLog, DispenseRequest, DonationUnit, Donor, Fulfilment, Profile,
+)
+from blood.views import ADMIN_DISPLAY_NAME, ADMIN_ROLE_LABEL
+
+
+QUANTITIES = [1, 1, 2, 2, 3, 4, 6, 10]  # units per request
+
+
+def _ts(value):
+    return datetime.fromtimestamp(value, tz=dt_timezone.utc)
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a large, realistic, deterministic dataset (donors, donations, dispensed units, "
+        "dispense requests and audit events) for load testing. Approved requests, dispense logs "
+        "and fulfilments are built from the dispensed units, so their totals always match."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--donors", type=int, default=10000,
+                            help="Number of donors to generate (default: 10000)")
+        parser.add_argument("--days", type=int, default=365,
+                            help="History window in days (default: 365)")
+        parser.add_argument("--pending", type=int, default=200,
+                            help="Pending dispense requests (default: 200)")
+        parser.add_argument("--seed", type=int, default=42,
+                            help="Random seed (default: 42)")
+        parser.add_argument("--anchor", type=date.fromisoformat, default=None,
+                            help="'Today' for the generated history, YYYY-MM-DD (default: today)")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                            help="Generator processes (default: CPU count)")
+        parser.add_argument("--chunk-size", type=int, default=5000,
+                            help="Donors per generated chunk / transaction (default: 5000)")
+        parser.add_argument("--reset", action="store_true",
+                            help="Delete donors, units, requests, logs and audit events first")
+
+    def handle(self, *args, **opts):
+        if opts["donors"] < 0 or opts["days"] <= 0 or opts["chunk_size"] <= 0:
+            raise CommandError("--donors must be >= 0, --days and --chunk-size must be > 0.")
+
+        if opts["reset"]:
+            self.stdout.write(self.style.WARNING("Deleting existing data..."))
+            for model in (AuditEvent, Fulfilment, DispenseRequest, DispenseLine, DispenseLog, DonationUnit, Donor):
+                model.objects.all().delete()
+
+        anchor = opts["anchor"] or timezone.localdate()
+        anchor_ts = timezone.make_aware(datetime.combine(anchor, datetime.min.time())).timestamp()
+        expiry_days = getattr(settings, "RBC_EXPIRY_DAYS", 42)
+        seed, size = opts["seed"], opts["chunk_size"]
+
+        jobs = [
+            (seed, idx, start, min(size, opts["donors"] - start), anchor_ts, opts["days"], expiry_days)
+            for idx, start in enumerate(range(0, opts["donors"], size))
+        ]
+
+        started = time.perf_counter()
+        totals = {"donors": 0, "units": 0, "events": 0}
+        # approvals are built only from the units generated by this run
+        self.last_unit_id = DonationUnit.objects.aggregate(m=Max("id"))["m"] or 0
+        workers = max(1, opts["workers"])
+        if workers == 1 or len(jobs) <= 1:
+            results = map(generate_chunk, jobs)
+            self._load_all(results, totals, started)
+        else:
+            # the forked workers only generate tuples; the DB connection stays in the parent
+            connections.close_all()
+            with Pool(processes=workers) as pool:
+                self._load_all(pool.imap(generate_chunk, jobs), totals, started)
+
+        self._generate_requests(opts, anchor_ts, totals)
+        eligibility.rebuild()  # donors' last donation / next eligible date, two UPDATEs
+        dashboard_cache.bump()  # everything above was bulk_create
+
+        elapsed = time.perf_counter() - started
+        rows = sum(totals.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Done in {elapsed:.1f}s: " + ", ".join(f"{v} {k}" for k, v in totals.items())
+            + f" ({rows / elapsed if elapsed else 0:,.0f} rows/s)."
+        ))
+
+    # ------------------------ loading ------------------------
+    def _load_all(self, results, totals, started):
+        for donors, units, events in results:
+            with transaction.atomic():
+                donor_map = upsert_donors(
+                    [{"national_id": n, "full_name": name, "date_of_birth": date.fromisoformat(dob)}
+                     for n, name, dob in donors],
+                    update_fields=("full_name", "date_of_birth"),
+                )
+                DonationUnit.objects.bulk_create(
+                    assign_dins([
+                        DonationUnit(
+                            donor_id=donor_map[nid],
+                            blood_type=bt,
+                            donation_date=_ts(donated),
+                            expiry_at=_ts(expiry),
+                            status=DonationUnit.Status.DISPENSED if dispensed else DonationUnit.Status.AVAILABLE,
+                            dispensed_at=_ts(dispensed) if dispensed else None,
+                        )
+                        for nid, bt, donated, expiry, dispensed in units
+                    ]),
+                    batch_size=DEFAULT_BATCH_SIZE,
+                )
+                AuditEvent.objects.bulk_create(
+                    [
+                        AuditEvent(role=Profile.Role.DONOR, action=action, details=details, created_at=_ts(ts))
+                        for action, ts, details in events
+                    ],
+                    batch_size=DEFAULT_BATCH_SIZE,
+                )
+            totals["donors"] += len(donors)
+            totals["units"] += len(units)
+            totals["events"] += len(events)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"{totals['donors']} donors, {totals['units']} units "
+                              f"({(totals['units'] + totals['donors']) / elapsed:,.0f} rows/s)")
+
+    def _generate_requests(self, opts, anchor_ts, totals):
+        """
+        Pending requests (recent, no units yet), then the approved ones: the
+        DISPENSED units generated above, grouped per blood type in dispense
+        order. Every approval gets its request, DispenseLog, lines and
+        Fulfilment rows, so sum(dispensed_map) == DISPENSED units.
+        """
+        rng = random.Random(f"{opts['seed']}:requests")
+        hospitals = [value.split("|", 1) for value, _ in HOSPITAL_CHOICES if value]
+        totals["requests"] = totals["logs"] = 0
+
+        requests, events = [], []
+        for _ in range(opts["pending"]):
+            name, city = rng.choice(hospitals)
+            bt = weighted_choice(rng, BLOOD_TYPE_WEIGHTS)
+            qty = rng.choice(QUANTITIES)
+            urgency = _urgency(rng)
+            created = _ts(anchor_ts - rng.random() * 3 * DAY)
+            requests.append(DispenseRequest(
+                hospital_name=name, hospital_city=city, urgency=urgency, requested_type=bt, quantity=qty,
+                plan={bt: qty}, status=DispenseRequest.Status.PENDING, created_at=created,
+            ))
+            events.append(_request_event(created, bt, qty, urgency, name))
+        with transaction.atomic():
+            DispenseRequest.objects.bulk_create(requests, batch_size=DEFAULT_BATCH_SIZE)
+            AuditEvent.objects.bulk_create(events, batch_size=DEFAULT_BATCH_SIZE)
+        totals["requests"] += len(requests)
+        totals["events"] += len(events)
+
+        for bt in BLOOD_TYPE_WEIGHTS:
+            units = (
+                DonationUnit.objects.filter(id__gt=self.last_unit_id, blood_type=bt,
+                                            status=DonationUnit.Status.DISPENSED)
+                .order_by("dispensed_at", "id").values_list("id", "dispensed_at", "expiry_at")
+            )
+            groups, group, want, first_expiry = [], [], 0, None
+            for unit_id, dispensed, expiry in units:
+                # one approval takes consecutive units and is dated at its last one,
+                # which must not be past the expiry of any unit in it
+                if group and (len(group) == want or dispensed > first_expiry):
+                    groups.append(group)
+                    group = []
+                if not group:
+                    want, first_expiry = rng.choice(QUANTITIES), expiry
+                group.append((unit_id, dispensed, expiry))
+                first_expiry = min(first_expiry, expiry)
+            if group:
+                groups.append(group)
+            for i in range(0, len(groups), DEFAULT_BATCH_SIZE):
+                self._write_approvals(bt, groups[i:i + DEFAULT_BATCH_SIZE], rng, hospitals, totals)
+
+    @staticmethod
+    def _write_approvals(bt, groups, rng, hospitals, totals):
+        requests, logs, events = [], [], []
+        for group in groups:
+            qty, approved = len(group), group[-1][1]
+            created = approved - timedelta(seconds=rng.random() * DAY)
+            name, city = rng.choice(hospitals)
+            urgency = _urgency(rng)
+            requests.append(DispenseRequest(
+                hospital_name=name, hospital_city=city, urgency=urgency, requested_type=bt, quantity=qty,
+                plan={bt: qty}, status=DispenseRequest.Status.APPROVED, created_at=created,
+            ))
+            logs.append(DispenseLog(requested_type=bt, quantity=qty, dispensed_map={bt: qty}, created_at=approved))
+            events.append(_request_event(created, bt, qty, urgency, name))
+            events.append(AuditEvent(
+                role=ADMIN_ROLE_LABEL, action="request_approved", created_at=approved,
+                details={"blood_type": bt, "qty": qty, "display_user": ADMIN_DISPLAY_NAME},
+            ))
+
+        with transaction.atomic():
+            requests = DispenseRequest.objects.bulk_create(requests, batch_size=DEFAULT_BATCH_SIZE)
+            logs = DispenseLog.objects.bulk_create(logs, batch_size=DEFAULT_BATCH_SIZE)
+            DispenseLine.objects.bulk_create(
+                [line for log, req in zip(logs, requests)
+                 for line in dispense_lines(log, hospital_name=req.hospital_name,
+                                            hospital_city=req.hospital_city, urgency=req.urgency)],
+                batch_size=DEFAULT_BATCH_SIZE,
+            )
+            Fulfilment.objects.bulk_create(
+                [Fulfilment(unit_id=unit_id, request=req, hospital_name=req.hospital_name, dispensed_at=log.created_at)
+                 for group, req, log in zip(groups, requests, logs) for unit_id, _, _ in group],
+                batch_size=DEFAULT_BATCH_SIZE,
+            )
+            # all units of an approval leave the shelf at the approval time
+            DonationUnit.objects.bulk_update(
+                [DonationUnit(id=unit_id, dispensed_at=log.created_at)
+                 for group, log in zip(groups, logs) for unit_id, _, _ in group],
+                ["dispensed_at"], batch_size=DEFAULT_BATCH_SIZE,
+            )
+            AuditEvent.objects.bulk_create(events, batch_size=DEFAULT_BATCH_SIZE)
+        totals["requests"] += len(requests)
+        totals["logs"] += len(logs)
+        totals["events"] += len(events)
+
+
+def _urgency(rng):
+    return DispenseRequest.Urgency.URGENT if rng.random() < 0.15 else DispenseRequest.Urgency.REGULAR
+
+
+def _request_event(created, bt, qty, urgency, hospital):
+    return AuditEvent(
+        role=Profile.Role.REQUESTER, action="dispense_request_created", created_at=created,
+        details={"blood_type": bt, "qty": qty, "urgency": urgency, "hospital": hospital},
+    )
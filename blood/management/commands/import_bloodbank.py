@@ -0,0 +1,294 @@
+# blood/management/commands/import_bloodbank.py
+import csv
+import json
+import time
+from datetime import datetime, time as dtime, timedelta
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from blood import cache as dashboard_cache, din, eligibility
+from blood.bulk import DEFAULT_BATCH_SIZE, dispense_lines, resolve_donors, upsert_donors
+from blood.models import DonationUnit, DispenseLine, DispenseLog, DispenseRequest, BLOOD_TYPES
+
+VALID_TYPES = {bt for bt, _ in BLOOD_TYPES}
+VALID_STATUSES = set(DonationUnit.Status.values)
+
+
+# ------------------------ input helpers ------------------------
+def _read_rows(path: Path):
+    """Stream dict rows from a .csv or .jsonl/.ndjson file without loading it whole."""
+    suffix = path.suffix.lower()
+    with path.open(encoding="utf-8", newline="") as fh:
+        if suffix == ".csv":
+            for row in csv.DictReader(fh):
+                yield {k.strip(): (v or "").strip() for k, v in row.items() if k}
+        elif suffix in (".jsonl", ".ndjson"):
+            for line in fh:
+                line = line.strip()
+                if line:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        yield line  # reported as a bad row, not as a failed import
+        else:
+            raise CommandError(f"Unsupported file type: {path.name} (use .csv or .jsonl)")
+
+
+def _chunks(iterable, size):
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _parse_dt(value):
+    """Accept ISO datetimes or plain dates; naive values are read in TIME_ZONE."""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        value = str(value).strip()
+        dt = parse_datetime(value)
+        if dt is None:
+            d = parse_date(value)
+            if d is None:
+                raise ValueError(f"bad date/time: {value!r}")
+            dt = datetime.combine(d, dtime.min)
+    if timezone.is_naive(dt):
+        dt = timezone.make_aware(dt)
+    return dt
+
+
+class Command(BaseCommand):
+    help = (
+        "Import historical donors, donations and dispense logs from CSV/JSONL files. "
+        "Donors are upserted by national_id; donations keep their original timestamps. "
+        "Re-running a file is safe: donations already present (same din, or same donor, "
+        "donation_date and blood_type) and identical dispense logs are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--donors", type=Path,
+                            help="Donors file: national_id, full_name[, date_of_birth]")
+        parser.add_argument("--donations", type=Path,
+                            help="Donations file: national_id, blood_type, donation_date"
+                                 "[, expiry_at, status, dispensed_at, din]")
+        parser.add_argument("--dispense-logs", type=Path,
+                            help="Dispense logs file: requested_type, quantity, dispensed_map, created_at "
+                                 "(optional: hospital_name, hospital_city, urgency)")
+        parser.add_argument("--chunk-size", type=int, default=5000,
+                            help="Rows per transaction / bulk statement (default: 5000)")
+
+    def handle(self, *args, **opts):
+        if not (opts["donors"] or opts["donations"] or opts["dispense_logs"]):
+            raise CommandError("Nothing to import: pass --donors, --donations and/or --dispense-logs.")
+        for key in ("donors", "donations", "dispense_logs"):
+            if opts[key] and not opts[key].exists():
+                raise CommandError(f"File not found: {opts[key]}")
+
+        chunk_size = max(1, opts["chunk_size"])
+        # national_id -> pk, filled by the donors pass and reused by donations
+        self.donor_map: dict[str, int] = {}
+
+        if opts["donors"]:
+            self._run("donors", opts["donors"], chunk_size, self._import_donors)
+        if opts["donations"]:
+            self._run("donations", opts["donations"], chunk_size, self._import_donations)
+            eligibility.rebuild()  # historical dates: recompute instead of per-row updates
+        if opts["dispense_logs"]:
+            self._run("dispense logs", opts["dispense_logs"], chunk_size, self._import_dispense_logs)
+
+    # ------------------------ driver ------------------------
+    def _run(self, label, path, chunk_size, import_chunk):
+        started = time.perf_counter()
+        written = skipped = 0
+        self.existing = 0
+        for chunk in _chunks(_read_rows(path), chunk_size):
+            rows = [row for row in chunk if isinstance(row, dict)]
+            for row in chunk:
+                if not isinstance(row, dict):
+                    self._skip(label, row, "not an object")
+            with transaction.atomic():
+                ok, bad = import_chunk(rows)
+            written += ok
+            skipped += bad + len(chunk) - len(rows)
+            dashboard_cache.bump("inventory")
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"{label}: {written} written, {skipped} skipped "
+                              f"({written / elapsed if elapsed else 0:,.0f} rows/s)")
+
+        elapsed = time.perf_counter() - started
+        rate = written / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Done {label}: {written} row(s) in {elapsed:.2f}s ({rate:,.0f} rows/s), {skipped} skipped, "
+            f"{self.existing} already imported."
+        ))
+
+    def _skip(self, label, row, err):
+        self.stderr.write(self.style.WARNING(f"{label}: skipping {row!r}: {err}"))
+
+    # ------------------------ per-file importers ------------------------
+    def _import_donors(self, rows):
+        # a file (or JSONL row) without a date_of_birth column keeps the stored one
+        with_dob, without_dob, bad = [], [], 0
+        for row in rows:
+            try:
+                nid = str(row.get("national_id") or "").strip()
+                name = str(row.get("full_name") or "").strip()
+                if not nid or not name:
+                    raise ValueError("national_id and full_name are required")
+                if "date_of_birth" not in row:
+                    without_dob.append({"national_id": nid, "full_name": name})
+                    continue
+                dob = row["date_of_birth"] or None
+                if dob and not hasattr(dob, "year"):
+                    dob = parse_date(str(dob).strip())
+                    if dob is None:
+                        raise ValueError(f"bad date_of_birth: {row['date_of_birth']!r}")
+                with_dob.append({"national_id": nid, "full_name": name, "date_of_birth": dob})
+            except ValueError as e:  # parse_date raises it too, for an impossible date
+                bad += 1
+                self._skip("donors", row, e)
+
+        for records, fields in ((with_dob, ("full_name", "date_of_birth")), (without_dob, ("full_name",))):
+            if records:
+                self.donor_map.update(upsert_donors(records, update_fields=fields))
+        return len(with_dob) + len(without_dob), bad
+
+    def _import_donations(self, rows):
+        # donors that were not part of --donors are resolved with one IN query per chunk
+        missing = {str(r.get("national_id") or "").strip() for r in rows} - self.donor_map.keys()
+        if missing:
+            self.donor_map.update(resolve_donors(missing))
+
+        expiry_days = getattr(settings, "RBC_EXPIRY_DAYS", 42)
+        units, bad = [], 0
+        for row in rows:
+            try:
+                nid = str(row.get("national_id") or "").strip()
+                donor_id = self.donor_map.get(nid)
+                if donor_id is None:
+                    raise ValueError(f"unknown donor {nid!r}")
+                bt = str(row.get("blood_type") or "").strip()
+                if bt not in VALID_TYPES:
+                    raise ValueError(f"bad blood type {bt!r}")
+                donated = _parse_dt(row.get("donation_date"))
+                if donated is None:
+                    raise ValueError("donation_date is required")
+                status = str(row.get("status") or DonationUnit.Status.AVAILABLE).strip().upper()
+                if status not in VALID_STATUSES:
+                    raise ValueError(f"bad status {status!r}")
+                units.append(DonationUnit(
+                    donor_id=donor_id,
+                    blood_type=bt,
+                    donation_date=donated,
+                    expiry_at=_parse_dt(row.get("expiry_at")) or donated + timedelta(days=expiry_days),
+                    status=status,
+                    dispensed_at=_parse_dt(row.get("dispensed_at")),
+                    # keep the donation number of the source system when it has one
+                    din=din.parse(row["din"]) if row.get("din") else None,
+                ))
+            except ValueError as e:
+                bad += 1
+                self._skip("donations", row, e)
+
+        units = din.assign(self._new_units(units))
+        # ignore_conflicts drops rows a concurrent writer stored first: count what was inserted
+        stored = DonationUnit.objects.filter(din__in=[u.din for u in units])
+        before = stored.count() if units else 0
+        DonationUnit.objects.bulk_create(units, batch_size=DEFAULT_BATCH_SIZE, ignore_conflicts=True)
+        din.reserve_imported(u.din for u in units)
+        return (stored.count() - before if units else 0), bad
+
+    def _new_units(self, units):
+        """
+        Drop units that are already stored (or repeated in the chunk): same din,
+        or same donor, donation_date and blood_type. Two IN queries per chunk.
+        """
+        dins = {u.din for u in units if u.din}
+        seen_dins = set(DonationUnit.objects.filter(din__in=dins).values_list("din", flat=True)) if dins else set()
+        seen_keys = set(
+            DonationUnit.objects.filter(
+                donor_id__in={u.donor_id for u in units}, donation_date__in={u.donation_date for u in units},
+            ).values_list("donor_id", "donation_date", "blood_type")
+        ) if units else set()
+        out = []
+        for unit in units:
+            key = (unit.donor_id, unit.donation_date, unit.blood_type)
+            if key in seen_keys or (unit.din and unit.din in seen_dins):
+                self.existing += 1
+                continue
+            seen_keys.add(key)
+            if unit.din:
+                seen_dins.add(unit.din)
+            out.append(unit)
+        return out
+
+    def _import_dispense_logs(self, rows):
+        logs, hospitals, bad = [], [], 0
+        for row in rows:
+            try:
+                rt = str(row.get("requested_type") or "").strip()
+                if rt not in VALID_TYPES:
+                    raise ValueError(f"bad requested type {rt!r}")
+                qty = int(row.get("quantity") or 0)
+                if qty <= 0:
+                    raise ValueError("quantity must be positive")
+                dmap = row.get("dispensed_map") or {}
+                if isinstance(dmap, str):
+                    dmap = json.loads(dmap)
+                if not isinstance(dmap, dict):
+                    raise ValueError("dispensed_map must be an object")
+                created = _parse_dt(row.get("created_at"))
+                if created is None:
+                    raise ValueError("created_at is required")
+                urgency = str(row.get("urgency") or "").strip().upper()
+                if urgency and urgency not in DispenseRequest.Urgency.values:
+                    raise ValueError(f"bad urgency {urgency!r}")
+                logs.append(DispenseLog(requested_type=rt, quantity=qty,
+                                        dispensed_map=dmap, created_at=created))
+                # optional columns: hospital of the request (for the analytics line items)
+                hospitals.append({
+                    "hospital_name": str(row.get("hospital_name") or "").strip(),
+                    "hospital_city": str(row.get("hospital_city") or "").strip(),
+                    "urgency": urgency,
+                })
+            except ValueError as e:  # json.JSONDecodeError is a ValueError too
+                bad += 1
+                self._skip("dispense logs", row, e)
+
+        logs, hospitals = self._new_logs(logs, hospitals)
+        DispenseLog.objects.bulk_create(logs, batch_size=DEFAULT_BATCH_SIZE)
+        DispenseLine.objects.bulk_create(
+            [line for log, hospital in zip(logs, hospitals) for line in dispense_lines(log, **hospital)],
+            batch_size=DEFAULT_BATCH_SIZE,
+        )
+        return len(logs), bad
+
+    def _new_logs(self, logs, hospitals):
+        """Drop logs already stored (or repeated in the chunk): same time, type, quantity and map. One IN query."""
+        key = lambda created, rt, qty, dmap: (created, rt, qty, json.dumps(dmap, sort_keys=True))
+        seen = {
+            key(*values) for values in DispenseLog.objects.filter(
+                created_at__in={log.created_at for log in logs}
+            ).values_list("created_at", "requested_type", "quantity", "dispensed_map")
+        } if logs else set()
+        out_logs, out_hospitals = [], []
+        for log, hospital in zip(logs, hospitals):
+            k = key(log.created_at, log.requested_type, log.quantity, log.dispensed_map)
+            if k in seen:
+                self.existing += 1
+                continue
+            seen.add(k)
+            out_logs.append(log)
+            out_hospitals.append(hospital)
+        return out_logs, out_hospitals
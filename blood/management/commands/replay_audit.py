@@ -0,0 +1,292 @@
+# blood/management/commands/replay_audit.py
+import logging
+import queue
+import threading
+import time
+import zlib
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from blood.benchmarking import (
+    BENCH_DONOR, BENCH_PASSWORD, BENCH_REQUESTER, ensure_bench_users, summarize, write_results,
+)
+from blood.forms import HOSPITAL_CHOICES
+from blood.models import AuditEvent, DispenseRequest, DonationUnit
+
+HOSPITALS = {value.split("|", 1)[0]: value for value, _ in HOSPITAL_CHOICES if value}
+
+
+# ------------------------ one replayed session ------------------------
+def _session_key(event):
+    return event.session_key or f"event-{event.pk}"
+
+
+class ReplaySession:
+    """
+    One original session (AuditEvent.session_key) -> one test client, so login
+    and portal state carry over between its events. Setup work (logging the
+    bench user in, creating the request to approve...) is not timed.
+    """
+
+    def __init__(self, users):
+        self.client = Client(SERVER_NAME="localhost")
+        self.users = users
+        self.user = None
+
+    def as_user(self, persona):
+        if self.user != persona:
+            self.client.force_login(self.users[persona])
+            self.user = persona
+
+    def timed(self, method, path, data=None):
+        started = time.perf_counter()
+        resp = getattr(self.client, method)(path, data or {})
+        return (time.perf_counter() - started) * 1000, resp.status_code < 500
+
+    # action -> (latency_ms, ok), or None when the event cannot be replayed
+    def replay(self, event):
+        handler = getattr(self, f"do_{event.action.lower()}", None)
+        return handler(event) if handler else None
+
+    def do_signup(self, event):
+        # do not create accounts: replay the page load only
+        return self.timed("get", reverse("signup"))
+
+    def do_login(self, event):
+        username = BENCH_REQUESTER if event.role == "REQUESTER" else BENCH_DONOR
+        ms, ok = self.timed("post", reverse("login"), {"username": username, "password": BENCH_PASSWORD})
+        self.user = "requester" if username == BENCH_REQUESTER else "donor"
+        return ms, ok
+
+    def do_logout(self, event):
+        self.user = None
+        return self.timed("post", reverse("logout"))
+
+    def do_donation_create(self, event):
+        self.as_user("donor")
+        return self.timed("post", reverse("intake"))
+
+    def do_dispense_request_created(self, event):
+        self.as_user("requester")
+        return self.timed("post", reverse("dispense"), {
+            "urgency": event.details.get("urgency") or DispenseRequest.Urgency.REGULAR,
+            "hospital": HOSPITALS.get(event.details.get("hospital"), next(iter(HOSPITALS.values()))),
+            "blood_type": event.details.get("blood_type") or "O+",
+            "quantity": event.details.get("qty") or 1,
+        })
+
+    do_dispense_request_failed = do_dispense_request_created
+
+    def _new_request(self, event):
+        return DispenseRequest.objects.create(
+            hospital_name="Replay", requested_type=event.details.get("blood_type") or "O+",
+            quantity=event.details.get("qty") or 1,
+        )
+
+    def do_request_approved(self, event):
+        req = self._new_request(event)
+        return self.timed("post", reverse("request_approve", args=[req.pk]),
+                          {"portal_password": settings.PORTAL_PASSWORD})
+
+    do_request_approve_failed = do_request_approved
+
+    def do_request_rejected(self, event):
+        req = self._new_request(event)
+        return self.timed("post", reverse("request_reject", args=[req.pk]))
+
+    def do_donation_delete(self, event):
+        unit = (DonationUnit.objects.filter(status=DonationUnit.Status.AVAILABLE,
+                                            blood_type=event.details.get("blood_type") or "O+")
+                .order_by("id").first())
+        if unit is None:
+            return None
+        return self.timed("post", reverse("donation_delete", args=[unit.pk]),
+                          {"portal_password": settings.PORTAL_PASSWORD})
+
+    def do_portal_login(self, event):
+        # the manager logs in and lands on the records page
+        login_ms, ok = self.timed("post", reverse("portal_login"), {"password": settings.PORTAL_PASSWORD})
+        page_ms, page_ok = self.timed("get", reverse("records"))
+        return login_ms + page_ms, ok and page_ok
+
+    def do_portal_logout(self, event):
+        return self.timed("get", reverse("portal_logout"))
+
+
+def _parse_when(value):
+    parsed = datetime.fromisoformat(value)
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
+# ------------------------ command ------------------------
+class Command(BaseCommand):
+    help = (
+        "Replay a window of the audit log as a time-scaled workload: every event is sent to the "
+        "view that produced it, at its original offset divided by --speed. Reports latency per "
+        "action, how late the replay ran against the original timeline, and latency per time "
+        "bucket of the original window. Writes to the database — run it against a copy."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--on-copy", action="store_true",
+                            help="Required: confirm that this database is a disposable copy")
+        parser.add_argument("--since", default="",
+                            help="Window start, ISO date/time (default: --until minus 24 hours)")
+        parser.add_argument("--until", default="", help="Window end, ISO date/time (default: now)")
+        parser.add_argument("--speed", type=float, default=1.0,
+                            help="Time scale: 10 replays the window 10x faster (default: 1)")
+        parser.add_argument("--max-idle", type=float, default=0,
+                            help="Cap gaps between events at this many original seconds (default: no cap)")
+        parser.add_argument("--limit", type=int, default=0, help="Replay at most this many events")
+        parser.add_argument("--concurrency", type=int, default=8,
+                            help="Worker threads; bounds the requests in flight (default: 8)")
+        parser.add_argument("--bucket-seconds", type=int, default=60,
+                            help="Timeline bucket size in original seconds (default: 60)")
+        parser.add_argument("--output", default="", help="Write results as JSON to this path")
+
+    def handle(self, *args, **opts):
+        if not opts["on_copy"]:
+            raise CommandError(
+                "replay_audit re-executes approvals, deletions and requests. "
+                "Run it against a copy of the database and pass --on-copy."
+            )
+        if opts["speed"] <= 0:
+            raise CommandError("--speed must be > 0")
+        try:
+            until = _parse_when(opts["until"]) if opts["until"] else timezone.now()
+            since = _parse_when(opts["since"]) if opts["since"] else until - timedelta(hours=24)
+        except ValueError as e:
+            raise CommandError(f"Bad --since/--until: {e}")
+
+        events = AuditEvent.objects.filter(created_at__gte=since, created_at__lt=until).order_by("created_at", "id")
+        if opts["limit"]:
+            events = events[:opts["limit"]]
+        events = list(events)  # the replay writes new audit rows — fix the window first
+        if not events:
+            raise CommandError(f"No audit events between {since:%Y-%m-%d %H:%M} and {until:%Y-%m-%d %H:%M}.")
+
+        schedule = self._schedule(events, opts["speed"], opts["max_idle"])
+        self.stdout.write(f"Replaying {len(events)} event(s) from {events[0].created_at:%Y-%m-%d %H:%M:%S} "
+                          f"over {schedule[-1][0]:.1f}s at {opts['speed']}x...")
+        results, wall = self._run(schedule, max(1, opts["concurrency"]))
+        report = self._report(results, wall, opts, since, until, len(events))
+        self._print(report)
+        if opts["output"]:
+            path = write_results(opts["output"], report)
+            self.stdout.write(self.style.SUCCESS(f"Saved results to {path}"))
+
+    @staticmethod
+    def _schedule(events, speed, max_idle):
+        """:return: [(seconds after start, original offset in seconds, event)]"""
+        out, replay_at, previous = [], 0.0, events[0].created_at
+        for event in events:
+            gap = (event.created_at - previous).total_seconds()
+            if max_idle:
+                gap = min(gap, max_idle)
+            replay_at += gap / speed
+            out.append((replay_at, (event.created_at - events[0].created_at).total_seconds(), event))
+            previous = event.created_at
+        return out
+
+    def _run(self, schedule, concurrency):
+        # 4xx/5xx of replayed requests are counted below, not logged one by one
+        logging.getLogger("django.request").setLevel(logging.CRITICAL)
+        donor, requester = ensure_bench_users()
+        users = {"donor": donor, "requester": requester}
+        results, results_lock = [], threading.Lock()
+        # one queue per worker, sessions sharded by key: a session's events run on
+        # one thread, in their original order
+        queues = [queue.Queue() for _ in range(concurrency)]
+
+        def worker(work):
+            sessions = {}  # only this thread sees these sessions
+            try:
+                while (item := work.get()) is not None:
+                    due, offset, event = item
+                    key = _session_key(event)
+                    session = sessions.get(key) or sessions.setdefault(key, ReplaySession(users))
+                    lag = time.perf_counter() - due
+                    try:
+                        outcome = session.replay(event)
+                    except Exception:  # a failing replay step must not stop the others
+                        outcome = (None, False)
+                    with results_lock:
+                        results.append((event.action, offset, lag, outcome))
+            finally:
+                connection.close()
+
+        # every replayed donation comes from the one bench donor: no donation interval
+        with override_settings(DONATION_INTERVAL_DAYS=0):
+            threads = [threading.Thread(target=worker, args=(work,), daemon=True) for work in queues]
+            for t in threads:
+                t.start()
+            started = time.perf_counter()
+            for replay_at, offset, event in schedule:
+                delay = started + replay_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                shard = zlib.crc32(_session_key(event).encode()) % concurrency
+                queues[shard].put((started + replay_at, offset, event))
+            for work in queues:
+                work.put(None)
+            for t in threads:
+                t.join()
+        return results, time.perf_counter() - started
+
+    def _report(self, results, wall, opts, since, until, n_events):
+        by_action = defaultdict(lambda: {"latencies": [], "errors": 0, "skipped": 0})
+        buckets = defaultdict(list)
+        lags = []
+        for action, offset, lag, outcome in results:
+            row = by_action[action]
+            lags.append(round(lag * 1000, 3))
+            if outcome is None:
+                row["skipped"] += 1
+            elif not outcome[1]:
+                row["errors"] += 1
+            else:
+                row["latencies"].append(round(outcome[0], 3))
+                buckets[int(offset // opts["bucket_seconds"])].append(outcome[0])
+
+        actions = {}
+        for action, row in sorted(by_action.items()):
+            actions[action] = summarize(row["latencies"], errors=row["errors"])
+            actions[action]["skipped"] = row["skipped"]
+        timeline = [
+            {"offset_s": b * opts["bucket_seconds"], "count": len(lat),
+             "p50_ms": summarize(lat)["p50_ms"], "p95_ms": summarize(lat)["p95_ms"]}
+            for b, lat in sorted(buckets.items())
+        ]
+        return {
+            "benchmark": "replay_audit",
+            "database": connection.vendor,
+            "window": {"since": since.isoformat(), "until": until.isoformat(), "events": n_events},
+            "speed": opts["speed"],
+            "max_idle_s": opts["max_idle"],
+            "concurrency": opts["concurrency"],
+            "wall_seconds": round(wall, 3),
+            "schedule_lag": summarize(lags),
+            "actions": actions,
+            "timeline": timeline,
+        }
+
+    def _print(self, r):
+        fmt = lambda v: f"{v:.1f}" if v is not None else "-"
+        self.stdout.write(f"\n{'action':<26}{'n':>6}{'err':>5}{'skip':>6}{'p50':>9}{'p95':>9}{'p99':>9}")
+        for action, s in r["actions"].items():
+            self.stdout.write(f"{action:<26}{s['count']:>6}{s['errors']:>5}{s['skipped']:>6}"
+                              f"{fmt(s['p50_ms']):>9}{fmt(s['p95_ms']):>9}{fmt(s['p99_ms']):>9}")
+        lag = r["schedule_lag"]
+        self.stdout.write(f"\nSchedule lag p50/p95/max: {fmt(lag['p50_ms'])} / {fmt(lag['p95_ms'])} / "
+                          f"{fmt(lag['max_ms'])} ms   (wall {r['wall_seconds']}s)")
+        self.stdout.write(f"\n{'original offset':<18}{'n':>6}{'p50':>9}{'p95':>9}")
+        for b in r["timeline"]:
+            self.stdout.write(f"{'+' + str(timedelta(seconds=b['offset_s'])):<18}{b['count']:>6}"
+                              f"{fmt(b['p50_ms']):>9}{fmt(b['p95_ms']):>9}")
@@ -0,0 +1,49 @@
+# blood/management/commands/rollup_inventory.py
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from blood import cache as dashboard_cache
+from blood.rollups import pending_days, rollup_day
+
+
+def _parse_day(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Expected a date like 2025-01-31, got {value!r}")
+
+
+class Command(BaseCommand):
+    help = (
+        "Roll DonationUnit up into daily per-type InventorySnapshot rows. Incremental: "
+        "only days after the last rolled-up one are processed (up to yesterday). "
+        "Safe to run again; schedule it daily (e.g. cron at 00:10)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", default="",
+                            help="Recompute from this day (YYYY-MM-DD), overwriting stored days")
+        parser.add_argument("--until", default="",
+                            help="Last day to roll up (default: yesterday; today is never closed)")
+
+    def handle(self, *args, **opts):
+        yesterday = timezone.localdate() - timedelta(days=1)
+        until = _parse_day(opts["until"]) if opts["until"] else yesterday
+        if until > yesterday:
+            raise CommandError("Only closed days can be rolled up (--until must be before today).")
+
+        if opts["since"]:
+            since = _parse_day(opts["since"])
+            days = [since + timedelta(days=i) for i in range((until - since).days + 1)]
+        else:
+            days = pending_days(until)
+
+        if not days:
+            self.stdout.write("Nothing to roll up.")
+            return
+        for day in days:
+            rollup_day(day)
+        dashboard_cache.bump("rollups")
+        self.stdout.write(self.style.SUCCESS(f"Rolled up {len(days)} day(s): {days[0]} .. {days[-1]}"))
@@ -3,6 +3,7 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import timedelta
 
+from blood import cache as dashboard_cache
 from blood.models import Donor, DonationUnit, BLOOD_TYPES
 
 class Command(BaseCommand):
@@ -14,7 +15,8 @@ class Command(BaseCommand):
         parser.add_argument("--expiry-days", type=int, default=42,
                             help="Expiry offset in days for seeded units (default: 42)")
         parser.add_argument("--reset", action="store_true",
-                            help="Delete all DonationUnit records before seeding")
+                            help="Delete all DonationUnit records before seeding "
+                                 "(except units dispensed to a request: their Fulfilment keeps them)")
 
     def handle(self, *args, **opts):
         per_type = opts["per_type"]
@@ -22,8 +24,8 @@ class Command(BaseCommand):
         do_reset = opts["reset"]
 
         if do_reset:
-            self.stdout.write(self.style.WARNING("Deleting ALL DonationUnit records..."))
-            DonationUnit.objects.all().delete()
+            self.stdout.write(self.style.WARNING("Deleting ALL DonationUnit records (except fulfilled ones)..."))
+            DonationUnit.objects.filter(fulfilment__isnull=True).delete()
 
         # Seed donor (technical)
         seed_donor, _ = Donor.objects.get_or_create(
@@ -55,4 +57,6 @@ class Command(BaseCommand):
             created_total += to_add
             self.stdout.write(self.style.SUCCESS(f"{bt}: added {to_add} units (now target={per_type})."))
 
+        if created_total:
+            dashboard_cache.bump("inventory")
         self.stdout.write(self.style.SUCCESS(f"Done. Created {created_total} unit(s) total."))
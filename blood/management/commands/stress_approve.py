@@ -0,0 +1,272 @@
+# blood/management/commands/stress_approve.py
+import multiprocessing
+import random
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+
+REQUEST_TYPES = ("O-", "O+", "A+", "B+", "AB+", "A-")
+
+
+def _approve_worker(job):
+    """
+    One stress process: creates dispense requests and approves them through the
+    test client, retrying on "Inventory changed" and on lock errors.
+    Top-level so it also works with spawn.
+    """
+    index, tag, approvals, max_retries, max_quantity, seed = job
+
+    import logging
+
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+    # lock errors are counted below; keep django.request from printing each traceback
+    logging.getLogger("django.request").setLevel(logging.CRITICAL)
+
+    from django.conf import settings
+    from django.db import OperationalError, connections
+    from django.test import Client
+    from django.urls import reverse
+    from django.utils import timezone
+
+    from blood.models import AuditEvent, DispenseRequest
+
+    rng = random.Random(f"{seed}:{tag}:{index}")
+    client = Client(SERVER_NAME="localhost", raise_request_exception=True)
+    stats = {"approved": 0, "insufficient": 0, "failed": 0,
+             "retries": {"inventory_changed": 0, "locked": 0}, "latencies_ms": []}
+
+    def attempt(req):
+        """:return: "approved" | "inventory_changed" | "insufficient" | "locked" """
+        attempt_started = timezone.now()
+        try:
+            client.post(reverse("request_approve", args=[req.pk]),
+                        {"portal_password": settings.PORTAL_PASSWORD})
+            if DispenseRequest.objects.filter(pk=req.pk, status=DispenseRequest.Status.APPROVED).exists():
+                return "approved"
+            # only this attempt's failure: earlier attempts logged theirs too
+            if AuditEvent.objects.filter(action="request_approve_failed", details__req_id=req.pk,
+                                         created_at__gte=attempt_started).exists():
+                return "inventory_changed"
+            return "insufficient"
+        except OperationalError:
+            return "locked"
+
+    try:
+        for _ in range(approvals):
+            try:
+                req = DispenseRequest.objects.create(
+                    hospital_name=f"Stress {tag}",
+                    requested_type=rng.choice(REQUEST_TYPES),
+                    quantity=rng.randint(1, max_quantity),
+                )
+            except OperationalError:
+                stats["failed"] += 1
+                continue
+
+            started = time.perf_counter()
+            for try_no in range(max_retries + 1):
+                outcome = attempt(req)
+                if outcome in ("approved", "insufficient"):
+                    break
+                if try_no < max_retries:
+                    stats["retries"][outcome] += 1
+                    time.sleep(rng.uniform(0, 0.01 * (try_no + 1)))  # jittered backoff
+            else:
+                outcome = "failed"
+            stats[outcome] += 1
+            if outcome == "approved":
+                stats["latencies_ms"].append((time.perf_counter() - started) * 1000)
+    finally:
+        connections.close_all()
+    return stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Parallel request_approve stress test: N processes create and approve dispense requests "
+        "against the shared database, for each concurrency level. Afterwards it checks that no "
+        "unit was dispensed twice (DispenseLog.dispensed_map vs. units marked DISPENSED, and "
+        "no unit has two Fulfilment rows) and reports throughput, retries and failures."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", default="1,2,4,8",
+                            help="Comma-separated process counts to run (default: 1,2,4,8)")
+        parser.add_argument("--approvals", type=int, default=50,
+                            help="Requests each process creates and approves (default: 50)")
+        parser.add_argument("--stock", type=int, default=200,
+                            help="AVAILABLE units per blood type before every level (default: 200). "
+                                 "Keep it low enough that processes compete for the same units.")
+        parser.add_argument("--max-quantity", type=int, default=4,
+                            help="Units per request, drawn from 1..N (default: 4)")
+        parser.add_argument("--max-retries", type=int, default=5,
+                            help="Retries per request on a conflict or lock error (default: 5)")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--output", default="", help="Write results as JSON to this path")
+
+    def handle(self, *args, **opts):
+        from django.conf import settings
+        from django.db import connection, connections
+
+        from blood.benchmarking import summarize, write_results
+
+        if connection.vendor == "sqlite" and str(settings.DATABASES["default"]["NAME"]) == ":memory:":
+            raise CommandError("Use a file-backed SQLite database (or PostgreSQL).")
+        try:
+            levels = [int(v) for v in opts["concurrency"].split(",") if v.strip()]
+        except ValueError:
+            raise CommandError("--concurrency takes comma-separated integers, e.g. 1,2,4,8")
+        if not levels or min(levels) < 1:
+            raise CommandError("--concurrency levels must be >= 1")
+
+        self.stdout.write(f"Database: {connection.vendor}"
+                          + (" (SQLITE_PRODUCTION)" if getattr(settings, "SQLITE_PRODUCTION", False) else ""))
+        results, all_ok = {}, True
+        for level in levels:
+            self._top_up(opts["stock"])
+            before = self._state()
+            tag = uuid.uuid4().hex[:8]
+            jobs = [(i, tag, opts["approvals"], opts["max_retries"], opts["max_quantity"], opts["seed"])
+                    for i in range(level)]
+            connections.close_all()  # never share the parent's connection with the workers
+
+            started = time.perf_counter()
+            with multiprocessing.Pool(processes=level) as pool:
+                outcomes = pool.map(_approve_worker, jobs)
+            wall = time.perf_counter() - started
+
+            result = self._aggregate(outcomes, wall, summarize)
+            result["invariants"] = self._check(before, result["approved"])
+            all_ok &= not result["invariants"]["violations"]
+            self._cleanup(tag)
+            results[str(level)] = result
+            self._print(level, result)
+
+        if opts["output"]:
+            path = write_results(opts["output"], {
+                "benchmark": "stress_approve",
+                "database": connection.vendor,
+                "approvals_per_process": opts["approvals"],
+                "stock_per_type": opts["stock"],
+                "levels": results,
+            })
+            self.stdout.write(self.style.SUCCESS(f"Saved results to {path}"))
+        if not all_ok:
+            raise CommandError("Invariant violations found (see above).")
+
+    # ------------------------ database state ------------------------
+    def _top_up(self, per_type):
+        """Bring every blood type back to `per_type` AVAILABLE units (so each level starts equal)."""
+        from datetime import timedelta
+
+        from django.db.models import Count, Q
+        from django.utils import timezone
+
+        from blood.models import BLOOD_TYPES, DonationUnit, Donor
+
+        now = timezone.now()
+        donor, _ = Donor.objects.get_or_create(national_id="000000001", defaults={"full_name": "Seed Stock"})
+        available = dict(
+            DonationUnit.objects.filter(status=DonationUnit.Status.AVAILABLE)
+            .filter(Q(expiry_at__isnull=True) | Q(expiry_at__gt=now))
+            .values_list("blood_type").annotate(n=Count("id"))
+        )
+        units = [
+            DonationUnit(donor=donor, blood_type=bt, status=DonationUnit.Status.AVAILABLE,
+                         expiry_at=now + timedelta(days=42))
+            for bt, _ in BLOOD_TYPES
+            for _ in range(max(0, per_type - available.get(bt, 0)))
+        ]
+        DonationUnit.objects.bulk_create(units, batch_size=1000)
+
+    @staticmethod
+    def _state():
+        from django.db.models import Count, Max
+
+        from blood.models import DispenseLog, DonationUnit, Fulfilment
+
+        return {
+            "dispensed": dict(
+                DonationUnit.objects.filter(status=DonationUnit.Status.DISPENSED)
+                .values_list("blood_type").annotate(n=Count("id"))
+            ),
+            "last_log_id": DispenseLog.objects.aggregate(m=Max("id"))["m"] or 0,
+            "last_fulfilment_id": Fulfilment.objects.aggregate(m=Max("id"))["m"] or 0,
+        }
+
+    def _check(self, before, approved):
+        """
+        Each approval writes one DispenseLog whose dispensed_map must match the
+        units that moved to DISPENSED during the level, type by type. A unit taken
+        by two approvals shows up as fewer DISPENSED units than the logs claim, and
+        as a unit with more than one Fulfilment row.
+        """
+        from django.db.models import Count
+
+        from blood.models import DispenseLog, Fulfilment
+
+        after = self._state()
+        logs = list(DispenseLog.objects.filter(id__gt=before["last_log_id"])
+                    .values_list("quantity", "dispensed_map"))
+        claimed = {}
+        violations = []
+        for quantity, dispensed_map in logs:
+            if sum(dispensed_map.values()) != quantity:
+                violations.append(f"log for {quantity} units dispensed {sum(dispensed_map.values())}")
+            for bt, n in dispensed_map.items():
+                claimed[bt] = claimed.get(bt, 0) + n
+        for bt in sorted(set(claimed) | set(after["dispensed"])):
+            moved = after["dispensed"].get(bt, 0) - before["dispensed"].get(bt, 0)
+            if moved != claimed.get(bt, 0):
+                violations.append(f"{bt}: {moved} units marked DISPENSED, logs claim {claimed.get(bt, 0)}")
+        if len(logs) != approved:
+            violations.append(f"{approved} approvals seen by the clients, {len(logs)} dispense logs written")
+        fulfilled = Fulfilment.objects.filter(id__gt=before["last_fulfilment_id"])
+        if fulfilled.count() != sum(claimed.values()):
+            violations.append(f"{fulfilled.count()} fulfilment rows, logs claim {sum(claimed.values())} units")
+        twice = (Fulfilment.objects.filter(unit_id__in=fulfilled.values("unit_id"))
+                 .values("unit_id").annotate(n=Count("id")).filter(n__gt=1))
+        for row in twice:
+            violations.append(f"unit {row['unit_id']} has {row['n']} fulfilment rows")
+        return {"dispense_logs": len(logs), "units_dispensed": sum(claimed.values()), "violations": violations}
+
+    @staticmethod
+    def _cleanup(tag):
+        """Drop the level's requests that were never fulfilled; approved ones keep their Fulfilment rows."""
+        from blood.models import DispenseRequest
+        DispenseRequest.objects.filter(hospital_name=f"Stress {tag}", fulfilments__isnull=True).delete()
+
+    # ------------------------ report ------------------------
+    @staticmethod
+    def _aggregate(outcomes, wall, summarize):
+        latencies = [ms for stats in outcomes for ms in stats["latencies_ms"]]
+        totals = {key: sum(stats[key] for stats in outcomes) for key in ("approved", "insufficient", "failed")}
+        retries = {key: sum(stats["retries"][key] for stats in outcomes) for key in ("inventory_changed", "locked")}
+        return {
+            **totals,
+            "retries": retries,
+            "wall_seconds": round(wall, 3),
+            "approvals_per_second": round(totals["approved"] / wall, 2) if wall else None,
+            "latency": summarize([round(ms, 3) for ms in latencies]),
+        }
+
+    def _print(self, level, r):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\nConcurrency {level}"))
+        self.stdout.write(f"  approved {r['approved']}  insufficient {r['insufficient']}  failed {r['failed']}"
+                          f"   ({r['approvals_per_second'] or 0:.1f} approvals/s)")
+        self.stdout.write(f"  retries: inventory changed {r['retries']['inventory_changed']}, "
+                          f"locked {r['retries']['locked']}")
+        s = r["latency"]
+        if s["count"]:
+            self.stdout.write(f"  latency p50/p95/p99: {s['p50_ms']:.1f} / {s['p95_ms']:.1f} / {s['p99_ms']:.1f} ms")
+        inv = r["invariants"]
+        if inv["violations"]:
+            for v in inv["violations"]:
+                self.stdout.write(self.style.ERROR(f"  VIOLATION: {v}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"  invariants OK: {inv['dispense_logs']} logs, {inv['units_dispensed']} units, no double dispense"))
@@ -0,0 +1,48 @@
+# blood/management/commands/warm_cache.py
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.base import SessionBase
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+from django.urls import reverse
+
+from blood import cache as dashboard_cache
+from blood.views import _inventory_context
+
+
+class Command(BaseCommand):
+    help = (
+        "Pre-render the cached inventory dashboard fragments (inventory table, pending "
+        "requests, first audit pages) — run after deploys or cache flushes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--audit-pages", type=int, default=1,
+                            help="Audit log pages to pre-render (default: 1)")
+        parser.add_argument("--reset", action="store_true",
+                            help="Bump all cache versions first (drop the old fragments)")
+
+    def handle(self, *args, **opts):
+        backend = settings.CACHES["default"]["BACKEND"]
+        if backend.endswith("LocMemCache"):
+            self.stdout.write(self.style.WARNING(
+                "LocMemCache is per process: warming from a management command does not reach "
+                "the web workers. Use a file or Redis CACHE_URL."
+            ))
+        if opts["reset"]:
+            dashboard_cache.bump()
+
+        factory = RequestFactory()
+        started = time.perf_counter()
+        for page in range(1, max(1, opts["audit_pages"]) + 1):
+            request = factory.get(reverse("inventory"), {"epage": page})
+            request.user = AnonymousUser()
+            request.session = SessionBase()
+            render_to_string("blood/inventory_dashboard.html", _inventory_context(request), request=request)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Warmed dashboard cache ({opts['audit_pages']} audit page(s)) in {elapsed * 1000:.0f} ms."
+        ))
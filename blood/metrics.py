@@ -0,0 +1,255 @@
+# blood/metrics.py
+"""
+In-process metrics (counters + histograms) rendered in the Prometheus text format.
+
+Every worker process keeps its own numbers and, when METRICS_DIR is set, a
+background thread dumps them to METRICS_DIR/metrics-<pid>-<instance>.json every
+METRICS_FLUSH_SECONDS; /metrics merges all the files, so any worker can answer
+for the whole deployment. Files not refreshed for STALE_FLUSHES intervals belong
+to dead workers and are removed. A forked child starts from zero.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (1_000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000)
+
+# name -> (type, help, buckets)
+METRICS = {
+    "bloodbank_http_requests_total": ("counter", "HTTP requests by view, method and status.", None),
+    "bloodbank_http_request_duration_seconds": ("histogram", "Request latency by view.", LATENCY_BUCKETS),
+    "bloodbank_http_response_size_bytes": ("histogram", "Response body size by view.", SIZE_BUCKETS),
+    "bloodbank_db_queries_per_request": ("histogram", "SQL queries per request by view.", QUERY_BUCKETS),
+    "bloodbank_db_query_seconds_total": ("counter", "Total time spent in SQL by view.", None),
+    # request_approve (see views._record_dispense)
+    "bloodbank_dispense_transactions_total": ("counter", "Dispense approvals by outcome.", None),
+    "bloodbank_dispense_lock_seconds": ("histogram", "Time in the UPDATEs that wait for row locks.", LATENCY_BUCKETS),
+    "bloodbank_dispense_transaction_seconds": ("histogram", "Dispense transaction duration.", LATENCY_BUCKETS),
+    "bloodbank_dispense_rows_skipped_total": ("counter", "Planned unit rows locked or taken by another transaction.", None),
+}
+
+STALE_FLUSHES = 3  # a worker file older than this many flush intervals is from a dead worker
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+_instance = uuid.uuid4().hex[:8]  # a reused pid does not take over a dead worker's file
+_flusher = None
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    buckets = METRICS[name][2]
+    key = _key(name, labels)
+    with _lock:
+        counts = _histograms.get(key)
+        if counts is None:
+            counts = _histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+        counts[bisect_left(buckets, value)] += 1  # per-bucket (not cumulative) counts
+        counts[-1] += value
+
+
+def snapshot():
+    with _lock:
+        return {
+            "counters": [[name, list(labels), value] for (name, labels), value in _counters.items()],
+            "histograms": [[name, list(labels), list(counts)] for (name, labels), counts in _histograms.items()],
+        }
+
+
+def reset():
+    """Forget everything recorded in this process (tests)."""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+# ------------------------ multi-worker files ------------------------
+def _metrics_dir():
+    path = getattr(settings, "METRICS_DIR", "")
+    return Path(path) if path else None
+
+
+def _flush_interval():
+    return getattr(settings, "METRICS_FLUSH_SECONDS", 5)
+
+
+def worker_file(directory):
+    return directory / f"metrics-{os.getpid()}-{_instance}.json"
+
+
+def flush():
+    directory = _metrics_dir()
+    if directory is None:
+        return
+    directory.mkdir(parents=True, exist_ok=True)
+    target = worker_file(directory)
+    tmp = target.with_suffix(f".{threading.get_ident()}.tmp")
+    tmp.write_text(json.dumps(snapshot()), encoding="utf-8")
+    os.replace(tmp, target)  # readers never see a half-written file
+
+
+def _flush_forever():
+    while True:
+        time.sleep(_flush_interval())
+        try:
+            flush()
+        except OSError:
+            pass  # METRICS_DIR unavailable for now; the next round retries
+
+
+def maybe_flush():
+    """
+    Start this process's flusher thread if METRICS_DIR is set. Cheap enough to
+    call after every request; the file is written off the request thread, and
+    also while the worker is idle, so its file never looks stale.
+    """
+    global _flusher
+    if _flusher is not None or _metrics_dir() is None:
+        return
+    with _lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_forever, name="metrics-flush", daemon=True)
+            _flusher.start()
+
+
+def _reset_in_child():
+    # the child got a copy of the parent's numbers (which the parent reports itself)
+    # and no flusher thread; _lock may have been held by another thread at fork time
+    global _lock, _instance, _flusher
+    _lock = threading.Lock()
+    _counters.clear()
+    _histograms.clear()
+    _instance = uuid.uuid4().hex[:8]
+    _flusher = None
+
+
+os.register_at_fork(after_in_child=_reset_in_child)
+atexit.register(flush)
+
+
+def collect():
+    """:return: snapshot of this process merged with every worker file in METRICS_DIR"""
+    directory = _metrics_dir()
+    if directory is None:
+        return snapshot()
+    flush()
+    stale_before = time.time() - STALE_FLUSHES * _flush_interval()
+    counters, histograms = {}, {}
+    for path in directory.glob("metrics-*.json"):
+        try:
+            if path.stat().st_mtime < stale_before:
+                path.unlink()  # the worker is gone
+                continue
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue  # a worker is replacing its file right now
+        for name, labels, value in data["counters"]:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, counts in data["histograms"]:
+            key = (name, tuple(map(tuple, labels)))
+            if key in histograms:
+                histograms[key] = [a + b for a, b in zip(histograms[key], counts)]
+            else:
+                histograms[key] = counts
+    return {
+        "counters": [[name, list(labels), value] for (name, labels), value in counters.items()],
+        "histograms": [[name, list(labels), counts] for (name, labels), counts in histograms.items()],
+    }
+
+
+# ------------------------ Prometheus text format ------------------------
+def _labels(pairs, extra=()):
+    pairs = list(pairs) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _num(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(data):
+    by_name = {}
+    for name, labels, value in data["counters"]:
+        by_name.setdefault(name, []).append((labels, value))
+    for name, labels, counts in data["histograms"]:
+        by_name.setdefault(name, []).append((labels, counts))
+
+    lines = []
+    for name in sorted(by_name):
+        kind, help_text, buckets = METRICS.get(name, ("untyped", "", None))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(by_name[name]):
+            if kind != "histogram":
+                lines.append(f"{name}{_labels(labels)} {_num(value)}")
+                continue
+            cumulative = 0
+            for bound, n in zip(list(buckets) + [float("inf")], value[:-1]):
+                cumulative += n
+                lines.append(f"{name}_bucket{_labels(labels, [('le', _num(bound))])} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {_num(value[-1])}")
+            lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+# ------------------------ SQL timing ------------------------
+class QueryStats:
+    """Queries and SQL time of one request (shared with its sync_to_async threads)."""
+    __slots__ = ("count", "seconds", "lock")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.lock = threading.Lock()
+
+
+current_query_stats = ContextVar("current_query_stats", default=None)
+
+
+def _timed_execute(execute, sql, params, many, context):
+    stats = current_query_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        with stats.lock:
+            stats.count += 1
+            stats.seconds += elapsed
+
+
+def install_query_timer(sender, connection, **kwargs):
+    """
+    connection_created receiver: put the timing execute_wrapper on every DB
+    connection, so queries from the parallel threads of the async views count too.
+    """
+    if _timed_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_timed_execute)
@@ -0,0 +1,135 @@
+# blood/middleware.py
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import metrics, profiling
+from .routers import PIN_COOKIE, watch_writes
+
+
+class PrimaryPinMiddleware:
+    """
+    After a request that wrote blood data (seen by ReplicaRouter.db_for_write)
+    pin this client to the primary database for REPLICA_STICKY_SECONDS, so the
+    page it is redirected to does not read from a replica that has not caught
+    up yet. Logins and other POSTs that only touch sessions / the audit log do
+    not pin, so the reporting pages behind the portal login still use replicas.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with watch_writes() as seen:
+            response = self.get_response(request)
+        return self._pin(response, seen)
+
+    async def __acall__(self, request):
+        # sync views run in sync_to_async threads, which copy the context: the writes are seen
+        with watch_writes() as seen:
+            response = await self.get_response(request)
+        return self._pin(response, seen)
+
+    @staticmethod
+    def _pin(response, seen):
+        if seen["blood"] and getattr(settings, "DATABASE_REPLICAS", []):
+            response.set_cookie(
+                PIN_COOKIE, "1",
+                max_age=getattr(settings, "REPLICA_STICKY_SECONDS", 10),
+                httponly=True, samesite="Lax",
+            )
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Per URL name: request count, latency histogram, SQL queries and SQL time,
+    response size (see blood/metrics.py). Put it first in MIDDLEWARE so the
+    other middleware (sessions, auth) is measured too.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats, token, started = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current_query_stats.reset(token)
+        self._record(request, response, stats, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        stats, token, started = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current_query_stats.reset(token)
+        self._record(request, response, stats, time.perf_counter() - started)
+        return response
+
+    @staticmethod
+    def _start():
+        stats = metrics.QueryStats()
+        return stats, metrics.current_query_stats.set(stats), time.perf_counter()
+
+    @staticmethod
+    def _record(request, response, stats, elapsed):
+        match = request.resolver_match
+        view = match.url_name if match and match.url_name else "unresolved"
+        metrics.inc("bloodbank_http_requests_total", view=view, method=request.method,
+                    status=response.status_code)
+        metrics.observe("bloodbank_http_request_duration_seconds", elapsed, view=view)
+        metrics.observe("bloodbank_db_queries_per_request", stats.count, view=view)
+        metrics.inc("bloodbank_db_query_seconds_total", stats.seconds, view=view)
+        if not response.streaming:
+            metrics.observe("bloodbank_http_response_size_bytes", len(response.content), view=view)
+        metrics.maybe_flush()
+
+
+class ProfilingMiddleware:
+    """
+    Opt-in profiling: "?_profile=1" or an "X-Profile: 1" header on a request that
+    carries the portal pass (portal_once_ok) runs the view under cProfile +
+    tracemalloc + an SQL log (blood/profiling.py). Sync views only: cProfile
+    cannot follow a coroutine, so async views are served unprofiled.
+    Put it last in MIDDLEWARE so it wraps just the view.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        # all the work is in process_view, which Django runs in a thread under ASGI
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.GET.get("_profile") != "1" and request.headers.get("X-Profile") != "1":
+            return None
+        # peek only: the view itself consumes the one-time pass
+        if iscoroutinefunction(view_func) or not request.session.get("portal_once_ok", False):
+            return None
+        response, name = profiling.run_profiled(request, view_func, view_args, view_kwargs)
+        if response is None:
+            return None  # another profile is running; serve normally
+        response["X-Profile-Id"] = name
+        return response
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:03
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blood', '0013_profile_photo'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dispenselog',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Created at'),
+        ),
+        migrations.AlterField(
+            model_name='donationunit',
+            name='donation_date',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Donation time'),
+        ),
+    ]
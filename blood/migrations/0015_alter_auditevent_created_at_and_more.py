@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:04
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blood', '0014_alter_dispenselog_created_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='auditevent',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Created at'),
+        ),
+        migrations.AlterField(
+            model_name='dispenserequest',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Created at'),
+        ),
+    ]
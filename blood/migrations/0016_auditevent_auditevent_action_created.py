@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blood', '0015_alter_auditevent_created_at_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='auditevent',
+            index=models.Index(fields=['action', 'created_at'], name='auditevent_action_created'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:30
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blood', '0016_auditevent_auditevent_action_created'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventorySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Day')),
+                ('blood_type', models.CharField(choices=[('A+', 'A+'), ('A-', 'A-'), ('B+', 'B+'), ('B-', 'B-'), ('AB+', 'AB+'), ('AB-', 'AB-'), ('O+', 'O+'), ('O-', 'O-')], max_length=3, verbose_name='Blood type')),
+                ('donated', models.PositiveIntegerField(default=0, verbose_name='Donated')),
+                ('dispensed', models.PositiveIntegerField(default=0, verbose_name='Dispensed')),
+                ('expired', models.PositiveIntegerField(default=0, verbose_name='Expired')),
+                ('available', models.PositiveIntegerField(default=0, verbose_name='Available at end of day')),
+                ('near_expiry', models.PositiveIntegerField(default=0, verbose_name='Near expiry at end of day')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Created at')),
+            ],
+            options={
+                'ordering': ['day', 'blood_type'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'blood_type'), name='inventorysnapshot_day_type')],
+            },
+        ),
+    ]
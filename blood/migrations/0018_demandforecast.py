@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:33
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blood', '0017_inventorysnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DemandForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('computed_on', models.DateField(verbose_name='Computed on')),
+                ('blood_type', models.CharField(choices=[('A+', 'A+'), ('A-', 'A-'), ('B+', 'B+'), ('B-', 'B-'), ('AB+', 'AB+'), ('AB-', 'AB-'), ('O+', 'O+'), ('O-', 'O-')], max_length=3, verbose_name='Blood type')),
+                ('history_days', models.PositiveIntegerField(default=0, verbose_name='History (days)')),
+                ('demand_per_day', models.FloatField(default=0, verbose_name='Expected demand per day (EWMA)')),
+                ('moving_average', models.FloatField(default=0, verbose_name='Moving average per day')),
+                ('demand_std', models.FloatField(default=0, verbose_name='Daily demand std. dev.')),
+                ('available', models.PositiveIntegerField(default=0, verbose_name='Available when computed')),
+                ('days_of_supply', models.FloatField(blank=True, null=True, verbose_name='Days of supply')),
+                ('stockout_on', models.DateField(blank=True, null=True, verbose_name='Projected stock-out')),
+                ('threshold', models.PositiveIntegerField(default=0, verbose_name='Dynamic low-stock threshold')),
+                ('computed_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Computed at')),
+            ],
+            options={
+                'ordering': ['-computed_on', 'blood_type'],
+                'constraints': [models.UniqueConstraint(fields=('computed_on', 'blood_type'), name='demandforecast_day_type')],
+            },
+        ),
+    ]
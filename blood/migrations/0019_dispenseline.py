@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:34
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blood', '0018_demandforecast'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DispenseLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('requested_type', models.CharField(choices=[('A+', 'A+'), ('A-', 'A-'), ('B+', 'B+'), ('B-', 'B-'), ('AB+', 'AB+'), ('AB-', 'AB-'), ('O+', 'O+'), ('O-', 'O-')], max_length=3, verbose_name='Requested type')),
+                ('supplied_type', models.CharField(choices=[('A+', 'A+'), ('A-', 'A-'), ('B+', 'B+'), ('B-', 'B-'), ('AB+', 'AB+'), ('AB-', 'AB-'), ('O+', 'O+'), ('O-', 'O-')], max_length=3, verbose_name='Supplied type')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Quantity')),
+                ('hospital_name', models.CharField(blank=True, max_length=120, verbose_name='Hospital name')),
+                ('hospital_city', models.CharField(blank=True, max_length=80, verbose_name='Hospital city')),
+                ('urgency', models.CharField(blank=True, choices=[('REGULAR', 'Regular'), ('URGENT', 'Urgent')], max_length=10, verbose_name='Urgency')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Created at')),
+                ('log', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='blood.dispenselog')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['created_at'], name='dispenseline_created'), models.Index(fields=['hospital_name', 'created_at'], name='dispenseline_hospital'), models.Index(fields=['hospital_city', 'created_at'], name='dispenseline_city'), models.Index(fields=['supplied_type', 'created_at'], name='dispenseline_supplied'), models.Index(fields=['requested_type', 'created_at'], name='dispenseline_requested')],
+            },
+        ),
+    ]
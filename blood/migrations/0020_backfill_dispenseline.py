@@ -0,0 +1,33 @@
+from django.db import migrations
+
+BATCH_SIZE = 2000
+
+
+def backfill(apps, schema_editor):
+    """Line items for the existing logs (their hospital is unknown: the requests were deleted)."""
+    DispenseLog = apps.get_model("blood", "DispenseLog")
+    DispenseLine = apps.get_model("blood", "DispenseLine")
+    lines = []
+    logs = DispenseLog.objects.filter(lines__isnull=True).values_list(
+        "id", "requested_type", "dispensed_map", "created_at"
+    )
+    for log_id, requested_type, dispensed_map, created_at in logs.iterator(chunk_size=BATCH_SIZE):
+        for supplied_type, qty in (dispensed_map or {}).items():
+            if qty:
+                lines.append(DispenseLine(log_id=log_id, requested_type=requested_type,
+                                          supplied_type=supplied_type, quantity=qty, created_at=created_at))
+        if len(lines) >= BATCH_SIZE:
+            DispenseLine.objects.bulk_create(lines)
+            lines = []
+    DispenseLine.objects.bulk_create(lines)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blood', '0019_dispenseline'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
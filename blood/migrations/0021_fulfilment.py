@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:36
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blood', '0020_backfill_dispenseline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Fulfilment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hospital_name', models.CharField(max_length=120, verbose_name='Hospital name')),
+                ('dispensed_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Dispensed at')),
+                ('request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fulfilments', to='blood.dispenserequest')),
+                ('unit', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='fulfilment', to='blood.donationunit')),
+            ],
+            options={
+                'ordering': ['-dispensed_at'],
+                'indexes': [models.Index(fields=['request', 'dispensed_at'], name='fulfilment_request')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blood', '0021_fulfilment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='donationunit',
+            name='quarantined_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Quarantined at'),
+        ),
+        migrations.AlterField(
+            model_name='donationunit',
+            name='status',
+            field=models.CharField(choices=[('AVAILABLE', 'Available'), ('DISPENSED', 'Dispensed'), ('QUARANTINED', 'Quarantined')], db_index=True, default='AVAILABLE', max_length=20, verbose_name='Status'),
+        ),
+        migrations.AddIndex(
+            model_name='donationunit',
+            index=models.Index(fields=['donor', 'status'], name='unit_donor_status'),
+        ),
+        migrations.AddIndex(
+            model_name='donationunit',
+            index=models.Index(fields=['status', 'donation_date'], name='unit_status_donated'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blood', '0022_donationunit_quarantine'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Site',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=20, unique=True, verbose_name='Code')),
+                ('name', models.CharField(max_length=120, verbose_name='Name')),
+                ('city', models.CharField(blank=True, db_index=True, max_length=80, verbose_name='City')),
+            ],
+            options={
+                'ordering': ['code'],
+            },
+        ),
+        migrations.CreateModel(
+            name='TransferRoute',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cost', models.PositiveIntegerField(default=1, verbose_name='Transfer cost')),
+            ],
+            options={
+                'ordering': ['cost'],
+            },
+        ),
+        migrations.AddField(
+            model_name='dispenserequest',
+            name='site',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='requests', to='blood.site', verbose_name='Home site'),
+        ),
+        migrations.AddField(
+            model_name='donationunit',
+            name='site',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='units', to='blood.site'),
+        ),
+        migrations.AddIndex(
+            model_name='donationunit',
+            index=models.Index(fields=['status', 'site', 'blood_type', 'expiry_at'], name='unit_site_stock'),
+        ),
+        migrations.AddField(
+            model_name='transferroute',
+            name='from_site',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='routes_out', to='blood.site'),
+        ),
+        migrations.AddField(
+            model_name='transferroute',
+            name='to_site',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='routes_in', to='blood.site'),
+        ),
+        migrations.AddConstraint(
+            model_name='transferroute',
+            constraint=models.UniqueConstraint(fields=('from_site', 'to_site'), name='transfer_route_unique'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blood', '0023_sites'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DinSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField(unique=True, verbose_name='Year')),
+                ('last', models.PositiveIntegerField(default=0, verbose_name='Last sequence')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='donationunit',
+            name='din',
+            field=models.CharField(blank=True, max_length=13, null=True, unique=True, verbose_name='Donation number'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations
+from django.utils import timezone
+
+BATCH_SIZE = 2000
+
+
+def backfill(apps, schema_editor):
+    """Donation numbers for the existing units, in id order within each collection year."""
+    from blood.din import make_din  # pure function of settings: safe to use here
+
+    DonationUnit = apps.get_model("blood", "DonationUnit")
+    DinSequence = apps.get_model("blood", "DinSequence")
+    last = dict(DinSequence.objects.values_list("year", "last"))
+    batch = []
+    # read first: the updates below must not run while a cursor over the same rows is open
+    units = list(DonationUnit.objects.filter(din__isnull=True).order_by("id").values_list("id", "donation_date"))
+    for unit_id, donation_date in units:
+        year = timezone.localtime(donation_date).year % 100
+        last[year] = last.get(year, 0) + 1
+        batch.append(DonationUnit(id=unit_id, din=make_din(year, last[year])))
+        if len(batch) >= BATCH_SIZE:
+            DonationUnit.objects.bulk_update(batch, ["din"])
+            batch = []
+    DonationUnit.objects.bulk_update(batch, ["din"])
+    for year, value in last.items():
+        DinSequence.objects.update_or_create(year=year, defaults={"last": value})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blood', '0024_donation_numbers'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blood', '0025_backfill_donation_numbers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='donor',
+            name='blood_type',
+            field=models.CharField(blank=True, choices=[('A+', 'A+'), ('A-', 'A-'), ('B+', 'B+'), ('B-', 'B-'), ('AB+', 'AB+'), ('AB-', 'AB-'), ('O+', 'O+'), ('O-', 'O-')], max_length=3, verbose_name='Blood type'),
+        ),
+        migrations.AddField(
+            model_name='donor',
+            name='last_donation_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Last donation'),
+        ),
+        migrations.AddField(
+            model_name='donor',
+            name='next_eligible_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Next eligible'),
+        ),
+        migrations.AddIndex(
+            model_name='donor',
+            index=models.Index(fields=['blood_type', 'next_eligible_at', 'date_of_birth', 'national_id', 'full_name'], name='donor_eligible'),
+        ),
+    ]
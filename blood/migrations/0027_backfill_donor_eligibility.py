@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import F, OuterRef, Subquery
+
+
+def backfill(apps, schema_editor):
+    """Last donation / blood type of every donor from their latest unit, then the next eligible time."""
+    Donor = apps.get_model("blood", "Donor")
+    DonationUnit = apps.get_model("blood", "DonationUnit")
+    latest = DonationUnit.objects.filter(donor=OuterRef("pk")).order_by("-donation_date")
+    Donor.objects.filter(pk__in=DonationUnit.objects.values("donor_id")).update(
+        last_donation_at=Subquery(latest.values("donation_date")[:1]),
+        blood_type=Subquery(latest.values("blood_type")[:1]),
+    )
+    interval = timedelta(days=getattr(settings, "DONATION_INTERVAL_DAYS", 56))
+    Donor.objects.filter(last_donation_at__isnull=False).update(next_eligible_at=F("last_donation_at") + interval)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blood', '0026_donor_eligibility'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blood', '0027_backfill_donor_eligibility'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='fulfilment',
+            name='request',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='fulfilments', to='blood.dispenserequest'),
+        ),
+        migrations.AlterField(
+            model_name='fulfilment',
+            name='unit',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.PROTECT, related_name='fulfilment', to='blood.donationunit'),
+        ),
+    ]
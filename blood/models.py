@@ -1,6 +1,7 @@
 # blood/models.py
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 # -------------------- Constants --------------------
 BLOOD_TYPES = [
@@ -10,14 +11,54 @@ BLOOD_TYPES = [
     ("O+", "O+"), ("O-", "O-"),
 ]
 
+# -------------------- Sites --------------------
+class Site(models.Model):
+    """A collection / storage site. Units are stocked at one site."""
+    code = models.CharField("Code", max_length=20, unique=True)
+    name = models.CharField("Name", max_length=120)
+    # requests from hospitals in this city are filled from this site first
+    city = models.CharField("City", max_length=80, blank=True, db_index=True)
+
+    class Meta:
+        ordering = ["code"]
+
+    def __str__(self):
+        return f"{self.code} - {self.name}"
+
+
+class TransferRoute(models.Model):
+    """Moving units from one site to another, with a relative cost (lower is preferred)."""
+    from_site = models.ForeignKey(Site, on_delete=models.CASCADE, related_name="routes_out")
+    to_site = models.ForeignKey(Site, on_delete=models.CASCADE, related_name="routes_in")
+    cost = models.PositiveIntegerField("Transfer cost", default=1)
+
+    class Meta:
+        ordering = ["cost"]
+        constraints = [
+            models.UniqueConstraint(fields=["from_site", "to_site"], name="transfer_route_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.from_site.code} -> {self.to_site.code} ({self.cost})"
+
+
 # -------------------- Core domain --------------------
 class Donor(models.Model):
     national_id = models.CharField("National ID", max_length=9, unique=True, db_index=True)
     full_name = models.CharField("Full name", max_length=120)
     date_of_birth = models.DateField("Date of birth", null=True, blank=True)
+    # denormalized from the donor's units and kept up to date at intake (blood/eligibility.py)
+    blood_type = models.CharField("Blood type", max_length=3, choices=BLOOD_TYPES, blank=True)
+    last_donation_at = models.DateTimeField("Last donation", null=True, blank=True)
+    next_eligible_at = models.DateTimeField("Next eligible", null=True, blank=True)
 
     class Meta:
         ordering = ["full_name"]
+        indexes = [
+            # "eligible donors of type X" (counts and call lists) without touching the table
+            models.Index(fields=["blood_type", "next_eligible_at", "date_of_birth", "national_id", "full_name"],
+                         name="donor_eligible"),
+        ]
 
     def __str__(self):
         return f"{self.full_name} ({self.national_id})"
@@ -27,27 +68,48 @@ class DonationUnit(models.Model):
     class Status(models.TextChoices):
         AVAILABLE = "AVAILABLE", "Available"
         DISPENSED = "DISPENSED", "Dispensed"
+        QUARANTINED = "QUARANTINED", "Quarantined"
 
     donor = models.ForeignKey(Donor, on_delete=models.CASCADE, related_name="donations")
     blood_type = models.CharField("Blood type", max_length=3, choices=BLOOD_TYPES)
-    donation_date = models.DateTimeField("Donation time", auto_now_add=True)
+    donation_date = models.DateTimeField("Donation time", default=timezone.now)
     expiry_at = models.DateTimeField("Expiry at", null=True, blank=True)
     status = models.CharField("Status", max_length=20, choices=Status.choices,
                               default=Status.AVAILABLE, db_index=True)
     dispensed_at = models.DateTimeField("Dispensed at", null=True, blank=True)
+    quarantined_at = models.DateTimeField("Quarantined at", null=True, blank=True)
+    site = models.ForeignKey(Site, on_delete=models.SET_NULL, null=True, blank=True, related_name="units")
+    # ISBT 128-style donation number (blood/din.py); unique index = scan lookups
+    din = models.CharField("Donation number", max_length=13, unique=True, null=True, blank=True)
 
     class Meta:
         ordering = ["-donation_date"]
+        indexes = [
+            # recall: a donor's units / units donated in a window, by status
+            models.Index(fields=["donor", "status"], name="unit_donor_status"),
+            models.Index(fields=["status", "donation_date"], name="unit_status_donated"),
+            # stock per site and type (planner counts) straight from the index
+            models.Index(fields=["status", "site", "blood_type", "expiry_at"], name="unit_site_stock"),
+        ]
 
     def __str__(self):
         return f"{self.blood_type} {self.donation_date:%Y-%m-%d %H:%M} - {self.donor.full_name}"
 
 
+class DinSequence(models.Model):
+    """Last donation-number sequence handed out per collection year (two digits)."""
+    year = models.PositiveSmallIntegerField("Year", unique=True)
+    last = models.PositiveIntegerField("Last sequence", default=0)
+
+    def __str__(self):
+        return f"{self.year:02d}: {self.last}"
+
+
 class DispenseLog(models.Model):
     requested_type = models.CharField("Requested type", max_length=3, choices=BLOOD_TYPES)
     quantity = models.PositiveIntegerField("Quantity")
     dispensed_map = models.JSONField("Dispensed map", default=dict)
-    created_at = models.DateTimeField("Created at", auto_now_add=True)
+    created_at = models.DateTimeField("Created at", default=timezone.now)
 
     class Meta:
         ordering = ["-created_at"]
@@ -76,7 +138,9 @@ class DispenseRequest(models.Model):
     plan = models.JSONField("Compatibility plan", default=dict, blank=True)
     shortfall = models.PositiveIntegerField("Shortfall", default=0)
     notes = models.TextField("Notes", blank=True)
-    created_at = models.DateTimeField("Created at", auto_now_add=True)
+    site = models.ForeignKey(Site, on_delete=models.SET_NULL, null=True, blank=True, related_name="requests",
+                             verbose_name="Home site")
+    created_at = models.DateTimeField("Created at", default=timezone.now)
 
     class Meta:
         ordering = ["-created_at"]
@@ -85,6 +149,61 @@ class DispenseRequest(models.Model):
         return f"Req {self.requested_type} x{self.quantity} ({self.urgency}) - {self.hospital_name}"
 
 
+class DispenseLine(models.Model):
+    """
+    One row per supplied blood type of a DispenseLog, with the hospital of the
+    request, denormalized so reports need no join. Reporting reads these
+    rows with GROUP BY instead of parsing dispensed_map.
+    """
+    log = models.ForeignKey(DispenseLog, on_delete=models.CASCADE, related_name="lines")
+    requested_type = models.CharField("Requested type", max_length=3, choices=BLOOD_TYPES)
+    supplied_type = models.CharField("Supplied type", max_length=3, choices=BLOOD_TYPES)
+    quantity = models.PositiveIntegerField("Quantity")
+    hospital_name = models.CharField("Hospital name", max_length=120, blank=True)
+    hospital_city = models.CharField("Hospital city", max_length=80, blank=True)
+    urgency = models.CharField("Urgency", max_length=10, choices=DispenseRequest.Urgency.choices, blank=True)
+    # copy of log.created_at, so period filters need no join
+    created_at = models.DateTimeField("Created at", default=timezone.now)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [
+            # analytics: a period filter + GROUP BY one column
+            models.Index(fields=["created_at"], name="dispenseline_created"),
+            models.Index(fields=["hospital_name", "created_at"], name="dispenseline_hospital"),
+            models.Index(fields=["hospital_city", "created_at"], name="dispenseline_city"),
+            models.Index(fields=["supplied_type", "created_at"], name="dispenseline_supplied"),
+            models.Index(fields=["requested_type", "created_at"], name="dispenseline_requested"),
+        ]
+
+    def __str__(self):
+        return f"{self.supplied_type} x{self.quantity} for {self.requested_type} ({self.hospital_name or '?'})"
+
+
+class Fulfilment(models.Model):
+    """
+    Which unit went to which request (written by request_approve in the same
+    transaction as the status flip). unit is unique — a unit is dispensed once;
+    both directions are indexed:
+    - request -> its units: Fulfilment.objects.filter(request=req)
+    - donor -> where the blood went: DonationUnit.objects.filter(donor=d).select_related("fulfilment")
+    """
+    # PROTECT: the traceability rows outlive any attempt to delete their unit or request
+    unit = models.OneToOneField(DonationUnit, on_delete=models.PROTECT, related_name="fulfilment")
+    request = models.ForeignKey(DispenseRequest, on_delete=models.PROTECT, related_name="fulfilments")
+    hospital_name = models.CharField("Hospital name", max_length=120)
+    dispensed_at = models.DateTimeField("Dispensed at", default=timezone.now)
+
+    class Meta:
+        ordering = ["-dispensed_at"]
+        indexes = [
+            models.Index(fields=["request", "dispensed_at"], name="fulfilment_request"),
+        ]
+
+    def __str__(self):
+        return f"unit {self.unit_id} -> request {self.request_id} ({self.hospital_name})"
+
+
 # -------------------- Users & audit --------------------
 class Profile(models.Model):
     class Role(models.TextChoices):
@@ -112,11 +231,67 @@ class AuditEvent(models.Model):
     session_key = models.CharField("Session key", max_length=64, blank=True)
     action = models.CharField("Action", max_length=50)
     details = models.JSONField("Details", default=dict, blank=True)
-    created_at = models.DateTimeField("Created at", auto_now_add=True)
+    created_at = models.DateTimeField("Created at", default=timezone.now)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # dashboard summaries filter one action over a time window
+            models.Index(fields=["action", "created_at"], name="auditevent_action_created"),
+        ]
 
     def __str__(self):
         who = self.user.username if self.user else "anon"
         return f"{self.created_at:%Y-%m-%d %H:%M} [{self.role}] {who} -> {self.action}"
+
+
+# -------------------- Reporting --------------------
+class InventorySnapshot(models.Model):
+    """
+    Daily per-type rollup of DonationUnit (filled by `manage.py rollup_inventory`).
+    Flows are counted within the day; stock is taken at the end of the day.
+    """
+    day = models.DateField("Day")
+    blood_type = models.CharField("Blood type", max_length=3, choices=BLOOD_TYPES)
+    donated = models.PositiveIntegerField("Donated", default=0)
+    dispensed = models.PositiveIntegerField("Dispensed", default=0)
+    expired = models.PositiveIntegerField("Expired", default=0)
+    available = models.PositiveIntegerField("Available at end of day", default=0)
+    near_expiry = models.PositiveIntegerField("Near expiry at end of day", default=0)
+    created_at = models.DateTimeField("Created at", default=timezone.now)
+
+    class Meta:
+        ordering = ["day", "blood_type"]
+        constraints = [
+            models.UniqueConstraint(fields=["day", "blood_type"], name="inventorysnapshot_day_type"),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.blood_type}: {self.available} available"
+
+
+class DemandForecast(models.Model):
+    """
+    Nightly demand forecast per blood type (filled by `manage.py forecast_demand`,
+    see blood/forecast.py). The dashboard reads the latest computed_on only.
+    """
+    computed_on = models.DateField("Computed on")
+    blood_type = models.CharField("Blood type", max_length=3, choices=BLOOD_TYPES)
+    history_days = models.PositiveIntegerField("History (days)", default=0)
+    demand_per_day = models.FloatField("Expected demand per day (EWMA)", default=0)
+    moving_average = models.FloatField("Moving average per day", default=0)
+    demand_std = models.FloatField("Daily demand std. dev.", default=0)
+    available = models.PositiveIntegerField("Available when computed", default=0)
+    days_of_supply = models.FloatField("Days of supply", null=True, blank=True)
+    stockout_on = models.DateField("Projected stock-out", null=True, blank=True)
+    threshold = models.PositiveIntegerField("Dynamic low-stock threshold", default=0)
+    computed_at = models.DateTimeField("Computed at", default=timezone.now)
+
+    class Meta:
+        ordering = ["-computed_on", "blood_type"]
+        constraints = [
+            models.UniqueConstraint(fields=["computed_on", "blood_type"], name="demandforecast_day_type"),
+        ]
+
+    def __str__(self):
+        return f"{self.computed_on} {self.blood_type}: {self.demand_per_day}/day"
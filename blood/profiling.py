@@ -0,0 +1,135 @@
+# blood/profiling.py
+"""
+On-demand profiling of one request (see ProfilingMiddleware):
+cProfile + tracemalloc + SQL log, stored under PROFILES_DIR as
+<name>.prof (pstats, open with snakeviz) and <name>.json (summary).
+"""
+import cProfile
+import json
+import re
+import threading
+import time
+import tracemalloc
+from contextlib import ExitStack
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+TOP_ALLOCATIONS = 25
+NAME_RE = re.compile(r"^[0-9]{8}-[0-9]{6}-[0-9]{6}-[a-z0-9_]+$")
+
+# cProfile / tracemalloc are process-wide — profile one request at a time
+_busy = threading.Lock()
+
+
+def profiles_dir():
+    return Path(getattr(settings, "PROFILES_DIR", settings.BASE_DIR / "profiles"))
+
+
+def run_profiled(request, view_func, args, kwargs):
+    """
+    Call the view under the profilers.
+    :return: (response, profile name) or (None, None) when another profile is running
+    """
+    if not _busy.acquire(blocking=False):
+        return None, None
+    try:
+        return _run(request, view_func, args, kwargs)
+    finally:
+        _busy.release()
+
+
+def _run(request, view_func, args, kwargs):
+    sql = []
+
+    def log_sql(execute, query, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(query, params, many, context)
+        finally:
+            sql.append({"sql": query, "ms": round((time.perf_counter() - started) * 1000, 3)})
+
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(10)
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    profiler = cProfile.Profile()
+
+    started = time.perf_counter()
+    try:
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(log_sql))
+            response = profiler.runcall(view_func, request, *args, **kwargs)
+            # templates of TemplateResponse render lazily — include them
+            if hasattr(response, "render") and callable(response.render):
+                response = profiler.runcall(response.render)
+        elapsed = time.perf_counter() - started
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+
+    match = request.resolver_match
+    view = match.url_name if match and match.url_name else "unresolved"
+    name = f"{timezone.now():%Y%m%d-%H%M%S-%f}-{view}"
+    directory = profiles_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    profiler.dump_stats(directory / f"{name}.prof")
+
+    filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+    top = after.filter_traces(filters).compare_to(before.filter_traces(filters), "lineno")[:TOP_ALLOCATIONS]
+    summary = {
+        "name": name,
+        "created_at": timezone.now().isoformat(),
+        "method": request.method,
+        "path": request.get_full_path(),
+        "view": view,
+        "status": response.status_code,
+        "duration_ms": round(elapsed * 1000, 3),
+        "peak_memory_kb": round(peak / 1024, 1),
+        "queries": len(sql),
+        "sql_ms": round(sum(q["ms"] for q in sql), 3),
+        "top_allocations": [
+            {"where": str(stat.traceback[0]), "size_kb": round(stat.size_diff / 1024, 1), "count": stat.count_diff}
+            for stat in top
+        ],
+        "sql": sql,
+    }
+    (directory / f"{name}.json").write_text(json.dumps(summary, indent=2), encoding="utf-8")
+    _prune(directory)
+    return response, name
+
+
+def _prune(directory):
+    keep = getattr(settings, "PROFILES_KEEP", 50)
+    for old in sorted(directory.glob("*.json"), reverse=True)[keep:]:
+        old.unlink(missing_ok=True)
+        old.with_suffix(".prof").unlink(missing_ok=True)
+
+
+def recent_profiles():
+    """Summaries (without the SQL log) of the stored profiles, newest first."""
+    out = []
+    for path in sorted(profiles_dir().glob("*.json"), reverse=True):
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue
+        data.pop("sql", None)
+        data["created_at"] = datetime.fromisoformat(data["created_at"])
+        out.append(data)
+    return out
+
+
+def profile_file(name, ext):
+    """Path of a stored profile file, or None for unknown / malformed names."""
+    if not NAME_RE.match(name) or ext not in ("prof", "json"):
+        return None
+    path = profiles_dir() / f"{name}.{ext}"
+    return path if path.exists() else None
@@ -0,0 +1,101 @@
+# blood/rollups.py
+"""
+Daily inventory rollups (InventorySnapshot): one row per (day, blood type).
+
+Only closed days are rolled up (up to yesterday, local time), so a stored day
+never changes unless units are deleted or edited afterwards — then re-run the
+day with rollup_day(). The dashboard trend chart reads these rows only.
+"""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Q
+from django.utils import timezone
+
+from .models import BLOOD_TYPES, DonationUnit, InventorySnapshot
+
+
+def day_bounds(day):
+    """:return: (start, end) aware datetimes of a local calendar day"""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+    return start, end
+
+
+def compute_day(day):
+    """
+    Counts of one day, by blood type, in one aggregate query.
+    - donated / dispensed / expired: events inside the day
+      (expired = expiry inside the day and not dispensed before it)
+    - available / near_expiry: stock at the end of the day
+    Deleted units are gone from every day (DonationUnit has no history table);
+    quarantined units count as stock until the day of their recall.
+    """
+    start, end = day_bounds(day)
+    near_cutoff = end + timedelta(days=getattr(settings, "NEAR_EXPIRY_DAYS", 7))
+    not_dispensed_by_end = Q(dispensed_at__gte=end) | Q(
+        dispensed_at__isnull=True, status=DonationUnit.Status.AVAILABLE
+    ) | Q(status=DonationUnit.Status.QUARANTINED, quarantined_at__gte=end)
+    available = Q(donation_date__lt=end) & not_dispensed_by_end & (Q(expiry_at__isnull=True) | Q(expiry_at__gte=end))
+    rows = DonationUnit.objects.values("blood_type").annotate(
+        donated=Count("id", filter=Q(donation_date__gte=start, donation_date__lt=end)),
+        dispensed=Count("id", filter=Q(dispensed_at__gte=start, dispensed_at__lt=end)),
+        expired=Count("id", filter=Q(expiry_at__gte=start, expiry_at__lt=end) & (
+            Q(dispensed_at__isnull=True, status=DonationUnit.Status.AVAILABLE) | Q(dispensed_at__gte=F("expiry_at"))
+        )),
+        available=Count("id", filter=available),
+        near_expiry=Count("id", filter=available & Q(expiry_at__lte=near_cutoff)),
+    )
+    counts = {bt: dict.fromkeys(("donated", "dispensed", "expired", "available", "near_expiry"), 0)
+              for bt, _ in BLOOD_TYPES}
+    for row in rows:
+        counts[row.pop("blood_type")] = row
+    return counts
+
+
+@transaction.atomic
+def rollup_day(day):
+    """(Re)write the rows of one day — running it twice gives the same rows."""
+    counts = compute_day(day)
+    InventorySnapshot.objects.filter(day=day).delete()
+    InventorySnapshot.objects.bulk_create(
+        InventorySnapshot(day=day, blood_type=bt, **values) for bt, values in counts.items()
+    )
+
+
+def pending_days(until=None):
+    """
+    Days not rolled up yet: from the day after the last stored one (or the
+    first donation) up to `until` (default: yesterday).
+    """
+    until = until or timezone.localdate() - timedelta(days=1)
+    last = InventorySnapshot.objects.aggregate(m=Max("day"))["m"]
+    if last is not None:
+        first = last + timedelta(days=1)
+    else:
+        oldest = DonationUnit.objects.aggregate(m=Min("donation_date"))["m"]
+        if oldest is None:
+            return []
+        first = timezone.localdate(oldest)
+    return [first + timedelta(days=i) for i in range((until - first).days + 1)]
+
+
+def trend(days):
+    """
+    Last `days` rolled-up days for the dashboard chart.
+    :return: {"days": ["YYYY-MM-DD", ...], "available": {bt: [...]}, "dispensed": [...], "donated": [...]}
+    """
+    since = timezone.localdate() - timedelta(days=days)
+    labels, available = [], {bt: [] for bt, _ in BLOOD_TYPES}
+    donated, dispensed = [], []
+    for snap in InventorySnapshot.objects.filter(day__gte=since).order_by("day", "blood_type"):
+        label = snap.day.isoformat()
+        if not labels or labels[-1] != label:
+            labels.append(label)
+            donated.append(0)
+            dispensed.append(0)
+        available[snap.blood_type].append(snap.available)
+        donated[-1] += snap.donated
+        dispensed[-1] += snap.dispensed
+    return {"days": labels, "available": available, "donated": donated, "dispensed": dispensed}
@@ -0,0 +1,86 @@
+# blood/routers.py
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+
+# set while a reporting view runs; only then may reads go to a replica
+_replica_reads = ContextVar("replica_reads", default=False)
+
+# cookie set after a write, keeps the browser on the primary for a few seconds
+PIN_COOKIE = "bb_primary_pin"
+# writes that do not pin: the audit trail may lag a few seconds (portal login / logout only log)
+PIN_EXEMPT_MODELS = {"auditevent"}
+
+# set by PrimaryPinMiddleware around a request; db_for_write marks it
+_writes = ContextVar("blood_writes", default=None)
+
+
+@contextmanager
+def watch_writes():
+    """:yield: a dict whose "blood" key turns True once the block writes blood data"""
+    seen = {"blood": False}
+    token = _writes.set(seen)
+    try:
+        yield seen
+    finally:
+        _writes.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Send reads of the blood app to a read replica, but only inside views
+    decorated with @replica_reads. Everything else (writes, sessions, auth,
+    and all reads outside reporting views) stays on "default".
+    """
+    route_app_labels = {"blood"}
+
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, "DATABASE_REPLICAS", [])
+        if replicas and _replica_reads.get() and model._meta.app_label in self.route_app_labels:
+            return random.choice(replicas)
+        return None
+
+    def db_for_write(self, model, **hints):
+        seen = _writes.get()
+        if (seen is not None and model._meta.app_label in self.route_app_labels
+                and model._meta.model_name not in PIN_EXEMPT_MODELS):
+            seen["blood"] = True
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        return True
+
+
+def replica_reads(view_func):
+    """
+    Let a read-only view read from a replica, unless this client wrote
+    something in the last REPLICA_STICKY_SECONDS (see PrimaryPinMiddleware).
+    """
+    if iscoroutinefunction(view_func):
+        # the context var is copied into the sync_to_async threads of the view
+        @wraps(view_func)
+        async def _async_wrapped(request, *args, **kwargs):
+            if request.COOKIES.get(PIN_COOKIE):
+                return await view_func(request, *args, **kwargs)
+            token = _replica_reads.set(True)
+            try:
+                return await view_func(request, *args, **kwargs)
+            finally:
+                _replica_reads.reset(token)
+        return _async_wrapped
+
+    @wraps(view_func)
+    def _wrapped(request, *args, **kwargs):
+        if request.COOKIES.get(PIN_COOKIE):
+            return view_func(request, *args, **kwargs)
+        token = _replica_reads.set(True)
+        try:
+            return view_func(request, *args, **kwargs)
+        finally:
+            _replica_reads.reset(token)
+    return _wrapped
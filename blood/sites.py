@@ -0,0 +1,72 @@
+# blood/sites.py
+"""
+Multi-site stock for the planner (compat.plan_dispense_sites):
+
+- stock_by_site(): AVAILABLE, unexpired units per (site, blood type) — one
+  GROUP BY answered from the unit_site_stock index
+- site_order(): where to draw from — the home site, then the other sites by
+  TransferRoute cost (sites without a route cost SITE_DEFAULT_TRANSFER_COST),
+  then units without a site
+
+Both are one query each however many sites there are, so adding sites does
+not add work per request.
+"""
+from django.conf import settings
+from django.db.models import Count, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .compat import merge_site_plan, plan_dispense, plan_dispense_sites
+from .models import DonationUnit, Site, TransferRoute
+
+ANY_SITE = "*"  # plan key of a request without a home site: units from anywhere
+
+
+def home_site_id(city):
+    """:return: pk of the site serving hospitals in `city`, or None"""
+    if not city:
+        return None
+    return Site.objects.filter(city=city).order_by("code").values_list("id", flat=True).first()
+
+
+def stock_by_site(now):
+    """:return: {site_id or None: {blood type: count}}"""
+    rows = (
+        DonationUnit.objects.filter(status=DonationUnit.Status.AVAILABLE)
+        .filter(Q(expiry_at__isnull=True) | Q(expiry_at__gt=now))
+        .values_list("site_id", "blood_type").annotate(n=Count("id")).order_by()
+    )
+    out = {}
+    for site_id, blood_type, n in rows:
+        out.setdefault(site_id, {})[blood_type] = n
+    return out
+
+
+def site_order(home_id):
+    """
+    :return: site ids to draw from: home, then every other site by transfer cost, then units
+             without a site (None). A site without a route still holds reachable stock.
+    """
+    route_cost = TransferRoute.objects.filter(to_site_id=home_id, from_site_id=OuterRef("pk")).values("cost")
+    others = (
+        Site.objects.exclude(pk=home_id)
+        .annotate(cost=Coalesce(Subquery(route_cost), Value(settings.SITE_DEFAULT_TRANSFER_COST)))
+        .order_by("cost", "pk").values_list("id", flat=True)
+    )
+    return [home_id, *others, None]
+
+
+def plan_request(requested_type, qty, home_id, now):
+    """
+    :return: ({site_id: {blood type: units}}, shortfall). Without a home site
+             all stock is one pool, as before sites existed: {ANY_SITE: plan}.
+    """
+    stock = stock_by_site(now)
+    if home_id is None:
+        plan, shortfall = plan_dispense(requested_type, qty, merge_site_plan(stock))
+        return ({ANY_SITE: plan} if plan else {}), shortfall
+    return plan_dispense_sites(requested_type, qty, stock, site_order(home_id))
+
+
+def site_filter(site):
+    """DonationUnit filter kwargs for one key of a plan_request() plan."""
+    return {} if site == ANY_SITE else {"site_id": site}
@@ -1,3 +1,1550 @@
-from django.test import TestCase
+import importlib
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import tempfile
+import time
+import unittest
+from datetime import date, timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core import signing
+from django.core.cache import cache
+from django.core.handlers.base import BaseHandler
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.models import Count, F, ProtectedError, Sum
+from django.http import HttpResponse
+from django.test import (
+    Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .benchmarking import (
+    BENCH_PASSWORD, INVENTORY_SHAPES, ensure_bench_users, grant_portal, percentile, random_inventory, summarize,
+)
+from .compat import DONORS_BY_RECIPIENT, PLANNERS, plan_dispense
+from .forms import DonationForm
+from . import din, eligibility, forecast, metrics, profiling, sites
+from .log_handlers import JsonFormatter, QueuedRotatingFileHandler
+from .middleware import PrimaryPinMiddleware
+from .routers import PIN_COOKIE, ReplicaRouter, replica_reads
+from .models import (
+    AuditEvent, BLOOD_TYPES, DemandForecast, DispenseLine, DispenseLog, DispenseRequest, DonationUnit, Donor,
+    Fulfilment, InventorySnapshot, Site, TransferRoute,
+)
+from .rollups import day_bounds
+
+PORTAL_PASSWORD = "test-portal"
+
+# Upper bound of SQL queries per view. The same view must also issue the
+# same number of queries with 10x the data (see assertQueryBudget).
+QUERY_BUDGETS = {
+    "home_anon": 1,
+    "home_donor": 4,
+    "signup_get": 1,
+    "login_get": 1,
+    "login_post": 11,
+    "logout": 6,
+    "intake_get": 5,
+    "intake_post": 8,
+    "dispense_get": 4,
+    "dispense_post": 7,
+    "profile_get": 5,
+    "portal_login_get": 1,
+    "portal_login_post": 8,
+    "portal_logout": 5,
+    "records": 9,
+    "records_async": 9,
+    "donations_export": 5,
+    "dispensed_export": 5,
+    "inventory": 13,
+    "inventory_async": 13,
+    "request_approve": 18,
+    "request_reject": 11,
+    "donation_delete": 12,
+    "intake_batch": 16,
+    "request_units": 6,
+    "recall": 6,
+    "site_stock": 7,
+    "eligible_donors": 6,
+    "unit_label": 5,
+    "units_scan_status": 4,
+    "units_scan_quarantine": 13,
+    "recall_apply": 13,
+    "metrics": 0,
+    "profiles": 4,
+    "profile_download": 0,
+    "analytics": 10,
+}
+
+SMALL = 2  # fixture "units" per blood type; the large run adds 9x more (10x total)
+DUMMY_CACHE = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+LOCMEM_CACHE = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "tests"}}
+
+
+# budgets are for the uncached (worst-case) path; async views query on the
+# request thread here so CaptureQueriesContext sees (and the test transaction serves) them
+@override_settings(CACHES=DUMMY_CACHE, ASYNC_PARALLEL_QUERIES=False)
+class QueryBudgetTests(TestCase):
+    """
+    Every URL in blood/urls.py, measured with a small and a 10x data set.
+    Catches both extra queries (budget) and N+1 patterns (count grows with data).
+    """
+    _seq = 0
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.donor_user, cls.requester_user = ensure_bench_users()
+
+    def setUp(self):
+        patcher = self.settings(PORTAL_PASSWORD=PORTAL_PASSWORD)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+
+    # ------------------------ fixtures ------------------------
+    def add_data(self, scale):
+        now = timezone.now()
+        donors, units, requests, events = [], [], [], []
+        for _ in range(scale):
+            for bt, _ in BLOOD_TYPES:
+                QueryBudgetTests._seq += 1
+                donors.append(Donor(national_id=f"{100000000 + self._seq:09d}", full_name=f"Donor {bt}"))
+        donors = Donor.objects.bulk_create(donors)
+        for i, donor in enumerate(donors):
+            bt = BLOOD_TYPES[i % len(BLOOD_TYPES)][0]
+            units += [
+                DonationUnit(donor=donor, blood_type=bt, expiry_at=now + timedelta(days=30)),
+                DonationUnit(donor=donor, blood_type=bt, expiry_at=now + timedelta(days=2)),
+                DonationUnit(donor=donor, blood_type=bt, expiry_at=now + timedelta(days=30),
+                             status=DonationUnit.Status.DISPENSED, dispensed_at=now),
+            ]
+            requests.append(DispenseRequest(
+                hospital_name="Rambam Health Care Campus", hospital_city="Haifa",
+                urgency=DispenseRequest.Urgency.URGENT if i % 2 else DispenseRequest.Urgency.REGULAR,
+                requested_type=bt, quantity=1, plan={bt: 1},
+            ))
+            events.append(AuditEvent(user=self.donor_user, role="DONOR", action="donation_create",
+                                     details={"blood_type": bt, "donor": donor.full_name}))
+        DonationUnit.objects.bulk_create(din.assign(units))
+        DispenseRequest.objects.bulk_create(requests)
+        AuditEvent.objects.bulk_create(events)
+
+    def client_for(self, persona):
+        client = Client()
+        if persona == "donor":
+            client.force_login(self.donor_user)
+        elif persona == "requester":
+            client.force_login(self.requester_user)
+        elif persona == "portal":
+            grant_portal(client)
+        return client
+
+    def assertQueryBudget(self, name, prepare, call, expect_status=(200, 302)):
+        """
+        prepare() -> args, runs outside the measurement; call(*args) -> response is measured.
+        Runs once with SMALL data and once with 10x SMALL data.
+        """
+        counts = []
+        for scale in (SMALL, SMALL * 9):
+            self.add_data(scale)
+            args = prepare()
+            with CaptureQueriesContext(connection) as ctx:
+                resp = call(*args)
+            self.assertIn(resp.status_code, expect_status, f"{name}: unexpected status {resp.status_code}")
+            counts.append(len(ctx.captured_queries))
+        self.assertLessEqual(
+            counts[0], QUERY_BUDGETS[name],
+            f"{name}: {counts[0]} queries, budget is {QUERY_BUDGETS[name]}",
+        )
+        self.assertEqual(
+            counts[0], counts[1],
+            f"{name}: query count grows with data size ({counts[0]} -> {counts[1]})",
+        )
+
+    def get(self, name, persona="anon", url_name=None, **params):
+        url = reverse(url_name or name)
+        self.assertQueryBudget(name, lambda: (self.client_for(persona),), lambda c: c.get(url, params))
+
+    # ------------------------ public / auth ------------------------
+    def test_home(self):
+        self.get("home_anon", url_name="home")
+        self.get("home_donor", "donor", url_name="home")
+
+    def test_signup_and_login_pages(self):
+        self.get("signup_get", url_name="signup")
+        self.get("login_get", url_name="login")
+
+    def test_login_post(self):
+        self.assertQueryBudget(
+            "login_post",
+            lambda: (Client(),),
+            lambda c: c.post(reverse("login"), {"username": self.donor_user.username, "password": BENCH_PASSWORD}),
+        )
+
+    def test_logout(self):
+        self.get("logout", "donor")
+
+    # ------------------------ donor / requester ------------------------
+    def test_intake(self):
+        self.get("intake_get", "donor", url_name="intake")
+        self.assertQueryBudget(
+            "intake_post",
+            lambda: (self.client_for("donor"), Donor.objects.update(next_eligible_at=None)),
+            lambda c, _: c.post(reverse("intake"), {}),
+        )
+
+    def test_dispense(self):
+        self.get("dispense_get", "requester", url_name="dispense")
+        self.assertQueryBudget(
+            "dispense_post",
+            lambda: (self.client_for("requester"),),
+            lambda c: c.post(reverse("dispense"), {
+                "urgency": "REGULAR", "hospital": "Rambam Health Care Campus|Haifa",
+                "blood_type": "AB+", "quantity": 3,
+            }),
+        )
+
+    def test_profile(self):
+        self.get("profile_get", "donor", url_name="profile")
+
+    # ------------------------ portal ------------------------
+    def test_portal_login_logout(self):
+        self.get("portal_login_get", url_name="portal_login")
+        self.assertQueryBudget(
+            "portal_login_post",
+            lambda: (Client(),),
+            lambda c: c.post(reverse("portal_login"), {"password": PORTAL_PASSWORD}),
+        )
+        self.get("portal_logout", "portal")
+
+    def test_records(self):
+        self.get("records", "portal")
+        self.get("records_async", "portal")
+
+    def test_exports(self):
+        self.get("donations_export", "portal")
+        self.get("dispensed_export", "portal")
+
+    def test_inventory(self):
+        self.get("inventory", "portal")
+        self.get("inventory_async", "portal")
+
+    # ------------------------ manager actions ------------------------
+    def _new_request(self, requested_type="AB+", quantity=3):
+        # AB+ with 3 units pulls from several compatible types (multi-type plan)
+        return DispenseRequest.objects.create(
+            hospital_name="Sheba Medical Center (Tel HaShomer)", hospital_city="Ramat Gan",
+            requested_type=requested_type, quantity=quantity,
+        )
+
+    def test_request_approve(self):
+        def prepare():
+            DonationUnit.objects.filter(blood_type="AB+").update(status=DonationUnit.Status.DISPENSED)
+            return self.client_for("anon"), self._new_request()
+
+        self.assertQueryBudget(
+            "request_approve", prepare,
+            lambda c, req: c.post(reverse("request_approve", args=[req.pk]), {"portal_password": PORTAL_PASSWORD}),
+        )
+        self.assertTrue(DispenseRequest.objects.filter(
+            requested_type="AB+", quantity=3, status=DispenseRequest.Status.APPROVED).exists())
+
+    def test_request_reject(self):
+        self.assertQueryBudget(
+            "request_reject",
+            lambda: (self.client_for("anon"), self._new_request()),
+            lambda c, req: c.post(reverse("request_reject", args=[req.pk])),
+        )
+
+    def test_donation_delete(self):
+        self.assertQueryBudget(
+            "donation_delete",
+            lambda: (self.client_for("anon"), DonationUnit.objects.first()),
+            lambda c, unit: c.post(reverse("donation_delete", args=[unit.pk]), {"portal_password": PORTAL_PASSWORD}),
+        )
+
+    def test_analytics(self):
+        self.get("analytics", "portal")
+
+    def test_recall(self):
+        self.get("recall", "portal")
+        self.assertQueryBudget(
+            "recall_apply",
+            lambda: (self.client_for("anon"), Donor.objects.order_by("-pk").first().national_id),
+            lambda c, nid: c.post(reverse("recall_apply"), {"national_id": nid, "portal_password": PORTAL_PASSWORD}),
+        )
+
+    def test_site_stock(self):
+        self.get("site_stock", "portal")
+
+    def test_eligible_donors(self):
+        self.get("eligible_donors", "portal")
+
+    def test_request_units(self):
+        req = self._new_request()
+        self.client_for("anon").post(reverse("request_approve", args=[req.pk]), {"portal_password": PORTAL_PASSWORD})
+        self.assertQueryBudget(
+            "request_units",
+            lambda: (self.client_for("portal"),),
+            lambda c: c.get(reverse("request_units", args=[req.pk])),
+            expect_status=(200,),
+        )
+
+    def test_metrics(self):
+        self.assertQueryBudget(
+            "metrics",
+            lambda: (self.client_for("anon"),),
+            lambda c: c.get(reverse("metrics"), headers={"authorization": f"Bearer {PORTAL_PASSWORD}"}),
+            expect_status=(200,),
+        )
+
+    def test_profiles(self):
+        with tempfile.TemporaryDirectory() as tmp, self.settings(PROFILES_DIR=Path(tmp)):
+            self.get("profiles", "portal")
+            client = self.client_for("portal")
+            client.get(reverse("records"), {"_profile": "1"})
+            token = signing.TimestampSigner(salt="blood.profiles").sign(profiling.recent_profiles()[0]["name"])
+            self.assertQueryBudget(
+                "profile_download",
+                lambda: (self.client_for("anon"),),
+                lambda c: c.get(reverse("profile_download", args=[token, "json"])),
+                expect_status=(200,),
+            )
+
+    def test_intake_batch(self):
+        records = [
+            {"national_id": f"3000000{i:02d}", "full_name": "Batch Donor", "blood_type": "O-"}
+            for i in range(25)
+        ] + [{"national_id": "bad", "full_name": "Batch Donor", "blood_type": "O-"}]
+        self.assertQueryBudget(
+            "intake_batch",
+            lambda: (self.client_for("anon"), Donor.objects.update(next_eligible_at=None)),
+            lambda c, _: c.post(reverse("intake_batch"),
+                             json.dumps({"portal_password": PORTAL_PASSWORD, "records": records}),
+                             content_type="application/json"),
+        )
+
+
+    def test_units_scan(self):
+        def scan(action):
+            def prepare():
+                codes = list(DonationUnit.objects.filter(status=DonationUnit.Status.AVAILABLE)
+                             .values_list("din", flat=True)[:200]) + ["Z999900000000", "bad"]
+                return self.client_for("anon"), codes
+            return prepare, lambda c, codes: c.post(
+                reverse("units_scan"),
+                json.dumps({"portal_password": PORTAL_PASSWORD, "action": action, "codes": codes}),
+                content_type="application/json",
+            )
+
+        self.assertQueryBudget("units_scan_status", *scan("status"), expect_status=(200,))
+        self.assertQueryBudget("units_scan_quarantine", *scan("quarantine"), expect_status=(200,))
+
+    def test_unit_label(self):
+        unit = DonationUnit.objects.create(donor=Donor.objects.create(national_id="123456782", full_name="Label"),
+                                           blood_type="B-", din=din.allocate(1)[0])
+        self.assertQueryBudget(
+            "unit_label",
+            lambda: (self.client_for("portal"),),
+            lambda c: c.get(reverse("unit_label", args=[unit.pk])),
+            expect_status=(200,),
+        )
+
+
+class SummarizeTests(SimpleTestCase):
+    def test_empty_and_single_value(self):
+        self.assertEqual(summarize([]), {"count": 0, "errors": 0, "mean_ms": None, "p50_ms": None,
+                                         "p95_ms": None, "p99_ms": None, "max_ms": None})
+        out = summarize([12.5])
+        self.assertEqual((out["count"], out["mean_ms"], out["p50_ms"], out["p99_ms"], out["max_ms"]),
+                         (1, 12.5, 12.5, 12.5, 12.5))
+
+    def test_nearest_rank_percentiles(self):
+        out = summarize(random.Random(1).sample(range(1, 101), 100))  # order does not matter
+        self.assertEqual((out["p50_ms"], out["p95_ms"], out["p99_ms"], out["max_ms"]), (50, 95, 99, 100))
+        out = summarize(list(range(10, 110, 10)))  # 10 values: p95 and p99 fall on the last one
+        self.assertEqual((out["p50_ms"], out["p95_ms"], out["p99_ms"]), (50, 100, 100))
+        self.assertEqual(percentile([1, 2, 3, 4], 0), 1)
+        self.assertEqual(percentile([1, 2, 3, 4], 26), 2)
+
+    def test_errors_and_queries(self):
+        out = summarize([1, 3], queries=[4, 6, 11], errors=2)
+        self.assertEqual((out["count"], out["errors"], out["mean_ms"]), (2, 2, 2))
+        self.assertEqual((out["queries_mean"], out["queries_max"]), (7, 11))
+        self.assertNotIn("queries_mean", summarize([1]))
+
+
+class PlannerPropertyTests(SimpleTestCase):
+    """
+    Randomised (seeded) checks of plan_dispense and equivalence of every
+    planner registered in compat.PLANNERS with the reference implementation.
+    """
+    CASES_PER_SHAPE = 200
+
+    def cases(self):
+        rng = random.Random(1234)
+        for shape in INVENTORY_SHAPES:
+            for _ in range(self.CASES_PER_SHAPE):
+                inv = random_inventory(rng, shape)
+                yield rng.choice(list(DONORS_BY_RECIPIENT)), rng.choice([1, 2, 3, 7, 40, 500, 20000]), inv
+
+    def test_reference_invariants(self):
+        for rtype, qty, inv in self.cases():
+            plan, shortfall = plan_dispense(rtype, qty, inv)
+            ctx = f"{rtype} x{qty} from {inv}"
+            compatible = DONORS_BY_RECIPIENT[rtype]
+            self.assertEqual(sum(plan.values()) + shortfall, qty, ctx)
+            self.assertTrue(set(plan) <= set(compatible), ctx)
+            for dtype, take in plan.items():
+                self.assertTrue(0 < take <= inv.get(dtype, 0), ctx)
+            # shortfall only when every compatible type is exhausted
+            if shortfall:
+                self.assertEqual(sum(inv.get(t, 0) for t in compatible), qty - shortfall, ctx)
+            # a lower-priority type is only used after all higher-priority ones are used up
+            used = [t for t in compatible if t in plan]
+            if used:
+                last = compatible.index(used[-1])
+                for t in compatible[:last]:
+                    self.assertEqual(plan.get(t, 0), inv.get(t, 0), ctx)
+
+    def test_registered_planners_match_reference(self):
+        for name, planner in PLANNERS.items():
+            for rtype, qty, inv in self.cases():
+                self.assertEqual(planner(rtype, qty, dict(inv)), plan_dispense(rtype, qty, inv),
+                                 f"{name}: {rtype} x{qty} from {inv}")
+
+
+@override_settings(CACHES=LOCMEM_CACHE, PORTAL_PASSWORD=PORTAL_PASSWORD)
+class DashboardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        donor = Donor.objects.create(national_id="123456782", full_name="Cache Donor")
+        self.unit = DonationUnit.objects.create(donor=donor, blood_type="O-")
+        DispenseRequest.objects.create(hospital_name="Soroka Medical Center", requested_type="O-", quantity=1)
+
+    def render(self):
+        client = Client()
+        grant_portal(client)
+        with CaptureQueriesContext(connection) as ctx:
+            resp = client.get(reverse("inventory"))
+        self.assertEqual(resp.status_code, 200)
+        unit_counts = [q for q in ctx.captured_queries
+                       if "COUNT" in q["sql"] and "blood_donationunit" in q["sql"]]
+        return resp, len(ctx.captured_queries), len(unit_counts)
+
+    def test_warm_fragments_skip_queries(self):
+        first, n_first, counts_first = self.render()
+        second, n_second, counts_second = self.render()
+        self.assertEqual(counts_first, 3)
+        self.assertEqual(counts_second, 0)
+        self.assertLess(n_second, n_first)
+        self.assertContains(second, "Soroka Medical Center")
+
+    def test_writes_invalidate(self):
+        self.render()
+        with self.captureOnCommitCallbacks(execute=True):
+            Client().post(reverse("donation_delete", args=[self.unit.pk]), {"portal_password": PORTAL_PASSWORD})
+        resp, _, counts = self.render()
+        self.assertEqual(counts, 3)
+        self.assertContains(resp, "donation_delete")
+
+    def test_portal_login_keeps_audit_blocks_cached(self):
+        def view_dashboard():
+            client = Client()
+            client.get(reverse("inventory"))  # remembers the page to return to
+            with self.captureOnCommitCallbacks(execute=True):
+                resp = client.post(reverse("portal_login"), {"password": PORTAL_PASSWORD})
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(client.get(resp["Location"]).status_code, 200)
+            return [q for q in ctx.captured_queries if "blood_auditevent" in q["sql"]]
+
+        self.assertTrue(view_dashboard())
+        self.assertEqual(view_dashboard(), [])
+
+    def test_warm_cache_command(self):
+        call_command("warm_cache", stdout=io.StringIO())
+        _, _, counts = self.render()
+        self.assertEqual(counts, 0)
+
+
+@override_settings(CACHES=DUMMY_CACHE)
+class GenerateDatasetTests(TestCase):
+    def test_approvals_match_dispensed_units(self):
+        call_command("generate_dataset", donors=40, days=60, pending=3, workers=1, stdout=io.StringIO())
+        dispensed = DonationUnit.objects.filter(status=DonationUnit.Status.DISPENSED)
+        self.assertGreater(dispensed.count(), 0)
+        logged = sum(sum(log.dispensed_map.values()) for log in DispenseLog.objects.all())
+        self.assertEqual(logged, dispensed.count())
+        self.assertEqual(Fulfilment.objects.count(), dispensed.count())
+        self.assertEqual(DispenseLine.objects.aggregate(n=Sum("quantity"))["n"], dispensed.count())
+        approved = DispenseRequest.objects.filter(status=DispenseRequest.Status.APPROVED)
+        self.assertEqual(approved.count(), DispenseLog.objects.count())
+        self.assertFalse(approved.annotate(n=Count("fulfilments")).exclude(n=F("quantity")).exists())
+        self.assertEqual(DispenseRequest.objects.filter(status=DispenseRequest.Status.PENDING).count(), 3)
+        # units leave the shelf when their request is approved, before they expire
+        self.assertFalse(dispensed.exclude(dispensed_at=F("fulfilment__dispensed_at")).exists())
+        self.assertFalse(dispensed.filter(dispensed_at__gt=F("expiry_at")).exists())
+
+
+@override_settings(CACHES=DUMMY_CACHE)
+class ImportTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+        (self.dir / "donors.csv").write_text(
+            "national_id,full_name,date_of_birth\n123456782,Import Donor,1990-05-01\n000000018,Second Donor,\n")
+        self.write("donations.jsonl", [
+            {"national_id": "123456782", "blood_type": "A+", "donation_date": "2025-01-10T09:00:00"},
+            {"national_id": "000000018", "blood_type": "O-", "donation_date": "2025-02-01",
+             "status": "DISPENSED", "dispensed_at": "2025-02-05"},
+            {"national_id": "999999999", "blood_type": "O-", "donation_date": "2025-02-01"},  # unknown donor
+            ["not", "an", "object"],
+        ], extra="{broken json\n")
+        self.write("logs.jsonl", [
+            {"requested_type": "O-", "quantity": 1, "dispensed_map": {"O-": 1}, "created_at": "2025-02-05",
+             "hospital_name": "Soroka University Medical Center", "hospital_city": "Beersheba"},
+            "just a string",
+        ])
+
+    def write(self, name, rows, extra=""):
+        (self.dir / name).write_text("".join(json.dumps(r) + "\n" for r in rows) + extra)
+
+    def run_import(self):
+        err = io.StringIO()
+        call_command("import_bloodbank", donors=self.dir / "donors.csv", donations=self.dir / "donations.jsonl",
+                     dispense_logs=self.dir / "logs.jsonl", stdout=io.StringIO(), stderr=err)
+        return err.getvalue()
+
+    def counts(self):
+        return (Donor.objects.count(), DonationUnit.objects.count(), DispenseLog.objects.count(),
+                DispenseLine.objects.count())
+
+    def test_rerun_is_idempotent_and_bad_rows_are_skipped(self):
+        err = self.run_import()
+        self.assertEqual(self.counts(), (2, 2, 1, 1))
+        self.assertEqual(err.count("not an object"), 3)  # list, broken line, string
+        self.assertIn("unknown donor", err)
+        dins = set(DonationUnit.objects.values_list("din", flat=True))
+
+        self.run_import()
+        self.assertEqual(self.counts(), (2, 2, 1, 1))
+        self.assertEqual(set(DonationUnit.objects.values_list("din", flat=True)), dins)
+
+
+    def test_donors_without_a_birth_date_column_keep_the_stored_one(self):
+        self.run_import()
+        (self.dir / "names.csv").write_text(
+            "national_id,full_name\n123456782,Renamed Donor\n")
+        (self.dir / "bad.csv").write_text(
+            "national_id,full_name,date_of_birth\n000000018,Second Donor,1990-02-30\n000000026,Third,31/12/1990\n")
+        call_command("import_bloodbank", donors=self.dir / "names.csv", stdout=io.StringIO(), stderr=io.StringIO())
+        err = io.StringIO()
+        call_command("import_bloodbank", donors=self.dir / "bad.csv", stdout=io.StringIO(), stderr=err)
+        donor = Donor.objects.get(national_id="123456782")
+        self.assertEqual((donor.full_name, donor.date_of_birth), ("Renamed Donor", date(1990, 5, 1)))
+        self.assertIn("day is out of range", err.getvalue())
+        self.assertIn("bad date_of_birth: '31/12/1990'", err.getvalue())
+        self.assertFalse(Donor.objects.filter(national_id="000000026").exists())
+
+    def test_reports_only_the_donations_actually_inserted(self):
+        self.write("numbered.jsonl", [
+            {"national_id": "123456782", "blood_type": "A+", "donation_date": "2025-01-10",
+             "din": "W123425000007"},
+        ])
+        import_bloodbank = importlib.import_module("blood.management.commands.import_bloodbank")
+        out = io.StringIO()
+        # the stored unit is not filtered out first: the INSERT conflict drops it
+        with mock.patch.object(import_bloodbank.Command, "_new_units", lambda self, units: units):
+            for _ in range(2):
+                call_command("import_bloodbank", donors=self.dir / "donors.csv",
+                             donations=self.dir / "numbered.jsonl", stdout=out, stderr=io.StringIO())
+        self.assertEqual(DonationUnit.objects.count(), 1)
+        done = [line for line in out.getvalue().splitlines() if line.startswith("Done donations")]
+        self.assertEqual([line.split(" in ")[0] for line in done],
+                         ["Done donations: 1 row(s)", "Done donations: 0 row(s)"])
+
+
+@override_settings(CACHES=DUMMY_CACHE, NEAR_EXPIRY_DAYS=7)
+class RollupTests(TestCase):
+    def setUp(self):
+        donor = Donor.objects.create(national_id="123456782", full_name="Rollup Donor")
+        today = timezone.localdate()
+        self.d3, self.d2, self.d1 = (today - timedelta(days=n) for n in (3, 2, 1))
+        at = lambda day, hour: day_bounds(day)[0] + timedelta(hours=hour)
+        unit = lambda **kw: DonationUnit.objects.create(donor=donor, blood_type="A+", **kw)
+        unit(donation_date=at(self.d3, 9), expiry_at=at(self.d3, 9) + timedelta(days=42))
+        unit(donation_date=at(self.d3, 10), expiry_at=at(self.d1, 12))                      # expires on d1
+        unit(donation_date=at(self.d3, 11), status=DonationUnit.Status.DISPENSED,
+             dispensed_at=at(self.d2, 8), expiry_at=at(self.d3, 9) + timedelta(days=42))  # dispensed on d2
+        unit(donation_date=at(today, 0))                                                   # today: not rolled up
+
+    def rollup(self, *args):
+        out = io.StringIO()
+        call_command("rollup_inventory", *args, stdout=out)
+        return out.getvalue()
+
+    def rows(self):
+        return {(s.day, s.blood_type): (s.donated, s.dispensed, s.expired, s.available, s.near_expiry)
+                for s in InventorySnapshot.objects.all()}
+
+    def test_counts_per_day(self):
+        self.rollup()
+        rows = self.rows()
+        self.assertEqual(len(rows), 3 * len(BLOOD_TYPES))  # d3..yesterday, every type
+        self.assertEqual(rows[(self.d3, "A+")], (3, 0, 0, 3, 1))
+        self.assertEqual(rows[(self.d2, "A+")], (0, 1, 0, 2, 1))
+        self.assertEqual(rows[(self.d1, "A+")], (0, 0, 1, 1, 0))
+        self.assertEqual(rows[(self.d1, "O-")], (0, 0, 0, 0, 0))
+
+    def test_incremental_and_idempotent(self):
+        self.rollup("--until", self.d2.isoformat())
+        self.assertEqual({day for day, _ in self.rows()}, {self.d3, self.d2})
+        self.rollup()
+        first = self.rows()
+        self.assertIn("Nothing to roll up", self.rollup())
+        self.rollup("--since", self.d3.isoformat())
+        self.assertEqual(self.rows(), first)
+
+    def test_dashboard_trend_reads_rollups(self):
+        self.rollup()
+        client = Client()
+        grant_portal(client)
+        resp = client.get(reverse("inventory"))
+        trend = resp.context["trend"]
+        self.assertEqual(trend["days"], [d.isoformat() for d in (self.d3, self.d2, self.d1)])
+        self.assertEqual(trend["available"]["A+"], [3, 2, 1])
+        self.assertContains(resp, 'id="trend-available"')
+
+
+@override_settings(CACHES=DUMMY_CACHE, FORECAST_ALPHA=0.5, FORECAST_COVER_DAYS=2, FORECAST_SERVICE_Z=0)
+class ForecastTests(TestCase):
+    def setUp(self):
+        self.today = timezone.localdate()
+        # O- units taken: 4 days ago 2, 3 days ago 0, 2 days ago 4, yesterday 2
+        for days_ago, n in ((4, 2), (2, 4), (1, 2)):
+            created = day_bounds(self.today - timedelta(days=days_ago))[0] + timedelta(hours=12)
+            DispenseLog.objects.create(requested_type="O-", quantity=n, dispensed_map={"O-": n}, created_at=created)
+        donor = Donor.objects.create(national_id="123456782", full_name="Forecast Donor")
+        DonationUnit.objects.bulk_create(DonationUnit(donor=donor, blood_type="O-") for _ in range(9))
+
+    def test_ewma_matches_recursive_definition(self):
+        demand = np.array([[2.0, 0.0, 4.0, 2.0], [1.0, 1.0, 1.0, 1.0]])
+        expected = []
+        for row in demand:
+            s_t = row[0]
+            for x in row[1:]:
+                s_t = 0.3 * x + 0.7 * s_t
+            expected.append(s_t)
+        np.testing.assert_allclose(forecast.ewma(demand, 0.3), expected)
+        np.testing.assert_allclose(forecast.moving_average(demand, 2), [3.0, 1.0])
+
+    def test_stores_days_of_supply_and_thresholds(self):
+        call_command("forecast_demand", stdout=io.StringIO())
+        call_command("forecast_demand", stdout=io.StringIO())  # same day: overwritten, not duplicated
+        self.assertEqual(DemandForecast.objects.count(), len(BLOOD_TYPES))
+        row = DemandForecast.objects.get(blood_type="O-")
+        # 2, 0, 4, 2 with alpha 0.5 -> 1, 2.5, 2.25
+        self.assertEqual((row.history_days, row.demand_per_day, row.available), (4, 2.25, 9))
+        self.assertEqual(row.days_of_supply, 4.0)
+        self.assertEqual(row.stockout_on, self.today + timedelta(days=4))
+        self.assertEqual(row.threshold, 5)  # ceil(2.25 * 2)
+        idle = DemandForecast.objects.get(blood_type="AB+")
+        self.assertEqual((idle.days_of_supply, idle.stockout_on, idle.threshold), (None, None, 0))
+
+    def test_dashboard_reads_stored_forecast(self):
+        client = Client()
+        grant_portal(client)
+        self.assertContains(client.get(reverse("inventory")), "No forecast yet")
+        call_command("forecast_demand", stdout=io.StringIO())
+        grant_portal(client)
+        resp = client.get(reverse("inventory"))
+        self.assertContains(resp, 'id="thresholds-data"')
+        self.assertEqual([f.blood_type for f in resp.context["forecast"]], [bt for bt, _ in BLOOD_TYPES])
+
+
+@override_settings(PORTAL_PASSWORD=PORTAL_PASSWORD, CACHES=DUMMY_CACHE)
+class RecallTests(TestCase):
+    def setUp(self):
+        self.donor = Donor.objects.create(national_id="123456782", full_name="Recall Donor")
+        other = Donor.objects.create(national_id="000000018", full_name="Other Donor")
+        now = timezone.now()
+        self.old = DonationUnit.objects.create(donor=self.donor, blood_type="A+", donation_date=now - timedelta(days=20))
+        self.new = DonationUnit.objects.create(donor=self.donor, blood_type="O-", donation_date=now)
+        self.dispensed = DonationUnit.objects.create(donor=self.donor, blood_type="A+", dispensed_at=now,
+                                                     status=DonationUnit.Status.DISPENSED)
+        self.other = DonationUnit.objects.create(donor=other, blood_type="A+", donation_date=now - timedelta(days=20))
+
+    def recall(self, **data):
+        return self.client.post(reverse("recall_apply"), {"portal_password": PORTAL_PASSWORD, **data})
+
+    def statuses(self):
+        return {u.pk: u.status for u in DonationUnit.objects.all()}
+
+    def test_donor_recall_takes_only_available_units(self):
+        self.recall(national_id=self.donor.national_id, reason="positive follow-up")
+        S = DonationUnit.Status
+        self.assertEqual(self.statuses(), {self.old.pk: S.QUARANTINED, self.new.pk: S.QUARANTINED,
+                                           self.dispensed.pk: S.DISPENSED, self.other.pk: S.AVAILABLE})
+        event = AuditEvent.objects.get(action="units_recalled")
+        self.assertEqual((event.details["units"], event.details["by_type"]), (2, {"A+": 1, "O-": 1}))
+
+        # quarantined units are out of stock
+        grant_portal(self.client)
+        rows = {r["bt"]: r["available"] for r in self.client.get(reverse("inventory")).context["inventory"]["rows"]}
+        self.assertEqual((rows["A+"], rows["O-"]), (1, 0))
+
+        # nothing left to take: no second event
+        self.recall(national_id=self.donor.national_id)
+        self.assertEqual(AuditEvent.objects.filter(action="units_recalled").count(), 1)
+
+    def test_window_recall(self):
+        day = timezone.localdate(self.old.donation_date).isoformat()
+        self.recall(since=day, until=day)
+        self.assertEqual(DonationUnit.objects.get(pk=self.other.pk).status, DonationUnit.Status.QUARANTINED)
+        self.assertEqual(DonationUnit.objects.get(pk=self.new.pk).status, DonationUnit.Status.AVAILABLE)
+
+    def test_rejects_bad_password_and_empty_filter(self):
+        self.recall(national_id=self.donor.national_id, portal_password="wrong")
+        self.recall()
+        self.recall(national_id="999999999")
+        self.assertFalse(DonationUnit.objects.filter(status=DonationUnit.Status.QUARANTINED).exists())
+        self.assertFalse(AuditEvent.objects.filter(action="units_recalled").exists())
+
+    def test_rejects_impossible_dates(self):
+        resp = self.recall(national_id=self.donor.national_id, since="2024-02-30")
+        self.assertRedirects(resp, reverse("recall"), fetch_redirect_response=False)
+        self.assertEqual([str(m) for m in resp.wsgi_request._messages], ["Invalid since date — nothing was recalled."])
+        self.assertFalse(DonationUnit.objects.filter(status=DonationUnit.Status.QUARANTINED).exists())
+
+
+@override_settings(PORTAL_PASSWORD=PORTAL_PASSWORD, CACHES=DUMMY_CACHE)
+class SiteTests(TestCase):
+    def setUp(self):
+        self.haifa, self.tlv, self.bsh, self.eilat = (
+            Site.objects.create(code=code, name=code, city=city)
+            for code, city in (("HFA", "Haifa"), ("TLV", "Tel Aviv"), ("BSH", "Beersheba"), ("ETH", "Eilat"))
+        )
+        TransferRoute.objects.create(from_site=self.bsh, to_site=self.haifa, cost=5)
+        TransferRoute.objects.create(from_site=self.tlv, to_site=self.haifa, cost=1)
+        donor = Donor.objects.create(national_id="123456782", full_name="Site Donor")
+        for site, n in ((self.haifa, 1), (self.tlv, 2), (self.bsh, 5), (self.eilat, 4), (None, 1)):
+            DonationUnit.objects.bulk_create(DonationUnit(donor=donor, blood_type="A+", site=site) for _ in range(n))
+
+    def test_home_site_first_then_routes_by_cost(self):
+        plan, shortfall = sites.plan_request("A+", 4, self.haifa.pk, timezone.now())
+        self.assertEqual((plan, shortfall), ({self.haifa.pk: {"A+": 1}, self.tlv.pk: {"A+": 2},
+                                              self.bsh.pk: {"A+": 1}}, 0))
+        # Eilat has no route to Haifa: after the routed sites; units without a site come last
+        plan, shortfall = sites.plan_request("A+", 14, self.haifa.pk, timezone.now())
+        self.assertEqual((plan[self.eilat.pk], plan[None], shortfall), ({"A+": 4}, {"A+": 1}, 1))
+        self.assertEqual(sites.site_order(self.haifa.pk),
+                         [self.haifa.pk, self.tlv.pk, self.bsh.pk, self.eilat.pk, None])
+
+    @override_settings(SITE_DEFAULT_TRANSFER_COST=3)
+    def test_unrouted_sites_use_the_default_cost(self):
+        self.assertEqual(sites.site_order(self.haifa.pk),
+                         [self.haifa.pk, self.tlv.pk, self.eilat.pk, self.bsh.pk, None])
+
+    def test_without_home_site_all_stock_is_one_pool(self):
+        plan, shortfall = sites.plan_request("A+", 13, None, timezone.now())
+        self.assertEqual((plan, shortfall), ({sites.ANY_SITE: {"A+": 13}}, 0))
+
+    def test_request_is_filled_from_home_site_first(self):
+        _, requester = ensure_bench_users()
+        self.client.force_login(requester)
+        self.client.post(reverse("dispense"), {"urgency": "REGULAR", "hospital": "Rambam Health Care Campus|Haifa",
+                                               "blood_type": "A+", "quantity": 3})
+        req = DispenseRequest.objects.get()
+        self.assertEqual((req.site, req.plan), (self.haifa, {"A+": 3}))
+
+        self.client.post(reverse("request_approve", args=[req.pk]), {"portal_password": PORTAL_PASSWORD})
+        taken = sorted(f.unit.site.code for f in Fulfilment.objects.select_related("unit__site"))
+        self.assertEqual(taken, ["HFA", "TLV", "TLV"])
+
+
+@override_settings(PORTAL_PASSWORD=PORTAL_PASSWORD, CACHES=DUMMY_CACHE, DIN_FACILITY_CODE="W1234")
+class DonationNumberTests(TestCase):
+    def setUp(self):
+        self.donor = Donor.objects.create(national_id="123456782", full_name="Scan Donor")
+
+    def scan(self, action, codes, **extra):
+        resp = self.client.post(
+            reverse("units_scan"),
+            json.dumps({"portal_password": PORTAL_PASSWORD, "action": action, "codes": codes, **extra}),
+            content_type="application/json",
+        )
+        return resp.json()
+
+    def test_check_character_and_parsing(self):
+        number = din.make_din(2026, 123)
+        self.assertEqual(number, "W123426000123")
+        self.assertEqual(din.format_din(number), "W1234 26 000123")
+        check = din.check_char(number)
+        for code in (number, f"={number}", f"{number}{check}", f"{number}00{check}", "w1234 26 000123"):
+            self.assertEqual(din.parse(code), number, code)
+        wrong = din.CHECK_CHARS[(din.CHECK_CHARS.index(check) + 1) % 37]
+        for code in (f"{number}{wrong}", "W12342600012", "12345260001234", ""):
+            with self.assertRaises(ValueError, msg=code):
+                din.parse(code)
+
+    def test_sequences_are_consecutive_per_year(self):
+        self.assertEqual(din.allocate(2, 2026), ["W123426000001", "W123426000002"])
+        self.assertEqual(din.allocate(1, 2026), ["W123426000003"])
+        self.assertEqual(din.allocate(1, 2025), ["W123425000001"])
+
+    def test_intake_assigns_numbers(self):
+        donor_user, _ = ensure_bench_users()
+        self.client.force_login(donor_user)
+        self.client.post(reverse("intake"), {})
+        self.client.post(reverse("intake_batch"), json.dumps({
+            "portal_password": PORTAL_PASSWORD,
+            "records": [{"national_id": nid, "full_name": "Scan Donor", "blood_type": "O-"}
+                        for nid in ("123456782", "000000018", "000000026")],
+        }), content_type="application/json")
+        numbers = list(DonationUnit.objects.values_list("din", flat=True))
+        self.assertEqual(len(numbers), 4)
+        self.assertEqual(len(set(numbers)), 4)
+        self.assertTrue(all(n.startswith("W1234") for n in numbers))
+
+    def test_scan_resolves_with_one_query_and_dispenses(self):
+        units = DonationUnit.objects.bulk_create(din.assign(
+            [DonationUnit(donor=self.donor, blood_type=bt) for bt in ("A+", "A+", "O-")]
+        ))
+        codes = [u.din + din.check_char(u.din) for u in units] + ["W123499999999", "nonsense"]
+
+        with CaptureQueriesContext(connection) as ctx:
+            out = self.scan("status", codes)
+        self.assertEqual(sum("blood_donationunit" in q["sql"] for q in ctx.captured_queries), 1)
+        self.assertEqual(out["found"], 3)
+        self.assertEqual([r["ok"] for r in out["results"]], [True, True, True, False, False])
+        self.assertEqual(out["results"][3]["error"], "unknown donation number")
+
+        out = self.scan("dispense", codes[:2], hospital="Rambam Health Care Campus|Haifa")
+        self.assertEqual((out["changed"], [r["status"] for r in out["results"]]), (2, ["DISPENSED"] * 2))
+        self.assertEqual(DispenseLog.objects.get().dispensed_map, {"A+": 2})
+        self.assertEqual(DispenseLine.objects.get().hospital_city, "Haifa")
+
+        # already dispensed units are reported, not changed
+        out = self.scan("quarantine", codes[:3])
+        self.assertEqual([r["changed"] for r in out["results"]], [False, False, True])
+        self.assertEqual(DonationUnit.objects.get(pk=units[2].pk).status, DonationUnit.Status.QUARANTINED)
+        self.assertEqual(AuditEvent.objects.filter(action="units_scanned").count(), 2)
+
+    def test_import_moves_the_sequence_past_imported_numbers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "donations.jsonl"
+            path.write_text(json.dumps({"national_id": self.donor.national_id, "blood_type": "A+",
+                                        "donation_date": "2026-03-01", "din": din.make_din(2026, 5)}) + "\n")
+            call_command("import_bloodbank", donations=path, stdout=io.StringIO(), stderr=io.StringIO())
+            self.assertEqual(din.allocate(1, 2026), [din.make_din(2026, 6)])
+            # a second run of the same file does not fail on the existing number
+            call_command("import_bloodbank", donations=path, stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertEqual(DonationUnit.objects.filter(din=din.make_din(2026, 5)).count(), 1)
+
+    def test_scan_never_dispenses_expired_units(self):
+        now = timezone.now()
+        fresh, expired = DonationUnit.objects.bulk_create(din.assign([
+            DonationUnit(donor=self.donor, blood_type="A+", expiry_at=now + timedelta(days=5)),
+            DonationUnit(donor=self.donor, blood_type="A+", expiry_at=now - timedelta(days=3)),
+        ]))
+        out = self.scan("dispense", [fresh.din, expired.din])
+        self.assertEqual(out["changed"], 1)
+        self.assertEqual(out["results"][1], {**out["results"][1], "ok": False, "error": "expired", "changed": False})
+        self.assertEqual(DonationUnit.objects.get(pk=expired.pk).status, DonationUnit.Status.AVAILABLE)
+        self.assertEqual(DispenseLog.objects.get().dispensed_map, {"A+": 1})
+        # an expired unit can still be taken out of stock
+        out = self.scan("quarantine", [expired.din])
+        self.assertEqual(out["results"][0]["status"], DonationUnit.Status.QUARANTINED)
+
+    def test_records_search_by_scanned_number(self):
+        unit = DonationUnit.objects.create(donor=self.donor, blood_type="B+", din=din.allocate(1)[0])
+        DonationUnit.objects.create(donor=self.donor, blood_type="B+", din=din.allocate(1)[0])
+        grant_portal(self.client)
+        resp = self.client.get(reverse("records"), {"din": "=" + unit.din + din.check_char(unit.din)})
+        self.assertEqual([d.pk for d in resp.context["donations"]], [unit.pk])
+
+
+@override_settings(PORTAL_PASSWORD=PORTAL_PASSWORD, CACHES=DUMMY_CACHE)
+class IntakeBatchTests(TestCase):
+    def batch(self, records, password=PORTAL_PASSWORD):
+        return self.client.post(reverse("intake_batch"), json.dumps({
+            "portal_password": password, "records": records,
+        }), content_type="application/json")
+
+    def test_every_row_gets_its_own_result(self):
+        out = self.batch([
+            {"national_id": "300000001", "full_name": "Drive Donor", "blood_type": "B+"},
+            {"national_id": "12345", "full_name": "Short Id", "blood_type": "B+"},
+            {"national_id": "300000002", "full_name": "Bad Type", "blood_type": "C+"},
+            "not a row",
+            {"national_id": "300000003", "full_name": "Other Donor", "blood_type": "O-"},
+        ]).json()
+        self.assertEqual((out["created"], out["failed"]), (2, 3))
+        self.assertEqual([r["ok"] for r in out["results"]], [True, False, False, False, True])
+        self.assertEqual(list(out["results"][1]["errors"]), ["national_id"])
+        self.assertEqual(list(out["results"][2]["errors"]), ["blood_type"])
+        self.assertEqual(set(out["results"][3]["errors"]), {"national_id", "full_name", "blood_type"})
+        units = DonationUnit.objects.in_bulk([out["results"][0]["id"], out["results"][4]["id"]])
+        self.assertEqual(sorted((u.donor.national_id, u.blood_type) for u in units.values()),
+                         [("300000001", "B+"), ("300000003", "O-")])
+        self.assertFalse(Donor.objects.filter(national_id="300000002").exists())
+        self.assertEqual(AuditEvent.objects.filter(action="donation_create").count(), 2)
+
+    def test_existing_donor_name_is_updated(self):
+        donor = Donor.objects.create(national_id="300000001", full_name="Old Name")
+        out = self.batch([{"national_id": "300000001", "full_name": "New Name", "blood_type": "A-"}]).json()
+        self.assertEqual(out["created"], 1)
+        self.assertEqual(Donor.objects.count(), 1)
+        donor.refresh_from_db()
+        self.assertEqual(donor.full_name, "New Name")
+        self.assertEqual(DonationUnit.objects.get().donor, donor)
+
+    @override_settings(BATCH_INTAKE_MAX_ROWS=2)
+    def test_row_limit(self):
+        rows = [{"national_id": f"30000000{i}", "full_name": "Drive Donor", "blood_type": "B+"} for i in range(3)]
+        resp = self.batch(rows)
+        self.assertEqual((resp.status_code, resp.json()["error"]), (400, "Too many records (max 2)."))
+        self.assertFalse(DonationUnit.objects.exists())
+        self.assertEqual(self.batch(rows[:2]).json()["created"], 2)
+
+    def test_wrong_password(self):
+        resp = self.batch([{"national_id": "300000001", "full_name": "Drive Donor", "blood_type": "B+"}],
+                          password="wrong")
+        self.assertEqual(resp.status_code, 403)
+        self.assertFalse(Donor.objects.exists())
+
+
+@override_settings(PORTAL_PASSWORD=PORTAL_PASSWORD, CACHES=DUMMY_CACHE)
+class EligibilityTests(TestCase):
+    def setUp(self):
+        self.user, _ = ensure_bench_users()
+        self.donor = Donor.objects.get(national_id=self.user.profile.national_id)
+        self.client.force_login(self.user)
+
+    def batch(self, *nids):
+        return self.client.post(reverse("intake_batch"), json.dumps({
+            "portal_password": PORTAL_PASSWORD,
+            "records": [{"national_id": nid, "full_name": "Drive Donor", "blood_type": "B+"} for nid in nids],
+        }), content_type="application/json").json()
+
+    def test_intake_enforces_interval_from_the_donor_row(self):
+        self.client.post(reverse("intake"), {})
+        self.donor.refresh_from_db()
+        unit = DonationUnit.objects.get()
+        self.assertEqual((self.donor.last_donation_at, self.donor.blood_type), (unit.donation_date, "O+"))
+        self.assertEqual(self.donor.next_eligible_at, unit.donation_date + timedelta(days=56))
+
+        with self.assertNumQueries(1):  # no read of the donor's history
+            form = DonationForm({"national_id": self.donor.national_id, "full_name": "Bench Donor",
+                                 "blood_type": "O+"})
+            self.assertFalse(form.is_valid())
+        self.assertIn("Next donation allowed", form.non_field_errors()[0])
+        self.client.post(reverse("intake"), {})
+        self.assertEqual(DonationUnit.objects.count(), 1)
+
+        later = unit.donation_date + timedelta(days=56)
+        self.assertIsNone(eligibility.check(self.donor, later))
+
+    def test_intake_uses_a_donor_created_after_validation(self):
+        form = DonationForm({"national_id": "300000009", "full_name": "Race Donor", "blood_type": "A+"})
+        self.assertTrue(form.is_valid())
+        donor = Donor.objects.create(national_id="300000009", full_name="Race Donor")  # another request
+        self.assertEqual(form.save().donor, donor)
+        self.assertEqual(Donor.objects.filter(national_id="300000009").count(), 1)
+
+    def test_age_limits(self):
+        today = timezone.localdate()
+        self.donor.date_of_birth = today.replace(year=today.year - 16)
+        self.donor.save()
+        self.assertIn("at least 17", eligibility.check(self.donor))
+        self.donor.date_of_birth = date(today.year - 70, 1, 1)
+        self.assertIn("at most 65", eligibility.check(self.donor))
+        self.donor.date_of_birth = None
+        self.assertIsNone(eligibility.check(self.donor))
+
+    def test_batch_refuses_ineligible_and_repeated_donors(self):
+        out = self.batch("300000001", "300000001", self.donor.national_id)
+        self.assertEqual([r["ok"] for r in out["results"]], [True, False, True])
+        out = self.batch("300000001", "300000002")
+        self.assertEqual([r["ok"] for r in out["results"]], [False, True])
+        self.assertIn("Next donation allowed", out["results"][0]["errors"]["national_id"][0])
+        self.assertEqual(Donor.objects.get(national_id="300000002").blood_type, "B+")
+
+    def test_eligible_counts_and_call_list(self):
+        self.batch("300000001")  # just donated: not eligible
+        now = timezone.now()
+        Donor.objects.bulk_create([
+            Donor(national_id="300000002", full_name="Old Donor", blood_type="B+",
+                  next_eligible_at=now - timedelta(days=3)),
+            Donor(national_id="300000003", full_name="Young Donor", blood_type="B+",
+                  date_of_birth=timezone.localdate().replace(year=now.year - 16)),
+            Donor(national_id="300000004", full_name="Never Donated", blood_type="A-"),
+        ])
+        with CaptureQueriesContext(connection) as ctx:
+            counts = eligibility.eligible_counts(now)
+        self.assertEqual((counts["B+"], counts["A-"], counts["O-"]), (1, 1, 0))
+        self.assertIn("COUNT(*)", ctx.captured_queries[0]["sql"])  # index-only on donor_eligible
+
+        grant_portal(self.client)
+        resp = self.client.get(reverse("eligible_donors"), {"blood_type": "B+", "format": "csv"})
+        self.assertEqual(resp.content.decode().splitlines()[1].split(",")[:2], ["300000002", "Old Donor"])
+
+    def test_rebuild_from_units(self):
+        when = timezone.now() - timedelta(days=10)
+        DonationUnit.objects.bulk_create([
+            DonationUnit(donor=self.donor, blood_type="A+", donation_date=when - timedelta(days=100)),
+            DonationUnit(donor=self.donor, blood_type="AB-", donation_date=when),
+        ])
+        eligibility.rebuild()
+        self.donor.refresh_from_db()
+        self.assertEqual((self.donor.last_donation_at, self.donor.blood_type), (when, "AB-"))
+        self.assertEqual(self.donor.next_eligible_at, when + timedelta(days=56))
+
+
+@override_settings(PORTAL_PASSWORD=PORTAL_PASSWORD, CACHES=DUMMY_CACHE)
+class DispenseInstrumentationTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        donor = Donor.objects.create(national_id="123456782", full_name="Dispense Donor")
+        # one unit per type: AB+ x3 needs a plan over three types
+        for btype in ("A+", "B+", "O+"):
+            DonationUnit.objects.create(donor=donor, blood_type=btype)
+        self.req = DispenseRequest.objects.create(hospital_name="Rambam Health Care Campus",
+                                                  requested_type="AB+", quantity=3)
+
+    def approve(self):
+        return self.client.post(reverse("request_approve", args=[self.req.pk]),
+                                {"portal_password": PORTAL_PASSWORD})
+
+    def test_success_records_lock_and_txn_details(self):
+        self.approve()
+        event = AuditEvent.objects.get(action="request_approved")
+        self.assertLessEqual({"lock_ms", "rows_skipped", "txn_ms"}, set(event.details))
+        self.assertEqual(event.details["rows_skipped"], 0)
+        self.assertGreaterEqual(event.details["txn_ms"], event.details["lock_ms"])
+        lines = DispenseLine.objects.order_by("supplied_type")
+        self.assertEqual([(l.supplied_type, l.quantity, l.hospital_name) for l in lines],
+                         [(bt, 1, "Rambam Health Care Campus") for bt in ("A+", "B+", "O+")])
+        body = metrics.render_prometheus(metrics.snapshot())
+        self.assertIn('bloodbank_dispense_transactions_total{outcome="fulfilled"} 1', body)
+        self.assertIn("bloodbank_dispense_lock_seconds_count 1", body)
+
+        grant_portal(self.client)
+        resp = self.client.get(reverse("inventory"))
+        self.assertEqual(resp.context["dispense_health"]["approved"], 1)
+        self.assertContains(resp, "Dispensing health (24h)")
+
+        grant_portal(self.client)
+        ctx = self.client.get(reverse("analytics"), {"period": "month"}).context
+        self.assertEqual(ctx["totals"], {"units": 3, "requests": 1})
+        self.assertEqual(ctx["by_hospital"][0]["hospital_name"], "Rambam Health Care Campus")
+        self.assertEqual(ctx["by_requested"], [{"requested_type": "AB+", "units": 3, "requests": 1}])
+        self.assertEqual(len(ctx["by_supplied"]), 3)
+
+    def test_analytics_ignores_impossible_dates(self):
+        self.approve()
+        grant_portal(self.client)
+        resp = self.client.get(reverse("analytics"), {"since": "2024-02-30", "until": "2024-13-01"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual((resp.context["until"], resp.context["totals"]["units"]), (timezone.localdate(), 3))
+
+    def test_fulfilment_links_units_and_request(self):
+        self.approve()
+        self.req.refresh_from_db()
+        self.assertEqual(self.req.status, DispenseRequest.Status.APPROVED)
+        # which units did the request get / where did this donor's blood go
+        self.assertEqual(sorted(f.unit.blood_type for f in self.req.fulfilments.select_related("unit")),
+                         ["A+", "B+", "O+"])
+        unit = DonationUnit.objects.get(blood_type="B+")
+        self.assertEqual((unit.fulfilment.request_id, unit.fulfilment.hospital_name),
+                         (self.req.pk, "Rambam Health Care Campus"))
+        self.assertEqual(unit.fulfilment.dispensed_at, unit.dispensed_at)
+
+        # a second approval of the same request does nothing
+        resp = self.approve()
+        self.assertRedirects(resp, reverse("inventory"), fetch_redirect_response=False)
+        self.assertEqual(Fulfilment.objects.count(), 3)
+        self.assertEqual(AuditEvent.objects.filter(action="request_approved").count(), 1)
+
+        grant_portal(self.client)
+        self.assertContains(self.client.get(reverse("request_units", args=[self.req.pk])), "Dispense Donor", count=3)
+
+    def test_fulfilments_outlive_deletes(self):
+        self.approve()
+        unit = Fulfilment.objects.select_related("unit").first().unit
+        resp = self.client.post(reverse("donation_delete", args=[unit.pk]), {"portal_password": PORTAL_PASSWORD})
+        self.assertEqual([str(m) for m in resp.wsgi_request._messages][-1],
+                         "This unit was dispensed to a request and cannot be deleted.")
+        self.assertTrue(DonationUnit.objects.filter(pk=unit.pk).exists())
+        with self.assertRaises(ProtectedError):
+            self.req.delete()
+
+        stress_approve = importlib.import_module("blood.management.commands.stress_approve")
+        self.req.hospital_name = "Stress t1"
+        self.req.save()
+        open_req = DispenseRequest.objects.create(hospital_name="Stress t1", requested_type="O+", quantity=1)
+        stress_approve.Command._cleanup("t1")
+        self.assertEqual(list(DispenseRequest.objects.values_list("pk", flat=True)), [self.req.pk])
+        self.assertFalse(DispenseRequest.objects.filter(pk=open_req.pk).exists())
+        self.assertEqual(Fulfilment.objects.count(), 3)
+
+    def test_inventory_change_mid_transaction_rolls_back(self):
+        taken = []
+
+        def concurrent_dispense(execute, sql, params, many, context):
+            result = execute(sql, params, many, context)
+            if not taken and sql.startswith("UPDATE") and "blood_donationunit" in sql:
+                # another transaction takes every remaining unit after our first type
+                taken.append(True)
+                DonationUnit.objects.filter(status=DonationUnit.Status.AVAILABLE).update(
+                    status=DonationUnit.Status.DISPENSED)
+            return result
+
+        with connection.execute_wrapper(concurrent_dispense):
+            self.approve()
+
+        self.assertEqual(DonationUnit.objects.filter(status=DonationUnit.Status.AVAILABLE).count(), 3)
+        self.assertEqual(DispenseRequest.objects.get(pk=self.req.pk).status, DispenseRequest.Status.PENDING)
+        self.assertFalse(Fulfilment.objects.exists())
+        event = AuditEvent.objects.get(action="request_approve_failed")
+        self.assertEqual(event.details["outcome"], "inventory_changed")
+        self.assertGreater(event.details["rows_skipped"], 0)  # planned rows the locking read did not get
+        self.assertFalse(AuditEvent.objects.filter(action="request_approved").exists())
+
+        grant_portal(self.client)
+        health = self.client.get(reverse("inventory")).context["dispense_health"]
+        self.assertEqual((health["failed"], health["failure_rate"], health["warn"]), (1, 100.0, True))
+
+
+@override_settings(CACHES=DUMMY_CACHE, ASYNC_PARALLEL_QUERIES=True)
+class AsyncViewTests(TransactionTestCase):
+    """The async variants (queries in parallel threads) must show what the sync views show."""
+
+    def setUp(self):
+        now = timezone.now()
+        donors = Donor.objects.bulk_create(
+            Donor(national_id=f"{400000000 + i:09d}", full_name=f"Async Donor {i}") for i in range(40)
+        )
+        DonationUnit.objects.bulk_create(
+            DonationUnit(donor=d, blood_type=BLOOD_TYPES[i % len(BLOOD_TYPES)][0],
+                         expiry_at=now + timedelta(days=i % 10),
+                         status=DonationUnit.Status.DISPENSED if i % 3 == 0 else DonationUnit.Status.AVAILABLE,
+                         dispensed_at=now if i % 3 == 0 else None)
+            for i, d in enumerate(donors)
+        )
+        DispenseRequest.objects.create(hospital_name="Hadassah Ein Kerem", requested_type="A+", quantity=2,
+                                       urgency=DispenseRequest.Urgency.URGENT)
+        AuditEvent.objects.bulk_create(AuditEvent(action=f"event_{i}") for i in range(30))
+
+    def fetch(self, name, user=None, **params):
+        client = Client()
+        if user is not None:
+            client.force_login(user)
+        grant_portal(client)
+        resp = client.get(reverse(name), params)
+        self.assertEqual(resp.status_code, 200)
+        return resp.context
+
+    def test_records_matches_sync(self):
+        params = {"sort": "name", "page": "2", "dpage": "1"}
+        sync_ctx, async_ctx = self.fetch("records", **params), self.fetch("records_async", **params)
+        for key in ("donations", "dispensed"):
+            self.assertEqual([u.pk for u in sync_ctx[key]], [u.pk for u in async_ctx[key]])
+            self.assertEqual(sync_ctx[key].paginator.count, async_ctx[key].paginator.count)
+            self.assertEqual(sync_ctx[key].number, async_ctx[key].number)
+
+    def test_inventory_matches_sync(self):
+        sync_ctx, async_ctx = self.fetch("inventory", epage="2"), self.fetch("inventory_async", epage="2")
+        self.assertEqual(sync_ctx["inventory"]["rows"], async_ctx["inventory"]["rows"])
+        self.assertEqual([e.pk for e in sync_ctx["events"]], [e.pk for e in async_ctx["events"]])
+        self.assertEqual([r.pk for r in sync_ctx["pending_requests"]],
+                         [r.pk for r in async_ctx["pending_requests"]])
+        self.assertEqual(async_ctx["urgent_pending_count"], 1)
+
+    def test_inventory_shows_the_user_role(self):
+        _, requester = ensure_bench_users()
+        sync_ctx, async_ctx = self.fetch("inventory", user=requester), self.fetch("inventory_async", user=requester)
+        self.assertEqual(async_ctx["user_role"], sync_ctx["user_role"])
+        self.assertEqual(async_ctx["user_role"], requester.profile.role)
+
+    def test_requires_portal_pass(self):
+        resp = Client().get(reverse("inventory_async"))
+        self.assertRedirects(resp, reverse("portal_login"), fetch_redirect_response=False)
+
+
+@override_settings(PORTAL_PASSWORD=PORTAL_PASSWORD, CACHES=DUMMY_CACHE, ALLOWED_HOSTS=["localhost"])
+class ReplayAuditTests(TransactionTestCase):
+    """The replay threads use their own connections: the events must be committed."""
+
+    def test_replays_a_fixed_window(self):
+        t0 = timezone.now() - timedelta(hours=1)
+        events = [
+            ("s1", "login", {}, "DONOR"),
+            ("s1", "donation_create", {"blood_type": "O+"}, ""),
+            ("s1", "donation_create", {"blood_type": "O+"}, ""),  # second visit: no interval in a replay
+            ("s2", "portal_login", {}, ""),
+            ("s2", "donation_delete", {"blood_type": "AB-"}, ""),  # no AB- unit to delete: skipped
+            ("s3", "settings_changed", {}, ""),  # no replay step: skipped
+            ("s3", "request_approved", {"blood_type": "O+", "qty": 1}, ""),  # no stock: still a served request
+            ("s3", "request_rejected", {"blood_type": "O+", "qty": 1}, ""),  # fails below
+        ]
+        AuditEvent.objects.bulk_create(
+            AuditEvent(session_key=key, action=action, details=details, role=role,
+                       created_at=t0 + timedelta(seconds=i))
+            for i, (key, action, details, role) in enumerate(events)
+        )
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        out = Path(tmp.name) / "replay.json"
+        replay_audit = importlib.import_module("blood.management.commands.replay_audit")
+        with mock.patch.object(replay_audit.ReplaySession, "do_request_rejected", side_effect=RuntimeError):
+            call_command("replay_audit", on_copy=True, since=(t0 - timedelta(minutes=1)).isoformat(),
+                         until=timezone.now().isoformat(), speed=1000, concurrency=2, output=str(out),
+                         stdout=io.StringIO())
+
+        actions = json.loads(out.read_text())["actions"]
+        counts = {name: (row["count"], row["errors"], row["skipped"]) for name, row in actions.items()}
+        self.assertEqual(counts, {
+            "donation_create": (2, 0, 0),
+            "donation_delete": (0, 0, 1),
+            "login": (1, 0, 0),
+            "portal_login": (1, 0, 0),
+            "request_approved": (1, 0, 0),
+            "request_rejected": (0, 1, 0),
+            "settings_changed": (0, 0, 1),
+        })
+        self.assertEqual(DonationUnit.objects.count(), 2)
+        self.assertEqual(settings.DONATION_INTERVAL_DAYS, 56)  # only overridden during the run
+
+
+@override_settings(PORTAL_PASSWORD=PORTAL_PASSWORD, METRICS_TOKEN="")
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def scrape(self, **headers):
+        return self.client.get(reverse("metrics"), headers=headers)
+
+    def test_records_views_and_renders_prometheus_text(self):
+        self.client.get(reverse("home"))
+        self.client.get(reverse("home"))
+        self.client.get(reverse("login"))
+        body = self.scrape(authorization=f"Bearer {PORTAL_PASSWORD}").content.decode()
+        self.assertIn("# TYPE bloodbank_http_request_duration_seconds histogram", body)
+        self.assertIn('bloodbank_http_request_duration_seconds_count{view="home"} 2', body)
+        self.assertIn('bloodbank_http_requests_total{method="GET",status="200",view="login"} 1', body)
+        self.assertIn('bloodbank_db_queries_per_request_bucket{view="home",le="+Inf"} 2', body)
+        self.assertIn('bloodbank_http_response_size_bytes_sum{view="login"}', body)
+
+    def test_counts_queries_per_view(self):
+        user, _ = ensure_bench_users()
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse("home"))
+        counts = {tuple(labels): value for name, labels, value in metrics.snapshot()["histograms"]
+                  if name == "bloodbank_db_queries_per_request"}
+        hist = counts[(("view", "home"),)]
+        self.assertEqual(sum(hist[:-1]), 1)  # one request observed
+        self.assertEqual(hist[-1], len(ctx.captured_queries))  # sum = its query count
+
+    def test_auth(self):
+        self.assertEqual(self.scrape(authorization="Bearer nope").status_code, 401)
+        self.assertRedirects(self.scrape(), reverse("portal_login"), fetch_redirect_response=False)
+        grant_portal(self.client)
+        self.assertEqual(self.scrape().status_code, 200)
+
+    def test_merges_worker_files(self):
+        with tempfile.TemporaryDirectory() as tmp, self.settings(METRICS_DIR=tmp):
+            other = {
+                "counters": [["bloodbank_http_requests_total",
+                              [["method", "GET"], ["status", "200"], ["view", "home"]], 5]],
+                "histograms": [],
+            }
+            Path(tmp, "metrics-999999.json").write_text(json.dumps(other))
+            self.client.get(reverse("home"))
+            body = self.scrape(authorization=f"Bearer {PORTAL_PASSWORD}").content.decode()
+            self.assertTrue(metrics.worker_file(Path(tmp)).exists())
+        self.assertIn('bloodbank_http_requests_total{method="GET",status="200",view="home"} 6', body)
+
+    def test_files_of_dead_workers_expire(self):
+        with tempfile.TemporaryDirectory() as tmp, self.settings(METRICS_DIR=tmp, METRICS_FLUSH_SECONDS=5):
+            dead = Path(tmp, "metrics-999999-deadbeef.json")
+            dead.write_text(json.dumps({"counters": [["bloodbank_http_requests_total", [["view", "home"]], 5]],
+                                        "histograms": []}))
+            old = time.time() - 5 * metrics.STALE_FLUSHES - 1
+            os.utime(dead, (old, old))
+            self.assertEqual(metrics.collect()["counters"], [])
+            self.assertFalse(dead.exists())
+
+    @unittest.skipUnless(hasattr(os, "fork"), "needs os.fork")
+    def test_forked_child_starts_from_zero(self):
+        metrics.inc("bloodbank_http_requests_total", view="home")
+        parent_file = metrics.worker_file(Path("."))
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                empty = metrics.snapshot() == {"counters": [], "histograms": []}
+                code = 0 if empty and metrics.worker_file(Path(".")) != parent_file else 2
+            finally:
+                os._exit(code)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+        self.assertEqual(len(metrics.snapshot()["counters"]), 1)
+
+
+@override_settings(PORTAL_PASSWORD=PORTAL_PASSWORD)
+class ProfilingTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = self.settings(PROFILES_DIR=Path(tmp.name), PROFILES_KEEP=2)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+
+    def portal_get(self, name, **kwargs):
+        grant_portal(self.client)
+        return self.client.get(reverse(name), **kwargs)
+
+    def test_profiles_portal_request(self):
+        resp = self.portal_get("inventory", query_params={"_profile": "1"})
+        self.assertEqual(resp.status_code, 200)
+        name = resp["X-Profile-Id"]
+        summary = json.loads(profiling.profile_file(name, "json").read_text())
+        self.assertEqual(summary["view"], "inventory")
+        self.assertEqual(summary["queries"], len(summary["sql"]))
+        self.assertGreater(summary["queries"], 0)
+        self.assertTrue(summary["top_allocations"])
+        pstats.Stats(str(profiling.profile_file(name, "prof")))  # loads as a pstats dump
+
+        listing = self.portal_get("profiles")
+        self.assertContains(listing, "/inventory/?_profile=1")
+        link = re.search(r'href="(/portal/profiles/[^"]+\.prof)"', listing.content.decode()).group(1)
+        download = self.client.get(link)
+        self.assertEqual(download.status_code, 200)
+        self.assertIn(f'filename="{name}.prof"', download["Content-Disposition"])
+
+    def test_needs_portal_pass_and_keeps_latest(self):
+        resp = self.client.get(reverse("records"), headers={"X-Profile": "1"})
+        self.assertNotIn("X-Profile-Id", resp)
+        for _ in range(3):
+            self.assertIn("X-Profile-Id", self.portal_get("records", headers={"X-Profile": "1"}))
+        self.assertEqual(len(profiling.recent_profiles()), 2)
+
+    async def test_profiles_sync_views_under_asgi_and_skips_async_ones(self):
+        await sync_to_async(grant_portal)(self.async_client)
+        resp = await self.async_client.get(reverse("records"), headers={"X-Profile": "1"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("X-Profile-Id", resp)
+        await sync_to_async(grant_portal)(self.async_client)
+        resp = await self.async_client.get(reverse("records_async"), headers={"X-Profile": "1"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotIn("X-Profile-Id", resp)
+
+    @override_settings(DEBUG=True)
+    def test_middleware_chain_stays_async(self):
+        with self.assertNoLogs("django.request", "DEBUG"):  # "Asynchronous handler adapted for ..."
+            BaseHandler().load_middleware(is_async=True)
+
+    def test_rejects_bad_links(self):
+        self.assertEqual(self.client.get(reverse("profile_download", args=["forged:x:y", "prof"])).status_code, 302)
+        token = signing.TimestampSigner(salt="blood.profiles").sign("..settings")
+        self.assertEqual(self.client.get(reverse("profile_download", args=[token, "prof"])).status_code, 404)
+
+
+class QueuedLoggingTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = Path(tmp.name) / "app-{pid}.log"
+
+    def make_logger(self, handler):
+        handler.setFormatter(JsonFormatter())
+        logger = logging.getLogger(f"blood.tests.queue.{id(handler)}")
+        logger.propagate = False
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        self.addCleanup(handler.close)
+        return logger
+
+    def test_close_drains_queue_as_json_lines(self):
+        handler = QueuedRotatingFileHandler(self.path)
+        logger = self.make_logger(handler)
+        for i in range(500):
+            logger.warning("line %s", i)
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            logger.exception("boom")
+        handler.close()
+
+        lines = [json.loads(x) for x in Path(handler.filename).read_text(encoding="utf-8").splitlines()]
+        self.assertEqual(len(lines), 501)
+        self.assertEqual(lines[0]["message"], "line 0")
+        self.assertIn("ZeroDivisionError", lines[-1]["exc"])
+        self.assertIn(str(os.getpid()), handler.filename)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "needs os.fork")
+    def test_forked_child_gets_its_own_file_and_closed_handlers_stay_closed(self):
+        handler = QueuedRotatingFileHandler(self.path)
+        closed = QueuedRotatingFileHandler(self.path.parent / "closed-{pid}.log")
+        closed.close()
+        logger = self.make_logger(handler)
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                logger.warning("from child")
+                handler.close()
+                code = 0 if closed.listener is None else 2
+            finally:
+                os._exit(code)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+        child_file = Path(str(self.path).format(pid=pid))
+        self.assertIn("from child", child_file.read_text(encoding="utf-8"))
+        self.assertNotEqual(str(child_file), handler.filename)
+        self.assertFalse(Path(handler.filename).exists())  # nothing logged by the parent
+
+    def test_rotates(self):
+        handler = QueuedRotatingFileHandler(self.path, max_bytes=2000, backup_count=2)
+        logger = self.make_logger(handler)
+        for i in range(200):
+            logger.warning("rotate %s", i)
+        handler.flush()
+        self.assertTrue(Path(handler.filename + ".1").exists())
+        self.assertFalse(Path(handler.filename + ".3").exists())
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        handler = QueuedRotatingFileHandler(self.path, queue_size=1)
+        handler.listener.stop()  # nothing drains the queue now
+        logger = self.make_logger(handler)
+        for i in range(10):
+            logger.warning("drop %s", i)
+        self.assertEqual(handler.dropped, 9)
+
+
+@unittest.skipUnless(connection.vendor == "sqlite", "SQLite production profile")
+class SqlitePragmaTests(SimpleTestCase):
+    def open_connection(self, **overrides):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        default = connections["default"]
+        conn = type(default)({**default.settings_dict, "NAME": str(Path(tmp.name) / "db.sqlite3")}, alias="pragma_test")
+        with self.settings(**overrides):
+            conn.ensure_connection()  # connection_created -> apply_sqlite_pragmas
+        self.addCleanup(conn.close)
+        return conn
+
+    def pragma(self, conn, name):
+        with conn.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    def test_production_profile_applies_the_configured_pragmas(self):
+        conn = self.open_connection(SQLITE_PRODUCTION=True)
+        pragmas = settings.SQLITE_PRAGMAS
+        self.assertEqual(self.pragma(conn, "journal_mode").upper(), pragmas["journal_mode"])
+        self.assertEqual(self.pragma(conn, "busy_timeout"), pragmas["busy_timeout"])
+        levels = {"OFF": 0, "NORMAL": 1, "FULL": 2, "EXTRA": 3}
+        self.assertEqual(self.pragma(conn, "synchronous"), levels[pragmas["synchronous"]])
+
+    def test_default_profile_leaves_sqlite_defaults(self):
+        conn = self.open_connection(SQLITE_PRODUCTION=False)
+        self.assertNotEqual(self.pragma(conn, "journal_mode").upper(), "WAL")
+
+
+@override_settings(DATABASE_REPLICAS=["replica1"])
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def _reporting_view(self, request):
+        seen = {}
+
+        @replica_reads
+        def view(request):
+            seen["unit"] = self.router.db_for_read(DonationUnit)
+            seen["session"] = self.router.db_for_read(Session)
+            return HttpResponse()
+
+        view(request)
+        return seen
+
+    def test_reads_stay_on_primary_outside_reporting_views(self):
+        self.assertIsNone(self.router.db_for_read(DonationUnit))
+        self.assertEqual(self.router.db_for_write(DonationUnit), "default")
+
+    def test_reporting_view_reads_blood_models_from_replica(self):
+        seen = self._reporting_view(self.factory.get("/records/"))
+        self.assertEqual(seen, {"unit": "replica1", "session": None})
+        self.assertIsNone(self.router.db_for_read(DonationUnit))
+
+    def test_recent_writer_stays_on_primary(self):
+        request = self.factory.get("/records/")
+        request.COOKIES[PIN_COOKIE] = "1"
+        self.assertEqual(self._reporting_view(request), {"unit": None, "session": None})
+
+    def test_blood_writes_set_the_pin_cookie(self):
+        def writes(model):
+            def view(request):
+                self.router.db_for_write(model)
+                return HttpResponse()
+            return PrimaryPinMiddleware(view)
+
+        self.assertIn(PIN_COOKIE, writes(DonationUnit)(self.factory.post("/intake/")).cookies)
+        # sessions and the audit log (portal login / logout) do not pin
+        self.assertNotIn(PIN_COOKIE, writes(Session)(self.factory.post("/login/")).cookies)
+        self.assertNotIn(PIN_COOKIE, writes(AuditEvent)(self.factory.post("/portal/login/")).cookies)
+        self.assertNotIn(PIN_COOKIE, PrimaryPinMiddleware(lambda r: HttpResponse())(self.factory.get("/records/")).cookies)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas_no_routing(self):
+        self.assertEqual(self._reporting_view(self.factory.get("/records/")), {"unit": None, "session": None})
+
+
+@override_settings(DATABASE_REPLICAS=["replica1"], PORTAL_PASSWORD=PORTAL_PASSWORD, CACHES=DUMMY_CACHE)
+class ReplicaFlowTests(TestCase):
+    def test_portal_login_then_records_reads_from_replica(self):
+        resp = self.client.post(reverse("portal_login"), {"password": PORTAL_PASSWORD})
+        self.assertEqual(resp.status_code, 302)
+        self.assertNotIn(PIN_COOKIE, resp.cookies)
+        # the test database has no replica1 connection: record the choice, then read from "default"
+        chosen = []
+        with mock.patch("blood.routers.random.choice", side_effect=lambda aliases: chosen.append(aliases[0])):
+            self.assertEqual(self.client.get(resp["Location"]).status_code, 200)
+        self.assertIn("replica1", chosen)
+
+    def test_intake_pins_to_primary(self):
+        donor_user, _ = ensure_bench_users()
+        self.client.force_login(donor_user)
+        self.assertIn(PIN_COOKIE, self.client.post(reverse("intake"), {}).cookies)
+
+    async def test_intake_pins_to_primary_under_asgi(self):
+        donor_user, _ = await sync_to_async(ensure_bench_users)()
+        await self.async_client.aforce_login(donor_user)
+        resp = await self.async_client.post(reverse("intake"), {})
+        self.assertEqual(resp.status_code, 302)
+        self.assertIn(PIN_COOKIE, resp.cookies)
+
+    @override_settings(MIDDLEWARE=[m for m in settings.MIDDLEWARE if m != "blood.middleware.ProfilingMiddleware"],
+                       DEBUG=True)
+    def test_pin_middleware_keeps_the_chain_async(self):
+        with self.assertNoLogs("django.request", "DEBUG"):  # "Asynchronous handler adapted for ..."
+            BaseHandler().load_middleware(is_async=True)
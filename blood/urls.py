@@ -12,6 +12,7 @@ urlpatterns = [
 
     # donor / requester
     path("intake/", views.intake, name="intake"),
+    path("intake/batch/", views.intake_batch, name="intake_batch"),
     path("dispense/", views.dispense, name="dispense"),
     path("profile/", views.profile, name="profile"),
 
@@ -21,12 +22,26 @@ urlpatterns = [
 
     # manager pages
     path("records/", views.records, name="records"),
+    path("records/async/", views.records_async, name="records_async"),
     path("records/export/", views.donations_export, name="donations_export"),
     path("records/dispensed/export/", views.dispensed_export, name="dispensed_export"),
 
     path("inventory/", views.inventory_dashboard, name="inventory"),
+    path("inventory/async/", views.inventory_dashboard_async, name="inventory_async"),
     path("requests/<int:pk>/approve/", views.request_approve, name="request_approve"),
     path("requests/<int:pk>/reject/", views.request_reject, name="request_reject"),
+    path("requests/<int:pk>/units/", views.request_units, name="request_units"),
 
     path("donations/<int:pk>/delete/", views.donation_delete, name="donation_delete"),
+    path("donations/<int:pk>/label/", views.unit_label, name="unit_label"),
+    path("units/scan/", views.units_scan, name="units_scan"),
+    path("portal/recall/", views.recall, name="recall"),
+    path("portal/recall/apply/", views.recall_apply, name="recall_apply"),
+
+    path("metrics/", views.metrics_view, name="metrics"),
+    path("portal/profiles/", views.profiles, name="profiles"),
+    path("portal/analytics/", views.analytics, name="analytics"),
+    path("portal/sites/", views.site_stock, name="site_stock"),
+    path("portal/eligible/", views.eligible_donors, name="eligible_donors"),
+    path("portal/profiles/<str:token>.<str:ext>", views.profile_download, name="profile_download"),
 ]
@@ -1,31 +1,49 @@
 # blood/views.py
 from urllib.parse import urlencode
 from datetime import timedelta
+import asyncio
 import csv
+import hmac
 import io
+import json
+import time
 from functools import wraps
 
+from asgiref.sync import iscoroutinefunction, sync_to_async
+
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import login as auth_login, logout as auth_logout
 from django.contrib.auth.decorators import login_required
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
 from django.core.paginator import Paginator
-from django.db import transaction
-from django.db.models import Count, Q
-from django.http import HttpResponse
+from django.db import close_old_connections, transaction
+from django.db.models import Avg, Count, FloatField, Max, ProtectedError, Q, Sum
+from django.db.models.fields.json import KT
+from django.db.models.functions import Cast, Trunc
+from django.core.signing import BadSignature, TimestampSigner
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.functional import SimpleLazyObject
+from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth import update_session_auth_hash
 from django.contrib.auth.forms import PasswordChangeForm
 from .forms import ProfileUpdateForm
 
-from .forms import DonationForm, DispenseForm, SignupForm, LoginForm
+from .forms import DonationForm, DispenseForm, SignupForm, LoginForm, DonationRecordForm
 from .models import (
-    DonationUnit, DispenseLog, BLOOD_TYPES,
-    DispenseRequest, Profile, AuditEvent, Donor
+    DonationUnit, DispenseLine, DispenseLog, Fulfilment, BLOOD_TYPES,
+    DispenseRequest, Profile, AuditEvent, Donor, Site, TransferRoute
 )
-from .compat import plan_dispense
+from .compat import merge_site_plan
+from .bulk import create_donations, dispense_lines, quarantine_units, resolve_donors
+from .routers import replica_reads
+from . import cache as dashboard_cache
+from . import din, eligibility, forecast, metrics, profiling, rollups, sites
 
 # ========= Admin display for portal events =========
 ADMIN_DISPLAY_NAME = "MORAD"
@@ -40,6 +58,14 @@ def _urgent_pending_count():
     ).count()
 
 
+def _parse_day(value):
+    """YYYY-MM-DD from a query/form value; None when empty, malformed or impossible (2024-02-30)."""
+    try:
+        return parse_date((value or "").strip())
+    except ValueError:  # well-formed but not a calendar date
+        return None
+
+
 def _get_role(request):
     if request.user.is_authenticated and hasattr(request.user, "profile"):
         return request.user.profile.role
@@ -52,19 +78,16 @@ def _ensure_session_key(request):
     return request.session.session_key
 
 
-def log_event(request, action, role=None, user_display=None, **details):
+def _build_event(request, action, role=None, user_display=None, **details):
     """
-    Create AuditEvent.
-    role – override role shown on the row (default: current user's role).
-    user_display – override display name (e.g., MORAD on portal logins).
-    details – extra dict persisted.
+    Build an unsaved AuditEvent (shared by log_event and bulk writers).
     """
     role_val = role if role is not None else _get_role(request)
     skey = _ensure_session_key(request)
     payload = details or {}
     if user_display:
         payload["display_user"] = user_display
-    AuditEvent.objects.create(
+    return AuditEvent(
         user=request.user if request.user.is_authenticated else None,
         role=role_val or "",
         session_key=skey or "",
@@ -73,6 +96,25 @@ def log_event(request, action, role=None, user_display=None, **details):
     )
 
 
+# sign-ins / sign-outs do not invalidate the dashboard audit blocks: every dashboard
+# view starts with a PORTAL_LOGIN (one-shot pass), so bumping on it would mean the
+# blocks are never served from cache. They show up once the block expires or a
+# data change bumps it.
+QUIET_EVENTS = {"PORTAL_LOGIN", "PORTAL_LOGOUT", "login", "logout"}
+
+
+def log_event(request, action, role=None, user_display=None, **details):
+    """
+    Create AuditEvent.
+    role – override role shown on the row (default: current user's role).
+    user_display – override display name (e.g., MORAD on portal logins).
+    details – extra dict persisted.
+    """
+    _build_event(request, action, role=role, user_display=user_display, **details).save()
+    if action not in QUIET_EVENTS:
+        dashboard_cache.bump_on_commit("audit")
+
+
 # ------------------------ role guards ------------------------
 def role_required(expected_role):
     def decorator(view_func):
@@ -90,6 +132,15 @@ def role_required(expected_role):
 
 # ------------------------ manager portal (password per page) ------------------------
 def portal_protected(view_func):
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def _async_wrapped(request, *args, **kwargs):
+            if await request.session.apop("portal_once_ok", False):
+                return await view_func(request, *args, **kwargs)
+            await request.session.aset("portal_next", request.get_full_path())
+            return redirect("portal_login")
+        return _async_wrapped
+
     @wraps(view_func)
     def _wrapped(request, *args, **kwargs):
         # one-time access for this request only
@@ -215,10 +266,12 @@ def intake(request):
             "national_id": initial["national_id"],
             "full_name": initial["full_name"],
             "blood_type": initial["blood_type"],
+            "site": request.POST.get("site", ""),  # where the donor gives blood: not from the profile
         }
         form = DonationForm(post_data)
         if form.is_valid():
             donation = form.save()
+            dashboard_cache.bump("inventory")
             messages.success(request, "Donation saved successfully.")
             log_event(
                 request,
@@ -227,6 +280,8 @@ def intake(request):
                 donor=donation.donor.full_name,
             )
             return redirect("home")
+        elif form.has_error("__all__", "ineligible"):
+            messages.error(request, " ".join(form.non_field_errors()))
         else:
             messages.error(request, "Could not save donation. Please contact support.")
     else:
@@ -244,6 +299,220 @@ def intake(request):
     )
 
 
+# ------------------------ batch intake (blood drives) ------------------------
+@csrf_exempt
+def intake_batch(request):
+    """
+    JSON API for mobile blood drives.
+    POST {"portal_password": "...", "records": [{"national_id", "full_name", "blood_type"}, ...]}
+    Donors are resolved/upserted in bulk and all units + audit rows are written
+    with bulk_create. Every row gets its own validation result; donors who may
+    not donate yet (blood/eligibility.py) are refused with one IN query.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "POST required."}, status=405)
+    try:
+        payload = json.loads(request.body or b"{}")
+    except ValueError:
+        return JsonResponse({"error": "Invalid JSON."}, status=400)
+    if not isinstance(payload, dict):
+        return JsonResponse({"error": "Expected a JSON object."}, status=400)
+
+    pwd = str(payload.get("portal_password") or "").strip()
+    if pwd != (getattr(settings, "PORTAL_PASSWORD", "") or "change-me"):
+        return JsonResponse({"error": "Incorrect password."}, status=403)
+
+    records = payload.get("records")
+    max_rows = getattr(settings, "BATCH_INTAKE_MAX_ROWS", 1000)
+    if not isinstance(records, list) or not records:
+        return JsonResponse({"error": "records must be a non-empty list."}, status=400)
+    if len(records) > max_rows:
+        return JsonResponse({"error": f"Too many records (max {max_rows})."}, status=400)
+
+    results, valid = [], []
+    for i, rec in enumerate(records):
+        form = DonationRecordForm(rec if isinstance(rec, dict) else {})
+        if form.is_valid():
+            valid.append((i, form.cleaned_data))
+            results.append({"row": i, "ok": True})
+        else:
+            errors = {f: [e["message"] for e in errs] for f, errs in form.errors.get_json_data().items()}
+            results.append({"row": i, "ok": False, "errors": errors})
+
+    # donation interval / age: one IN query for the whole batch; a second row of
+    # the same donor in one batch is refused like a second visit
+    blocked = eligibility.ineligible([data["national_id"] for _, data in valid])
+    seen, accepted = set(), []
+    for i, data in valid:
+        nid = data["national_id"]
+        reason = blocked.get(nid) or ("Duplicate donor in this batch." if nid in seen else None)
+        if reason:
+            results[i] = {"row": i, "ok": False, "errors": {"national_id": [reason]}}
+        else:
+            seen.add(nid)
+            accepted.append((i, data))
+    valid = accepted
+
+    if valid:
+        with transaction.atomic():
+            units = create_donations([data for _, data in valid])
+            AuditEvent.objects.bulk_create([
+                _build_event(
+                    request,
+                    "donation_create",
+                    role=ADMIN_ROLE_LABEL,
+                    user_display=ADMIN_DISPLAY_NAME,
+                    blood_type=data["blood_type"],
+                    donor=data["full_name"],
+                    source="batch",
+                )
+                for _, data in valid
+            ])
+            dashboard_cache.bump_on_commit("inventory", "audit")
+        for (i, _), unit in zip(valid, units):
+            results[i]["id"] = unit.pk
+
+    return JsonResponse({
+        "created": len(valid),
+        "failed": len(records) - len(valid),
+        "results": results,
+    })
+
+
+# ------------------------ unit barcodes ------------------------
+SCAN_ACTIONS = {
+    "status": None,  # read only
+    "dispense": DonationUnit.Status.DISPENSED,
+    "quarantine": DonationUnit.Status.QUARANTINED,
+}
+
+
+@csrf_exempt
+def units_scan(request):
+    """
+    JSON API for barcode scanners.
+    POST {"portal_password": "...", "action": "status" | "dispense" | "quarantine",
+          "codes": ["=Z999926000123", ...], "hospital": "Name|City" (dispense, optional)}
+    All codes are resolved with one IN query on the unique donation number;
+    dispense / quarantine then move the AVAILABLE ones with one bulk UPDATE and
+    one audit event. Every code gets its own result, in input order.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "POST required."}, status=405)
+    try:
+        payload = json.loads(request.body or b"{}")
+    except ValueError:
+        return JsonResponse({"error": "Invalid JSON."}, status=400)
+    if not isinstance(payload, dict):
+        return JsonResponse({"error": "Expected a JSON object."}, status=400)
+
+    pwd = str(payload.get("portal_password") or "").strip()
+    if pwd != (getattr(settings, "PORTAL_PASSWORD", "") or "change-me"):
+        return JsonResponse({"error": "Incorrect password."}, status=403)
+
+    action = payload.get("action") or "status"
+    if action not in SCAN_ACTIONS:
+        return JsonResponse({"error": f"action must be one of {', '.join(SCAN_ACTIONS)}."}, status=400)
+    codes = payload.get("codes")
+    max_codes = getattr(settings, "SCAN_MAX_CODES", 1000)
+    if not isinstance(codes, list) or not codes:
+        return JsonResponse({"error": "codes must be a non-empty list."}, status=400)
+    if len(codes) > max_codes:
+        return JsonResponse({"error": f"Too many codes (max {max_codes})."}, status=400)
+
+    results, dins = [], []
+    for code in codes:
+        try:
+            dins.append(din.parse(code))
+            results.append({"code": code, "ok": True})
+        except ValueError as e:
+            dins.append(None)
+            results.append({"code": code, "ok": False, "error": str(e)})
+
+    now = timezone.now()
+    changed, by_type = set(), {}
+    with transaction.atomic():
+        qs = DonationUnit.objects.filter(din__in={d for d in dins if d})
+        if action != "status":
+            qs = qs.select_for_update()  # the units we report are the ones we update
+        units = {u["din"]: u for u in qs.values("id", "din", "blood_type", "status", "expiry_at")}
+        # an expired unit is never dispensed (it may still be quarantined)
+        expired = {
+            u["id"] for u in units.values()
+            if action == "dispense" and u["expiry_at"] is not None and u["expiry_at"] <= now
+        }
+        take = [u for u in units.values() if u["status"] == DonationUnit.Status.AVAILABLE and u["id"] not in expired]
+        if action != "status" and take:
+            by_type = _scan_apply(request, action, take, payload.get("hospital"), now)
+            changed = {u["id"] for u in take}
+
+    for result, unit_din in zip(results, dins):
+        if not result["ok"]:
+            continue
+        unit = units.get(unit_din)
+        if unit is None:
+            result.update(ok=False, error="unknown donation number")
+            continue
+        was_changed = unit["id"] in changed
+        result.update(
+            din=unit["din"], id=unit["id"], blood_type=unit["blood_type"], changed=was_changed,
+            status=SCAN_ACTIONS[action] if was_changed else unit["status"],
+            expiry_at=unit["expiry_at"].isoformat() if unit["expiry_at"] else None,
+        )
+        if unit["id"] in expired and unit["status"] == DonationUnit.Status.AVAILABLE:
+            result.update(ok=False, error="expired")
+
+    return JsonResponse({
+        "action": action,
+        "found": sum(1 for d in dins if d in units),
+        "changed": sum(by_type.values()),
+        "results": results,
+    })
+
+
+def _scan_apply(request, action, units, hospital, now):
+    """The bulk write of units_scan (inside its transaction). :return: {blood type: units}"""
+    ids = [u["id"] for u in units]
+    if action == "quarantine":
+        by_type = quarantine_units(unit_ids=ids)
+    else:
+        by_type = {}
+        for u in units:
+            by_type[u["blood_type"]] = by_type.get(u["blood_type"], 0) + 1
+        DonationUnit.objects.filter(id__in=ids, status=DonationUnit.Status.AVAILABLE).filter(
+            Q(expiry_at__isnull=True) | Q(expiry_at__gt=now)
+        ).update(status=DonationUnit.Status.DISPENSED, dispensed_at=now)
+        # one log per type keeps forecasts, rollups and analytics in step with scan dispensing
+        hospital_name, _, hospital_city = str(hospital or "").partition("|")
+        logs = DispenseLog.objects.bulk_create(
+            DispenseLog(requested_type=bt, quantity=n, dispensed_map={bt: n}, created_at=now)
+            for bt, n in by_type.items()
+        )
+        DispenseLine.objects.bulk_create(
+            line for log in logs
+            for line in dispense_lines(log, hospital_name=hospital_name.strip(), hospital_city=hospital_city.strip())
+        )
+    log_event(request, "units_scanned", scan_action=action, units=sum(by_type.values()), by_type=by_type,
+              role=ADMIN_ROLE_LABEL, user_display=ADMIN_DISPLAY_NAME)
+    dashboard_cache.bump_on_commit("inventory")
+    return by_type
+
+
+@portal_protected
+def unit_label(request, pk: int):
+    """Printable label of one unit: blood type, donation number with check character, barcode."""
+    unit = get_object_or_404(DonationUnit.objects.select_related("donor", "site"), pk=pk)
+    if not unit.din:
+        raise Http404("This unit has no donation number.")
+    return render(request, "blood/label.html", {
+        "unit": unit,
+        "din_display": din.format_din(unit.din),
+        "check": din.check_char(unit.din),
+        "show_portal_logout": True,
+        "user_role": _get_role(request),
+    })
+
+
 # ------------------------ requester only ------------------------
 @role_required(Profile.Role.REQUESTER)
 def dispense(request):
@@ -266,15 +535,10 @@ def dispense(request):
             else:
                 hospital_name, hospital_city = hospital_raw, ""
 
-            now = timezone.now()
-            counts_qs = (
-                DonationUnit.objects.filter(status=DonationUnit.Status.AVAILABLE)
-                .filter(Q(expiry_at__isnull=True) | Q(expiry_at__gt=now))
-                .values("blood_type")
-                .annotate(cnt=Count("id"))
-            )
-            inventory_counts = {row["blood_type"]: row["cnt"] for row in counts_qs}
-            plan, shortfall = plan_dispense(blood_type, qty, inventory_counts)
+            # home site of the hospital first, then other sites by transfer cost
+            home_id = sites.home_site_id(hospital_city)
+            site_plan, shortfall = sites.plan_request(blood_type, qty, home_id, timezone.now())
+            plan = merge_site_plan(site_plan)
 
             # insufficient stock => do not submit request
             if not plan or (shortfall and shortfall > 0):
@@ -317,7 +581,9 @@ def dispense(request):
                 plan=plan,
                 shortfall=0,
                 notes=notes,
+                site_id=home_id,
             )
+            dashboard_cache.bump("requests")
             log_event(
                 request,
                 "dispense_request_created",
@@ -345,19 +611,49 @@ def dispense(request):
 
 # ------------------------ manager (portal-protected) ------------------------
 @portal_protected
+@replica_reads
 def records(request):
     """
     Records page:
     A: intake donations
     B: dispensed units
     """
+    in_qs, out_qs, context = _records_querysets(request)
+    in_pager = Paginator(in_qs, 12)
+    in_page = request.GET.get("page")
+    donations = in_pager.get_page(in_page)
+
+    out_pager = Paginator(out_qs, 12)
+    out_page = request.GET.get("dpage")
+    dispensed = out_pager.get_page(out_page)
+
+    context.update({
+        "donations": donations,
+        "dispensed": dispensed,
+        "urgent_pending_count": _urgent_pending_count(),
+        "user_role": _get_role(request),
+    })
+    return render(request, "blood/records.html", context)
+
+
+def _records_querysets(request):
+    """:return: (donations qs, dispensed qs, filter/sort context) of the records page"""
     blood_type = request.GET.get("blood_type", "").strip()
     sort_key = request.GET.get("sort", "recent").strip()
+    code = request.GET.get("din", "").strip()  # scanned / typed donation number
+    unit_din = None
+    if code:
+        try:
+            unit_din = din.parse(code)
+        except ValueError:
+            unit_din = code.upper()  # finds nothing, like any unknown number
 
     # A – donations
     in_qs = DonationUnit.objects.select_related("donor")
     if blood_type:
         in_qs = in_qs.filter(blood_type=blood_type)
+    if unit_din:
+        in_qs = in_qs.filter(din=unit_din)
     sort_map_in = {
         "recent": "-donation_date",
         "oldest": "donation_date",
@@ -366,14 +662,13 @@ def records(request):
     }
     in_order = sort_map_in.get(sort_key, "-donation_date")
     in_qs = in_qs.order_by(in_order)
-    in_pager = Paginator(in_qs, 12)
-    in_page = request.GET.get("page")
-    donations = in_pager.get_page(in_page)
 
     # B – dispensed
-    out_qs = DonationUnit.objects.filter(status=DonationUnit.Status.DISPENSED).select_related("donor")
+    out_qs = DonationUnit.objects.filter(status=DonationUnit.Status.DISPENSED).select_related("donor", "fulfilment")
     if blood_type:
         out_qs = out_qs.filter(blood_type=blood_type)
+    if unit_din:
+        out_qs = out_qs.filter(din=unit_din)
     sort_map_out = {
         "recent": "-dispensed_at",
         "oldest": "dispensed_at",
@@ -382,30 +677,25 @@ def records(request):
     }
     out_order = sort_map_out.get(sort_key, "-dispensed_at")
     out_qs = out_qs.order_by(out_order)
-    out_pager = Paginator(out_qs, 12)
-    out_page = request.GET.get("dpage")
-    dispensed = out_pager.get_page(out_page)
 
     qp = {}
     if blood_type:
         qp["blood_type"] = blood_type
     if sort_key and sort_key != "recent":
         qp["sort"] = sort_key
+    if code:
+        qp["din"] = code
     qs_no_page = urlencode(qp)
 
-    context = {
+    return in_qs, out_qs, {
         "page_title": "Records",
-        "donations": donations,
-        "dispensed": dispensed,
         "blood_types": BLOOD_TYPES,
         "current_blood_type": blood_type,
+        "current_din": code,
         "current_sort": sort_key,
         "qs_no_page": qs_no_page,
         "show_portal_logout": True,
-        "urgent_pending_count": _urgent_pending_count(),
-        "user_role": _get_role(request),
     }
-    return render(request, "blood/records.html", context)
 
 
 # ------------------------ exports ------------------------
@@ -474,6 +764,7 @@ def _export_rows(filename_prefix, headers, rows, fmt):
 
 
 @portal_protected
+@replica_reads
 def donations_export(request):
     blood_type = request.GET.get("blood_type", "").strip()
     sort_key = request.GET.get("sort", "recent").strip()
@@ -501,12 +792,13 @@ def donations_export(request):
 
 
 @portal_protected
+@replica_reads
 def dispensed_export(request):
     blood_type = request.GET.get("blood_type", "").strip()
     sort_key = request.GET.get("sort", "recent").strip()
     fmt = request.GET.get("format", "csv")
 
-    qs = DonationUnit.objects.filter(status=DonationUnit.Status.DISPENSED).select_related("donor")
+    qs = DonationUnit.objects.filter(status=DonationUnit.Status.DISPENSED).select_related("donor", "fulfilment")
     if blood_type:
         qs = qs.filter(blood_type=blood_type)
 
@@ -519,12 +811,13 @@ def dispensed_export(request):
     order_by = sort_map.get(sort_key, "-dispensed_at")
     qs = qs.order_by(order_by)
 
-    headers = ["Donor name", "Blood type", "Dispensed at"]
+    headers = ["Donor name", "Blood type", "Dispensed at", "Hospital"]
     rows = [
         [
             u.donor.full_name,
             u.blood_type,
             (u.dispensed_at or u.donation_date).strftime("%Y-%m-%d %H:%M"),
+            u.fulfilment.hospital_name if hasattr(u, "fulfilment") else "",
         ]
         for u in qs
     ]
@@ -532,73 +825,263 @@ def dispensed_export(request):
 
 
 @portal_protected
+@replica_reads
 def inventory_dashboard(request):
     """
     Inventory + pending requests + audit log.
     Also passes low_stock_threshold for the red line on the chart.
     """
-    now = timezone.now()
-    near_days = getattr(settings, "NEAR_EXPIRY_DAYS", 7)
-    near_cutoff = now + timedelta(days=near_days)
-    low_threshold = getattr(settings, "LOW_STOCK_THRESHOLD", 500)
+    return render(request, "blood/inventory_dashboard.html", _inventory_context(request))
 
+
+def _inventory_querysets(now, near_cutoff):
+    """:return: (available, near expiry, all donated) querysets of the dashboard counters"""
     base_qs = (
         DonationUnit.objects.filter(status=DonationUnit.Status.AVAILABLE)
         .filter(Q(expiry_at__isnull=True) | Q(expiry_at__gt=now))
     )
+    return (
+        base_qs,
+        base_qs.filter(expiry_at__isnull=False, expiry_at__lte=near_cutoff),
+        DonationUnit.objects.all(),
+    )
 
-    # available by type
-    available_counts = {bt: 0 for bt, _ in BLOOD_TYPES}
-    for row in base_qs.values("blood_type").annotate(cnt=Count("id")):
-        available_counts[row["blood_type"]] = row["cnt"]
-
-    # near expiry
-    near_counts = {bt: 0 for bt, _ in BLOOD_TYPES}
-    for row in (
-        base_qs.filter(expiry_at__isnull=False, expiry_at__lte=near_cutoff)
-        .values("blood_type")
-        .annotate(cnt=Count("id"))
-    ):
-        near_counts[row["blood_type"]] = row["cnt"]
-
-    # total donated historically
-    donated_totals = {bt: 0 for bt, _ in BLOOD_TYPES}
-    for row in DonationUnit.objects.values("blood_type").annotate(cnt=Count("id")):
-        donated_totals[row["blood_type"]] = row["cnt"]
 
+def _counts_by_type(qs):
+    counts = {bt: 0 for bt, _ in BLOOD_TYPES}
+    for row in qs.values("blood_type").annotate(cnt=Count("id")):
+        counts[row["blood_type"]] = row["cnt"]
+    return counts
+
+
+def _inventory_summary(available_counts, near_counts, donated_totals):
     labels = [bt for bt, _ in BLOOD_TYPES]
-    values = [available_counts[bt] for bt in labels]
-    near_values = [near_counts[bt] for bt in labels]
-    rows = [
-        {"bt": bt, "donated": donated_totals[bt], "available": available_counts[bt], "near": near_counts[bt]}
-        for bt in labels
-    ]
+    return {
+        "labels": labels,
+        "values": [available_counts[bt] for bt in labels],
+        "near_values": [near_counts[bt] for bt in labels],
+        "rows": [
+            {"bt": bt, "donated": donated_totals[bt], "available": available_counts[bt], "near": near_counts[bt]}
+            for bt in labels
+        ],
+    }
+
+
+def _lazy_inventory(now, near_cutoff):
+    return SimpleLazyObject(
+        lambda: _inventory_summary(*map(_counts_by_type, _inventory_querysets(now, near_cutoff)))
+    )
+
+
+def _pending_requests(cache_versions):
+    return dashboard_cache.get_or_compute(
+        "requests", cache_versions["requests"], "pending",
+        lambda: list(
+            DispenseRequest.objects.filter(status=DispenseRequest.Status.PENDING).order_by("-urgency", "created_at")
+        ),
+    )
 
-    # pending requests
-    pending = DispenseRequest.objects.filter(status=DispenseRequest.Status.PENDING).order_by(
-        "-urgency", "created_at"
+
+def _audit_queryset():
+    return AuditEvent.objects.select_related("user").order_by("-created_at")
+
+
+def _dispense_health(now):
+    """
+    Dispensing over the last 24h, from the details logged by request_approve:
+    approved / failed counts, lock wait and transaction duration (avg / max),
+    rows skipped because they were locked. One aggregate query.
+    """
+    lock_ms = Cast(KT("details__lock_ms"), FloatField())
+    txn_ms = Cast(KT("details__txn_ms"), FloatField())
+    ok = Q(action="request_approved")
+    row = AuditEvent.objects.filter(
+        action__in=("request_approved", "request_approve_failed"),
+        created_at__gte=now - timedelta(hours=24),
+    ).aggregate(
+        approved=Count("id", filter=ok),
+        failed=Count("id", filter=~ok),
+        lock_avg=Avg(lock_ms),
+        lock_max=Max(lock_ms),
+        txn_avg=Avg(txn_ms),
+        txn_max=Max(txn_ms),
+        rows_skipped=Sum(Cast(KT("details__rows_skipped"), FloatField())),
     )
+    total = row["approved"] + row["failed"]
+    row["total"] = total
+    row["rows_skipped"] = int(row["rows_skipped"] or 0)
+    row["failure_rate"] = round(100 * row["failed"] / total, 1) if total else 0.0
+    row["warn"] = row["failure_rate"] >= getattr(settings, "DISPENSE_FAILURE_WARN_PERCENT", 5) and row["failed"] > 0
+    return row
+
+
+def _inventory_context(request):
+    """
+    Context of the dashboard. The inventory counts and the audit page are lazy:
+    they only hit the DB when their {% cache %} fragment is missing.
+    Pending requests are cached as data (their forms carry a per-user CSRF token).
+    """
+    now = timezone.now()
+    near_days = getattr(settings, "NEAR_EXPIRY_DAYS", 7)
+    near_cutoff = now + timedelta(days=near_days)
+    low_threshold = getattr(settings, "LOW_STOCK_THRESHOLD", 500)
+    trend_days = getattr(settings, "INVENTORY_TREND_DAYS", 30)
+    cache_versions = dashboard_cache.versions()
+
+    inventory = _lazy_inventory(now, near_cutoff)
+
+    pending = _pending_requests(cache_versions)
 
     # audit events table
-    events_qs = AuditEvent.objects.select_related("user").order_by("-created_at")
-    events_pager = Paginator(events_qs, 25)
-    epage = request.GET.get("epage")
-    events = events_pager.get_page(epage)
+    events_pager = Paginator(_audit_queryset(), 25)
+    epage = request.GET.get("epage") or "1"
+    events = SimpleLazyObject(lambda: events_pager.get_page(epage))
 
-    context = {
+    return {
         "near_days": near_days,
-        "labels": labels,
-        "values": values,
-        "near_values": near_values,
-        "rows": rows,
+        "inventory": inventory,
         "show_portal_logout": True,
-        "urgent_pending_count": _urgent_pending_count(),
+        "urgent_pending_count": sum(r.urgency == DispenseRequest.Urgency.URGENT for r in pending),
         "pending_requests": pending,
         "events": events,
+        "events_page": epage,
+        "dispense_health": SimpleLazyObject(lambda: _dispense_health(now)),
+        "trend": SimpleLazyObject(lambda: rollups.trend(trend_days)),
+        "trend_days": trend_days,
+        "forecast": SimpleLazyObject(forecast.latest),
         "user_role": _get_role(request),
         "low_stock_threshold": low_threshold,
+        "cache_versions": cache_versions,
+        "cache_seconds": dashboard_cache.cache_seconds(),
+    }
+
+
+# ------------------------ async (ASGI) variants ------------------------
+def _db(fn, *args):
+    """
+    Run one blocking ORM call from an async view.
+    With ASYNC_PARALLEL_QUERIES each call gets its own worker thread (and DB
+    connection), so independent queries overlap; otherwise they run one after
+    another on the request's thread, like Django's own async ORM methods.
+    """
+    if not getattr(settings, "ASYNC_PARALLEL_QUERIES", True):
+        return sync_to_async(fn)(*args)
+
+    def run():
+        try:
+            return fn(*args)
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)()
+
+
+async def _page_concurrently(pagers_and_numbers):
+    """
+    Paginate several querysets with 2 concurrent round trips instead of
+    2 sequential ones per table: all COUNTs first, then all page slices.
+    """
+    counts = await asyncio.gather(*(_db(pager.object_list.count) for pager, _ in pagers_and_numbers))
+    pages = []
+    for (pager, number), count in zip(pagers_and_numbers, counts):
+        pager.count = count  # skip Paginator's own COUNT
+        pages.append(pager.get_page(number))
+    rows = await asyncio.gather(*(_db(list, page.object_list) for page in pages))
+    for page, objects in zip(pages, rows):
+        page.object_list = objects
+    return pages
+
+
+@portal_protected
+@replica_reads
+async def records_async(request):
+    """Records page for ASGI: both tables are counted and fetched concurrently."""
+    in_qs, out_qs, context = _records_querysets(request)
+    (donations, dispensed), urgent = await asyncio.gather(
+        _page_concurrently([
+            (Paginator(in_qs, 12), request.GET.get("page")),
+            (Paginator(out_qs, 12), request.GET.get("dpage")),
+        ]),
+        _db(_urgent_pending_count),
+    )
+    context.update({"donations": donations, "dispensed": dispensed, "urgent_pending_count": urgent})
+    return await sync_to_async(render)(request, "blood/records.html", context)
+
+
+@portal_protected
+@replica_reads
+async def inventory_dashboard_async(request):
+    """
+    Dashboard for ASGI: the three inventory counters, the pending requests and
+    the audit page run concurrently — only for the fragments that are not cached.
+    """
+    now = timezone.now()
+    near_days = getattr(settings, "NEAR_EXPIRY_DAYS", 7)
+    near_cutoff = now + timedelta(days=near_days)
+    trend_days = getattr(settings, "INVENTORY_TREND_DAYS", 30)
+    cache_versions = await sync_to_async(dashboard_cache.versions)()
+    epage = request.GET.get("epage") or "1"
+
+    fragment_keys = {
+        "inventory": [make_template_fragment_key(name, [cache_versions["inventory"]])
+                      for name in ("dashboard_inventory", "dashboard_chart")],
+        "audit": [make_template_fragment_key("dashboard_audit", [cache_versions["audit"], epage])],
+        "dispensing": [make_template_fragment_key("dashboard_dispensing", [cache_versions["audit"]])],
+        "trend": [make_template_fragment_key("dashboard_trend", [cache_versions["rollups"]])],
+        "forecast": [make_template_fragment_key("dashboard_forecast", [cache_versions["forecast"]])],
+    }
+    cached = await cache.aget_many([key for keys in fragment_keys.values() for key in keys])
+
+    # a fragment may still expire before render: then the lazy fallback queries (in render's thread)
+    async def inventory():
+        if all(key in cached for key in fragment_keys["inventory"]):
+            return _lazy_inventory(now, near_cutoff)
+        counts = await asyncio.gather(*(_db(_counts_by_type, qs) for qs in _inventory_querysets(now, near_cutoff)))
+        return _inventory_summary(*counts)
+
+    async def events():
+        if all(key in cached for key in fragment_keys["audit"]):
+            return SimpleLazyObject(lambda: Paginator(_audit_queryset(), 25).get_page(epage))
+        (page,) = await _page_concurrently([(Paginator(_audit_queryset(), 25), epage)])
+        return page
+
+    async def dispense_health():
+        if all(key in cached for key in fragment_keys["dispensing"]):
+            return SimpleLazyObject(lambda: _dispense_health(now))
+        return await _db(_dispense_health, now)
+
+    async def trend():
+        if all(key in cached for key in fragment_keys["trend"]):
+            return SimpleLazyObject(lambda: rollups.trend(trend_days))
+        return await _db(rollups.trend, trend_days)
+
+    async def latest_forecast():
+        if all(key in cached for key in fragment_keys["forecast"]):
+            return SimpleLazyObject(forecast.latest)
+        return await _db(forecast.latest)
+
+    inventory_summary, pending, events_page, health, trend_data, forecast_rows, role = await asyncio.gather(
+        inventory(), _db(_pending_requests, cache_versions), events(), dispense_health(), trend(),
+        latest_forecast(), _db(_get_role, request),
+    )
+
+    context = {
+        "near_days": near_days,
+        "inventory": inventory_summary,
+        "show_portal_logout": True,
+        "urgent_pending_count": sum(r.urgency == DispenseRequest.Urgency.URGENT for r in pending),
+        "pending_requests": pending,
+        "events": events_page,
+        "events_page": epage,
+        "dispense_health": health,
+        "trend": trend_data,
+        "trend_days": trend_days,
+        "forecast": forecast_rows,
+        "user_role": role,
+        "low_stock_threshold": getattr(settings, "LOW_STOCK_THRESHOLD", 500),
+        "cache_versions": cache_versions,
+        "cache_seconds": dashboard_cache.cache_seconds(),
     }
-    return render(request, "blood/inventory_dashboard.html", context)
+    return await sync_to_async(render)(request, "blood/inventory_dashboard.html", context)
 
 
 # ------------------------ manager actions ------------------------
@@ -613,13 +1096,90 @@ def donation_delete(request, pk: int):
 
     donation = get_object_or_404(DonationUnit, pk=pk)
     bt, dn = donation.blood_type, donation.donor.full_name
-    donation.delete()
+    next_url = request.POST.get("next") or reverse("records")
+    try:
+        donation.delete()
+    except ProtectedError:  # dispensed to a request: the Fulfilment row keeps it
+        messages.error(request, "This unit was dispensed to a request and cannot be deleted.")
+        return redirect(next_url)
+    dashboard_cache.bump("inventory")
     log_event(request, "donation_delete", blood_type=bt, donor=dn)
     messages.success(request, "Donation deleted permanently.")
-    next_url = request.POST.get("next") or reverse("records")
     return redirect(next_url)
 
 
+@portal_protected
+def recall(request):
+    """Recall form (donor and/or donation-date window) and the latest quarantined units."""
+    quarantined = (
+        DonationUnit.objects.filter(status=DonationUnit.Status.QUARANTINED)
+        .select_related("donor").order_by("-quarantined_at")[:50]
+    )
+    return render(request, "blood/recall.html", {
+        "quarantined": quarantined,
+        "show_portal_logout": True,
+        "user_role": _get_role(request),
+    })
+
+
+def recall_apply(request):
+    """
+    Quarantine every AVAILABLE unit of a donor and/or donated in a date window:
+    one bulk UPDATE and one summarized audit event, in one transaction.
+    """
+    if request.method != "POST":
+        return redirect("recall")
+    pwd = (request.POST.get("portal_password") or "").strip()
+    if pwd != (getattr(settings, "PORTAL_PASSWORD", "") or "change-me"):
+        messages.error(request, "Incorrect password — nothing was recalled.")
+        return redirect("recall")
+
+    national_id = (request.POST.get("national_id") or "").strip()
+    since = _parse_day(request.POST.get("since"))
+    until = _parse_day(request.POST.get("until"))
+    for field, day in (("since", since), ("until", until)):
+        if day is None and (request.POST.get(field) or "").strip():
+            messages.error(request, f"Invalid {field} date — nothing was recalled.")
+            return redirect("recall")
+    reason = (request.POST.get("reason") or "").strip()[:200]
+    if not (national_id or since or until):
+        messages.error(request, "Enter a donor national ID and/or a donation date range.")
+        return redirect("recall")
+
+    donor_id = None
+    if national_id:
+        donor_id = resolve_donors([national_id]).get(national_id)
+        if donor_id is None:
+            messages.error(request, f"No donor with national ID {national_id}.")
+            return redirect("recall")
+
+    with transaction.atomic():
+        by_type = quarantine_units(
+            donor_id=donor_id,
+            since=rollups.day_bounds(since)[0] if since else None,
+            until=rollups.day_bounds(until)[1] if until else None,  # the whole last day
+        )
+        units = sum(by_type.values())
+        if units:
+            log_event(
+                request,
+                "units_recalled",
+                national_id=national_id,
+                since=since.isoformat() if since else "",
+                until=until.isoformat() if until else "",
+                reason=reason,
+                units=units,
+                by_type=by_type,
+            )
+            dashboard_cache.bump_on_commit("inventory")
+
+    if units:
+        messages.success(request, f"{units} unit(s) quarantined.")
+    else:
+        messages.info(request, "No available units matched — nothing was recalled.")
+    return redirect("recall")
+
+
 def request_approve(request, pk: int):
     if request.method != "POST":
         return redirect("inventory")
@@ -635,54 +1195,127 @@ def request_approve(request, pk: int):
         return redirect("inventory")
 
     now = timezone.now()
-    counts_qs = (
-        DonationUnit.objects.filter(status=DonationUnit.Status.AVAILABLE)
-        .filter(Q(expiry_at__isnull=True) | Q(expiry_at__gt=now))
-        .values("blood_type")
-        .annotate(cnt=Count("id"))
-    )
-    inventory_counts = {row["blood_type"]: row["cnt"] for row in counts_qs}
-    plan, shortfall = plan_dispense(req.requested_type, req.quantity, inventory_counts)
+    site_plan, shortfall = sites.plan_request(req.requested_type, req.quantity, req.site_id, now)
+    plan = merge_site_plan(site_plan)
 
     if shortfall != 0 or not plan:
+        _record_dispense("insufficient")
         messages.error(request, "Not enough compatible inventory to fulfill this request right now.")
         req.plan = plan or {}
         req.shortfall = shortfall or 0
         req.save(update_fields=["plan", "shortfall"])
+        dashboard_cache.bump("requests")
         return redirect("inventory")
 
+    # instrumentation: time spent in the UPDATEs that wait for row locks (the request
+    # claim, the units), planned rows the skip_locked read did not get because another
+    # transaction holds or took them, transaction duration and outcome
+    lock_seconds, rows_skipped, outcome = 0.0, 0, "fulfilled"
+    unit_ids = []
+    txn_started = time.perf_counter()
     with transaction.atomic():
-        for dtype, take in plan.items():
+        # claim the request first: a second approval of the same request stops here
+        lock_started = time.perf_counter()
+        claimed = DispenseRequest.objects.filter(pk=req.pk, status=DispenseRequest.Status.PENDING).update(
+            status=DispenseRequest.Status.APPROVED
+        )
+        lock_seconds += time.perf_counter() - lock_started
+        steps = [(site, dtype, take) for site, types in site_plan.items() for dtype, take in types.items()]
+        for site, dtype, take in steps if claimed else ():
             units = (
-                DonationUnit.objects.select_for_update(skip_locked=True)
-                .filter(blood_type=dtype, status=DonationUnit.Status.AVAILABLE)
+                DonationUnit.objects.filter(blood_type=dtype, status=DonationUnit.Status.AVAILABLE,
+                                            **sites.site_filter(site))
                 .filter(Q(expiry_at__isnull=True) | Q(expiry_at__gt=now))
-                .order_by("expiry_at", "donation_date")[:take]
+                .order_by("expiry_at", "donation_date")
             )
-            ids = list(units.values_list("id", flat=True))
+            ids = list(units.select_for_update(skip_locked=True).values_list("id", flat=True)[:take])
+            rows_skipped += take - len(ids)
             if len(ids) != take:
-                messages.error(request, "Inventory changed; try again.")
-                return redirect("inventory")
+                outcome = "inventory_changed"
+                transaction.set_rollback(True)  # undo the types already marked DISPENSED
+                break
+            lock_started = time.perf_counter()
             DonationUnit.objects.filter(id__in=ids).update(
                 status=DonationUnit.Status.DISPENSED, dispensed_at=now
             )
+            lock_seconds += time.perf_counter() - lock_started
+            unit_ids += ids
+
+        if not claimed:
+            outcome = "already_processed"
+        elif outcome == "fulfilled":
+            Fulfilment.objects.bulk_create(
+                Fulfilment(unit_id=unit_id, request=req, hospital_name=req.hospital_name, dispensed_at=now)
+                for unit_id in unit_ids
+            )
+            log = DispenseLog.objects.create(
+                requested_type=req.requested_type, quantity=req.quantity, dispensed_map=plan
+            )
+            DispenseLine.objects.bulk_create(dispense_lines(
+                log, hospital_name=req.hospital_name, hospital_city=req.hospital_city, urgency=req.urgency,
+            ))
+            log_event(
+                request,
+                "request_approved",
+                req_id=req.id,
+                blood_type=req.requested_type,
+                qty=req.quantity,
+                **_dispense_details(lock_seconds, rows_skipped, time.perf_counter() - txn_started),
+            )
+            dashboard_cache.bump_on_commit("inventory", "requests")
+    txn_seconds = time.perf_counter() - txn_started
+    _record_dispense(outcome, lock_seconds, rows_skipped, txn_seconds)
 
-        DispenseLog.objects.create(
-            requested_type=req.requested_type, quantity=req.quantity, dispensed_map=plan
-        )
+    if outcome == "already_processed":
+        messages.info(request, "Request already processed.")
+        return redirect("inventory")
+    if outcome != "fulfilled":
         log_event(
             request,
-            "request_approved",
+            "request_approve_failed",
             req_id=req.id,
             blood_type=req.requested_type,
             qty=req.quantity,
+            outcome=outcome,
+            **_dispense_details(lock_seconds, rows_skipped, txn_seconds),
         )
-        req.delete()
+        messages.error(request, "Inventory changed; try again.")
+        return redirect("inventory")
 
     messages.success(request, "Request approved and fulfilled.")
     return redirect("inventory")
 
 
+def _dispense_details(lock_seconds, rows_skipped, txn_seconds):
+    return {
+        "lock_ms": round(lock_seconds * 1000, 3),
+        "rows_skipped": rows_skipped,
+        "txn_ms": round(txn_seconds * 1000, 3),
+    }
+
+
+def _record_dispense(outcome, lock_seconds=0.0, rows_skipped=0, txn_seconds=None):
+    metrics.inc("bloodbank_dispense_transactions_total", outcome=outcome)
+    if txn_seconds is None:
+        return  # never reached the transaction
+    metrics.observe("bloodbank_dispense_lock_seconds", lock_seconds)
+    metrics.observe("bloodbank_dispense_transaction_seconds", txn_seconds)
+    metrics.inc("bloodbank_dispense_rows_skipped_total", rows_skipped)
+
+
+@portal_protected
+def request_units(request, pk: int):
+    """Which units an approved request received (Fulfilment, indexed by request)."""
+    req = get_object_or_404(DispenseRequest, pk=pk)
+    fulfilments = Fulfilment.objects.filter(request=req).select_related("unit__donor").order_by("unit__blood_type")
+    return render(request, "blood/request_units.html", {
+        "req": req,
+        "fulfilments": fulfilments,
+        "show_portal_logout": True,
+        "user_role": _get_role(request),
+    })
+
+
 def request_reject(request, pk: int):
     if request.method != "POST":
         return redirect("inventory")
@@ -700,6 +1333,7 @@ def request_reject(request, pk: int):
         qty=req.quantity,
     )
     req.delete()
+    dashboard_cache.bump("requests")
     messages.success(request, "Request rejected and removed.")
     return redirect("inventory")
 
@@ -725,7 +1359,7 @@ def profile(request):
     if prof.role == Profile.Role.DONOR and prof.national_id:
         donor = Donor.objects.filter(national_id=prof.national_id).first()
         if donor:
-            donations = DonationUnit.objects.filter(donor=donor).order_by("-donation_date")
+            donations = DonationUnit.objects.filter(donor=donor).select_related("fulfilment").order_by("-donation_date")
 
     if request.method == "POST":
         if "save_profile" in request.POST:
@@ -752,3 +1386,164 @@ def profile(request):
         "donations": donations, "donor": donor,
         "user_role": prof.role,
     })
+
+
+# ------------------------ metrics ------------------------
+def metrics_view(request):
+    """
+    Prometheus text format for all workers (see blood/metrics.py).
+    Scrapers authenticate with "Authorization: Bearer <METRICS_TOKEN or PORTAL_PASSWORD>";
+    a browser can open it once through the portal like the other manager pages.
+    """
+    auth = request.headers.get("Authorization", "")
+    if not auth:
+        return portal_protected(_metrics_response)(request)
+    token = getattr(settings, "METRICS_TOKEN", "") or getattr(settings, "PORTAL_PASSWORD", "") or "change-me"
+    if not hmac.compare_digest(auth.encode(), f"Bearer {token}".encode()):
+        return HttpResponse("Unauthorized", status=401, content_type="text/plain")
+    return _metrics_response(request)
+
+
+def _metrics_response(request):
+    return HttpResponse(
+        metrics.render_prometheus(metrics.collect()),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+# ------------------------ profiling ------------------------
+PROFILE_LINK_MAX_AGE = 15 * 60  # seconds a download link from the profiles page stays valid
+_profile_signer = TimestampSigner(salt="blood.profiles")
+
+
+@portal_protected
+def profiles(request):
+    """Recent request profiles (see ProfilingMiddleware), with signed download links."""
+    rows = profiling.recent_profiles()
+    for row in rows:
+        row["token"] = _profile_signer.sign(row["name"])
+    return render(request, "blood/profiles.html", {
+        "profiles": rows,
+        "show_portal_logout": True,
+        "user_role": _get_role(request),
+    })
+
+
+ANALYTICS_PERIODS = ("day", "week", "month")
+
+
+@portal_protected
+@replica_reads
+def site_stock(request):
+    """Available units per site and blood type (one GROUP BY over the unit_site_stock index)."""
+    stock = sites.stock_by_site(timezone.now())
+    labels = [bt for bt, _ in BLOOD_TYPES]
+    rows = [
+        {"site": site, "counts": [stock.get(site.pk, {}).get(bt, 0) for bt in labels]}
+        for site in Site.objects.all()
+    ]
+    if None in stock:
+        rows.append({"site": None, "counts": [stock[None].get(bt, 0) for bt in labels]})
+    for row in rows:
+        row["total"] = sum(row["counts"])
+    return render(request, "blood/sites.html", {
+        "labels": labels,
+        "rows": rows,
+        "routes": TransferRoute.objects.select_related("from_site", "to_site").order_by("to_site__code", "cost"),
+        "show_portal_logout": True,
+        "user_role": _get_role(request),
+    })
+
+
+@portal_protected
+@replica_reads
+def eligible_donors(request):
+    """
+    Recall campaigns: donors who may donate now, per blood type, next to the
+    available stock (both GROUP BYs are index-only). ?blood_type=O-&format=csv
+    exports the call list of one type.
+    """
+    now = timezone.now()
+    blood_type = request.GET.get("blood_type", "").strip()
+    if blood_type in dict(BLOOD_TYPES):
+        rows = [
+            [nid, name, timezone.localtime(since).strftime("%Y-%m-%d") if since else ""]
+            for nid, name, since in eligibility.eligible_donors(blood_type, now)
+        ]
+        return _export_rows(f"eligible_{blood_type}", ["National ID", "Full name", "Eligible since"],
+                            rows, request.GET.get("format", "csv"))
+
+    counts = eligibility.eligible_counts(now)
+    available = dict(
+        DonationUnit.objects.filter(status=DonationUnit.Status.AVAILABLE)
+        .filter(Q(expiry_at__isnull=True) | Q(expiry_at__gt=now))
+        .values_list("blood_type").annotate(n=Count("id")).order_by()
+    )
+    low = getattr(settings, "LOW_STOCK_THRESHOLD", 500)
+    return render(request, "blood/eligible.html", {
+        "rows": [
+            {"blood_type": bt, "eligible": counts[bt], "available": available.get(bt, 0),
+             "low": available.get(bt, 0) < low}
+            for bt, _ in BLOOD_TYPES
+        ],
+        "low_stock_threshold": low,
+        "interval_days": eligibility.interval().days,
+        "age_limits": eligibility.age_limits(),
+        "show_portal_logout": True,
+        "user_role": _get_role(request),
+    })
+
+
+@portal_protected
+@replica_reads
+def analytics(request):
+    """
+    Hospital demand analytics over DispenseLine: GROUP BY hospital / city /
+    requested type / supplied type / period, inside a date range (index-backed:
+    every report filters created_at and groups one indexed column).
+    """
+    today = timezone.localdate()
+    until = _parse_day(request.GET.get("until")) or today
+    since = _parse_day(request.GET.get("since")) or until - timedelta(days=29)
+    if since > until:
+        since, until = until, since
+    period = request.GET.get("period") if request.GET.get("period") in ANALYTICS_PERIODS else "day"
+
+    start, end = rollups.day_bounds(since)[0], rollups.day_bounds(until)[1]
+    lines = DispenseLine.objects.filter(created_at__gte=start, created_at__lt=end)
+    measures = {"units": Sum("quantity"), "requests": Count("log", distinct=True)}
+
+    def report(*fields, limit=None):
+        qs = lines.values(*fields).annotate(**measures).order_by("-units", *fields)
+        return list(qs[:limit] if limit else qs)
+
+    return render(request, "blood/analytics.html", {
+        "since": since,
+        "until": until,
+        "period": period,
+        "periods": ANALYTICS_PERIODS,
+        "totals": lines.aggregate(**measures),
+        "by_hospital": report("hospital_name", "hospital_city", limit=25),
+        "by_city": report("hospital_city"),
+        "by_requested": report("requested_type"),
+        "by_supplied": report("supplied_type"),
+        "by_period": list(
+            lines.annotate(period=Trunc("created_at", period)).values("period")
+            .annotate(**measures).order_by("period")
+        ),
+        "show_portal_logout": True,
+        "user_role": _get_role(request),
+    })
+
+
+def profile_download(request, token: str, ext: str):
+    try:
+        name = _profile_signer.unsign(token, max_age=PROFILE_LINK_MAX_AGE)
+    except BadSignature:
+        messages.error(request, "Download link expired — open the profiles page again.")
+        return redirect("portal_login")
+    path = profiling.profile_file(name, ext)
+    if path is None:
+        raise Http404("Profile not found.")
+    content_type = "application/json" if ext == "json" else "application/octet-stream"
+    return FileResponse(path.open("rb"), as_attachment=True, filename=path.name, content_type=content_type)
@@ -0,0 +1,35 @@
+# deploy/gunicorn.conf.py
+"""
+Gunicorn config for the ASGI app (bloodbank.asgi) on uvicorn workers:
+
+    pip install -r deploy/requirements.txt
+    gunicorn -c deploy/gunicorn.conf.py
+
+WSGI instead (for comparison, see bench_asgi):
+
+    GUNICORN_APP=bloodbank.wsgi:application GUNICORN_WORKER_CLASS=gthread gunicorn -c deploy/gunicorn.conf.py
+
+Database notes for ASGI:
+- Django opens one connection per thread. The async views run their queries in
+  worker threads (ASYNC_PARALLEL_QUERIES), so use DB_POOL=True on PostgreSQL
+  (or DB_CONN_MAX_AGE=0) instead of long-lived persistent connections.
+- SQLite: run with SQLITE_PRODUCTION=True (WAL) so the parallel readers do not block.
+"""
+import multiprocessing
+import os
+
+wsgi_app = os.environ.get("GUNICORN_APP", "bloodbank.asgi:application")
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "uvicorn_worker.UvicornWorker")
+bind = os.environ.get("GUNICORN_BIND", "127.0.0.1:8000")
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))  # gthread (WSGI) only
+
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+# recycle workers now and then (memory growth)
+max_requests = 2000
+max_requests_jitter = 200
+
+accesslog = "-"
+errorlog = "-"